@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Audio uplink codecs cho WebSocket stream (PCM S16_LE mono 16kHz vào, bytes ra).
+
+- pcm:   raw S16_LE, 32 KB/s (mặc định, tương thích server cũ)
+- mulaw: G.711 μ-law, 16 KB/s (numpy lookup table)
+- alaw:  G.711 A-law, 16 KB/s (numpy lookup table)
+- opus:  nếu có opuslib + libopus, ~2-4 KB/s
+
+Codec được báo cho server bằng message handshake {'type': 'audio_config', ...}
+trước khi gửi audio.
+"""
+
+import struct
+
+import numpy as np
+
+try:
+    import opuslib
+    OPUS_AVAILABLE = True
+except Exception:
+    OPUS_AVAILABLE = False
+
+
+class PcmCodec:
+    name = 'pcm'
+
+    def __init__(self, sample_rate: int = 16000, channels: int = 1):
+        self.sample_rate = sample_rate
+        self.channels = channels
+
+    def encode(self, pcm: bytes) -> bytes:
+        return pcm
+
+    def decode(self, data: bytes) -> bytes:
+        return data
+
+    def describe(self) -> dict:
+        """Nội dung handshake gửi server."""
+        return {
+            'type': 'audio_config',
+            'codec': self.name,
+            'sample_rate': self.sample_rate,
+            'channels': self.channels,
+            'sample_format': 'S16_LE',
+        }
+
+
+class _TableCodec(PcmCodec):
+    """G.711: encode/decode bằng bảng tra 65536 → uint8 và 256 → int16."""
+    _tables = {}
+
+    def __init__(self, sample_rate: int = 16000, channels: int = 1):
+        super().__init__(sample_rate, channels)
+        if self.name not in self._tables:
+            linear = np.arange(-32768, 32768, dtype=np.int32)
+            encode_table = self._encode_array(linear).astype(np.uint8)
+            # Sắp lại theo thứ tự uint16 để tra thẳng bằng mẫu đọc dạng '<u2'
+            encode_table = np.roll(encode_table, -32768)
+            decode_table = self._decode_array(np.arange(256, dtype=np.int32)).astype('<i2')
+            self._tables[self.name] = (encode_table, decode_table)
+        self.encode_table, self.decode_table = self._tables[self.name]
+
+    def encode(self, pcm: bytes) -> bytes:
+        samples = np.frombuffer(pcm, dtype='<u2')
+        return self.encode_table[samples].tobytes()
+
+    def decode(self, data: bytes) -> bytes:
+        return self.decode_table[np.frombuffer(data, dtype=np.uint8)].tobytes()
+
+
+class MuLawCodec(_TableCodec):
+    name = 'mulaw'
+    BIAS = 0x84
+    SEG_END = np.array([0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF, 0x1FFF])
+
+    @classmethod
+    def _encode_array(cls, x):
+        # Theo bản tham chiếu CCITT (14-bit), khớp audioop.lin2ulaw
+        pcm = x >> 2
+        mask = np.where(pcm < 0, 0x7F, 0xFF)
+        pcm = np.minimum(np.abs(pcm), 8159) + (cls.BIAS >> 2)
+        seg = np.searchsorted(cls.SEG_END, pcm)
+        uval = (np.minimum(seg, 7) << 4) | ((pcm >> (np.minimum(seg, 7) + 1)) & 0x0F)
+        uval = np.where(seg >= 8, 0x7F, uval)
+        return uval ^ mask
+
+    @classmethod
+    def _decode_array(cls, b):
+        b = ~b & 0xFF
+        exponent = (b >> 4) & 0x07
+        mag = (((b & 0x0F) << 3) + cls.BIAS << exponent) - cls.BIAS
+        return np.where(b & 0x80, -mag, mag)
+
+
+class ALawCodec(_TableCodec):
+    name = 'alaw'
+    SEG_END = np.array([0x1F, 0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF])
+
+    @classmethod
+    def _encode_array(cls, x):
+        pcm = x >> 3  # 13-bit
+        mask = np.where(pcm >= 0, 0xD5, 0x55)
+        pcm = np.where(pcm >= 0, pcm, -pcm - 1)
+        seg = np.searchsorted(cls.SEG_END, pcm)
+        shift = np.where(seg < 2, 1, seg)
+        aval = (np.minimum(seg, 7) << 4) | ((pcm >> shift) & 0x0F)
+        aval = np.where(seg >= 8, 0x7F, aval)
+        return aval ^ mask
+
+    @classmethod
+    def _decode_array(cls, a):
+        a = a ^ 0x55
+        seg = (a & 0x70) >> 4
+        t = (a & 0x0F) << 4
+        t = np.where(seg == 0, t + 8, t + 0x108)
+        t = np.where(seg > 1, t << np.maximum(seg - 1, 0), t)
+        return np.where(a & 0x80, t, -t)
+
+
+class OpusCodec(PcmCodec):
+    """
+    Opus VOIP 20ms. Mỗi message = chuỗi packet [len u16 LE][packet],
+    frame cuối được pad 0 cho đủ 20ms.
+    """
+    name = 'opus'
+    FRAME_MS = 20
+    BITRATE = 24000
+
+    def __init__(self, sample_rate: int = 16000, channels: int = 1):
+        super().__init__(sample_rate, channels)
+        self.frame_samples = sample_rate * self.FRAME_MS // 1000
+        self.frame_bytes = self.frame_samples * 2 * channels
+        self.encoder = opuslib.Encoder(sample_rate, channels, opuslib.APPLICATION_VOIP)
+        self.encoder.bitrate = self.BITRATE
+        self.decoder = opuslib.Decoder(sample_rate, channels)
+
+    def encode(self, pcm: bytes) -> bytes:
+        """pcm: bytes hoặc memoryview (segment trong ring của VADAudioStreamer)."""
+        out = bytearray()
+        for i in range(0, len(pcm), self.frame_bytes):
+            frame = bytes(pcm[i:i + self.frame_bytes])  # opuslib cần bytes (ctypes.cast không nhận memoryview)
+            if len(frame) < self.frame_bytes:
+                frame = frame + bytes(self.frame_bytes - len(frame))
+            packet = self.encoder.encode(frame, self.frame_samples)
+            out += struct.pack('<H', len(packet))
+            out += packet
+        return bytes(out)
+
+    def decode(self, data: bytes) -> bytes:
+        out = bytearray()
+        pos = 0
+        while pos + 2 <= len(data):
+            (size,) = struct.unpack_from('<H', data, pos)
+            pos += 2
+            out += self.decoder.decode(data[pos:pos + size], self.frame_samples)
+            pos += size
+        return bytes(out)
+
+    def describe(self) -> dict:
+        info = super().describe()
+        info.update({'frame_ms': self.FRAME_MS, 'bitrate': self.BITRATE, 'framing': 'u16le_length_prefixed'})
+        return info
+
+
+def downsample_pcm(pcm: bytes, factor: int) -> bytes:
+    """Giảm sample rate theo hệ số nguyên (trung bình từng nhóm = low-pass đơn giản)."""
+    if factor <= 1:
+        return pcm
+    samples = np.frombuffer(pcm, dtype='<i2')
+    samples = samples[:len(samples) - len(samples) % factor].reshape(-1, factor)
+    return samples.mean(axis=1).astype('<i2').tobytes()
+
+
+CODECS = {
+    'pcm': PcmCodec,
+    'mulaw': MuLawCodec,
+    'alaw': ALawCodec,
+    'opus': OpusCodec,
+}
+
+
+def create_codec(name: str, sample_rate: int = 16000, channels: int = 1):
+    """Tạo codec theo tên. Thiếu opuslib → μ-law, tên lạ → pcm."""
+    name = (name or 'pcm').strip().lower()
+    if name == 'opus' and not OPUS_AVAILABLE:
+        print("⚠️ opuslib not installed → dùng μ-law. Install: pip install opuslib")
+        name = 'mulaw'
+    codec_cls = CODECS.get(name)
+    if codec_cls is None:
+        print(f"⚠️ Codec không hỗ trợ: {name} → dùng pcm")
+        codec_cls = PcmCodec
+    return codec_cls(sample_rate, channels)
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Nguồn audio cho pipeline VAD/stream (PCM S16_LE mono, đọc theo frame).
+
+- arecord:   mic USB thật (auto-detect card, boost capture volume khi mở)
+- file:      replay WAV / m4a (m4a cần ffmpeg), tốc độ real-time hoặc nhanh hơn
+- synthetic: tone / noise / speech (tiếng giả xen kẽ im lặng) để test không cần mic
+
+Chọn bằng AUDIO_SOURCE:
+    arecord                 mic, device auto-detect
+    arecord:plughw:1,0      mic, device cố định
+    file:recording.wav      replay file (đường dẫn tương đối theo thư mục script)
+    synthetic:speech        tone | noise | speech
+AUDIO_SOURCE_SPEED: 1.0 = real-time, 4 = nhanh gấp 4, 0 = nhanh nhất có thể.
+"""
+
+import asyncio
+import os
+import re
+import subprocess
+import time
+import wave
+
+import numpy as np
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+# ============ ARECORD (MIC) ============
+def get_usb_audio_device():
+    """Auto-detect USB audio device."""
+    try:
+        result = subprocess.run(['arecord', '-l'], capture_output=True, text=True)
+        for line in result.stdout.split('\n'):
+            if 'card' in line.lower() and ('usb' in line.lower() or 'pnp' in line.lower()):
+                match = re.search(r'card (\d+):', line)
+                if match:
+                    device = f"plughw:{match.group(1)},0"
+                    print(f"🎤 USB Audio: {device}")
+                    return device
+        return "plughw:0,0"
+    except Exception:
+        return "plughw:0,0"
+
+
+def boost_mic_capture_volume():
+    # fail-open: không phụ thuộc card cụ thể
+    for cmd in [
+        ["amixer", "set", "Capture", "100%"],
+        ["amixer", "set", "Mic", "100%"],
+        ["amixer", "set", "PCM", "100%"],
+        ["amixer", "set", "Auto Gain Control", "off"],
+    ]:
+        try:
+            subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        except:
+            pass
+
+
+class ArecordSource:
+    """arecord qua asyncio subprocess pipe. Device/amixer chỉ chạy khi start() (không lúc import)."""
+    name = 'arecord'
+    _device = None      # Cache auto-detect cho cả process
+    _boosted = False
+
+    def __init__(self, sample_rate: int = 16000, channels: int = 1, device: str = None):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.device = device
+        self.process = None
+
+    async def start(self):
+        if not self.device:
+            if ArecordSource._device is None:
+                ArecordSource._device = await asyncio.to_thread(get_usb_audio_device)
+            self.device = ArecordSource._device
+        if not ArecordSource._boosted:
+            await asyncio.to_thread(boost_mic_capture_volume)
+            ArecordSource._boosted = True
+
+        self.process = await asyncio.create_subprocess_exec(
+            'arecord', '-D', self.device,
+            '-f', 'S16_LE', '-r', str(self.sample_rate),
+            '-c', str(self.channels), '-t', 'raw', '-',
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL
+        )
+
+    async def read(self, n: int):
+        """n bytes tiếp theo, None khi arecord dừng."""
+        try:
+            return await self.process.stdout.readexactly(n)
+        except asyncio.IncompleteReadError:
+            return None
+
+    async def close(self):
+        if self.process and self.process.returncode is None:
+            self.process.terminate()
+            await self.process.wait()
+
+    def describe(self) -> str:
+        return f"arecord {self.device or 'auto'}"
+
+
+# ============ PACED SOURCES (FILE / SYNTHETIC) ============
+class _PacedSource:
+    """PCM sinh sẵn trong bộ nhớ, trả frame theo nhịp real-time x speed (speed <= 0: không chờ)."""
+    name = 'paced'
+
+    def __init__(self, sample_rate: int = 16000, channels: int = 1, speed: float = 1.0, loop: bool = False):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.speed = speed
+        self.loop = loop
+        self.pcm = b''
+        self.pos = 0
+        self.started_at = 0.0
+        self.bytes_read = 0
+
+    def _load(self) -> bytes:
+        raise NotImplementedError
+
+    async def start(self):
+        if not self.pcm:
+            self.pcm = await asyncio.to_thread(self._load)
+        self.pos = 0
+        self.bytes_read = 0
+        self.started_at = time.monotonic()
+
+    async def read(self, n: int):
+        if self.pos + n > len(self.pcm):
+            if not self.loop or len(self.pcm) < n:
+                return None
+            self.pos = 0
+        frame = self.pcm[self.pos:self.pos + n]
+        self.pos += n
+        self.bytes_read += n
+
+        if self.speed > 0:
+            due = self.started_at + self.bytes_read / (2 * self.channels * self.sample_rate) / self.speed
+            delay = due - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        else:
+            await asyncio.sleep(0)  # Nhường event loop (send/receive vẫn chạy)
+        return frame
+
+    async def close(self):
+        pass
+
+    def describe(self) -> str:
+        pace = f"x{self.speed:g}" if self.speed > 0 else "max speed"
+        return f"{self.name} {len(self.pcm) / 2 / self.sample_rate:.1f}s {pace}"
+
+
+class FileSource(_PacedSource):
+    """Replay WAV (wave + numpy) hoặc định dạng khác qua ffmpeg (m4a, mp3...)."""
+    name = 'file'
+
+    def __init__(self, path: str, sample_rate: int = 16000, channels: int = 1,
+                 speed: float = 1.0, loop: bool = False):
+        super().__init__(sample_rate, channels, speed, loop)
+        self.path = path if os.path.isabs(path) else os.path.join(SCRIPT_DIR, path)
+
+    def _load(self) -> bytes:
+        if self.path.lower().endswith('.wav'):
+            return self._load_wav()
+        return self._load_ffmpeg()
+
+    def _load_wav(self) -> bytes:
+        """Lấy kênh đầu, resample tuyến tính về sample_rate."""
+        with wave.open(self.path, 'rb') as w:
+            if w.getsampwidth() != 2:
+                raise ValueError(f"Chỉ hỗ trợ WAV 16-bit: {self.path}")
+            channels = w.getnchannels()
+            rate = w.getframerate()
+            raw = w.readframes(w.getnframes())
+        samples = np.frombuffer(raw, dtype='<i2')[::channels]
+        if rate != self.sample_rate:
+            n = int(len(samples) * self.sample_rate / rate)
+            samples = np.interp(np.linspace(0, len(samples) - 1, n), np.arange(len(samples)), samples)
+        return samples.astype('<i2').tobytes()
+
+    def _load_ffmpeg(self) -> bytes:
+        try:
+            result = subprocess.run(
+                ['ffmpeg', '-v', 'error', '-i', self.path,
+                 '-f', 's16le', '-ac', str(self.channels), '-ar', str(self.sample_rate), '-'],
+                capture_output=True, check=True
+            )
+        except FileNotFoundError:
+            raise RuntimeError("ffmpeg not installed (cần để đọc m4a). Install: sudo apt install ffmpeg")
+        return result.stdout
+
+    def describe(self) -> str:
+        return f"{os.path.basename(self.path)} | {super().describe()}"
+
+
+class SyntheticSource(_PacedSource):
+    """
+    tone:   sine 440Hz
+    noise:  white noise nhỏ (giống phòng yên tĩnh)
+    speech: 1.5s "giọng" (harmonic 150Hz + noise, biên độ dao động) xen 1.5s noise
+    """
+    name = 'synthetic'
+    KINDS = ('tone', 'noise', 'speech')
+
+    def __init__(self, kind: str = 'speech', sample_rate: int = 16000, channels: int = 1,
+                 speed: float = 1.0, duration: float = 30.0, loop: bool = False, seed: int = 0):
+        super().__init__(sample_rate, channels, speed, loop)
+        if kind not in self.KINDS:
+            print(f"⚠️ Synthetic kind không hỗ trợ: {kind} → speech")
+            kind = 'speech'
+        self.kind = kind
+        self.duration = duration
+        self.seed = seed
+
+    def _load(self) -> bytes:
+        rng = np.random.default_rng(self.seed)
+        t = np.arange(int(self.duration * self.sample_rate)) / self.sample_rate
+        noise = rng.normal(0, 30, len(t))
+        if self.kind == 'tone':
+            signal = 3000 * np.sin(2 * np.pi * 440 * t) + noise
+        elif self.kind == 'noise':
+            signal = noise
+        else:
+            voiced = (t % 3.0) < 1.5
+            envelope = 0.6 + 0.4 * np.sin(2 * np.pi * 4 * t)  # ~4 âm tiết/giây
+            harmonics = sum(np.sin(2 * np.pi * 150 * k * t) / k for k in range(1, 6))
+            speech = 2500 * envelope * harmonics + rng.normal(0, 400, len(t))
+            signal = np.where(voiced, speech, noise)
+        samples = np.clip(signal, -32768, 32767).astype('<i2')
+        if self.channels > 1:
+            samples = np.repeat(samples, self.channels)
+        return samples.tobytes()
+
+    def describe(self) -> str:
+        return f"{self.kind} | {super().describe()}"
+
+
+# ============ FACTORY ============
+def create_audio_source(spec: str = 'arecord', sample_rate: int = 16000, channels: int = 1,
+                        speed: float = 1.0):
+    """'arecord[:device]' | 'file:path' | 'synthetic:kind'. Spec lạ → arecord."""
+    kind, _, arg = (spec or 'arecord').strip().partition(':')
+    kind = kind.lower()
+    if kind == 'file' and arg:
+        return FileSource(arg, sample_rate, channels, speed=speed)
+    if kind == 'synthetic':
+        return SyntheticSource(arg or 'speech', sample_rate, channels, speed=speed)
+    if kind != 'arecord':
+        print(f"⚠️ AUDIO_SOURCE không hỗ trợ: {spec} → arecord")
+    return ArecordSource(sample_rate, channels, device=arg or None)
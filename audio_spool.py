@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Store-and-forward spool trên đĩa cho message uplink (audio bytes + control dict).
+
+Cấu trúc thư mục:
+    data_000001.bin   file dữ liệu append-only (xoay vòng khi > file_max_bytes)
+    index.jsonl       mỗi dòng 1 record: file, offset, length, kind (A=audio, J=json), ts
+    cursor            số record đã gửi xong (đọc lại được sau reboot)
+
+Vượt max_bytes → bỏ segment cũ nhất (không bỏ nửa segment để server không lệch segment_start/end).
+Đang drain (draining=True) → giữ segment đang gửi dở, bỏ segment hoàn chỉnh kế tiếp.
+"""
+
+import json
+import os
+import time
+
+
+class AudioSpool:
+    INDEX_FILE = 'index.jsonl'
+    CURSOR_FILE = 'cursor'
+
+    def __init__(self, directory: str, max_bytes: int = 50 * 1024 * 1024,
+                 file_max_bytes: int = 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.file_max_bytes = file_max_bytes
+        self.index = []         # Record đã ghi (kể cả đã gửi, tới khi compact)
+        self.cursor = 0         # index[cursor:] là record chưa gửi
+        self.pending_bytes = 0
+        self.write_file = None
+        self.write_size = 0
+        self.dropped_segments = 0
+        self.draining = False   # drain_spool đang gửi: segment ở cursor không được bỏ
+        self.open_segment = False   # Đã gửi segment_start, chưa gửi segment_end
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    # ---------- persistence ----------
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _load(self):
+        try:
+            with open(self._path(self.INDEX_FILE), 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        self.index.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        break  # Dòng cuối ghi dở (mất điện) → bỏ
+        except FileNotFoundError:
+            pass
+        try:
+            with open(self._path(self.CURSOR_FILE), 'r') as f:
+                self.cursor = min(int(f.read().strip() or 0), len(self.index))
+        except (FileNotFoundError, ValueError):
+            self.cursor = 0
+        # Record trỏ tới file không còn (bị xóa tay) → bỏ
+        self.index = self.index[:self.cursor] + [
+            r for r in self.index[self.cursor:] if os.path.exists(self._path(r['file']))
+        ]
+        self.pending_bytes = sum(r['length'] for r in self.index[self.cursor:])
+        # Reboot giữa lúc drain: cursor có thể nằm giữa segment (segment_start đã gửi)
+        for record in reversed(self.index[:self.cursor]):
+            if record['kind'] == 'J' and os.path.exists(self._path(record['file'])):
+                kind = self._read(record).get('type')
+                if kind in ('segment_start', 'segment_end'):
+                    self.open_segment = kind == 'segment_start'
+                    break
+        if self.index:
+            last = self.index[-1]
+            self.write_file = last['file']
+            self.write_size = last['offset'] + last['length']
+        if self.pending:
+            print(f"💾 Spool: {self.pending} records ({self.pending_bytes / 1024:.0f} KB) chưa gửi")
+
+    def _save_cursor(self):
+        with open(self._path(self.CURSOR_FILE), 'w') as f:
+            f.write(str(self.cursor))
+
+    # ---------- write ----------
+    @property
+    def pending(self) -> int:
+        return len(self.index) - self.cursor
+
+    def append(self, message, captured_at: float = None):
+        """Ghi message vào cuối spool (audio → 'A', dict → 'J')."""
+        if isinstance(message, dict):
+            kind, data = 'J', json.dumps(message).encode('utf-8')
+        else:
+            kind, data = 'A', message
+
+        if self.write_file is None or self.write_size + len(data) > self.file_max_bytes:
+            self.write_file = f"data_{self._next_file_number():06d}.bin"
+            self.write_size = 0
+        with open(self._path(self.write_file), 'ab') as f:
+            f.write(data)
+        record = {'file': self.write_file, 'offset': self.write_size, 'length': len(data),
+                  'kind': kind, 'ts': captured_at or time.time()}
+        with open(self._path(self.INDEX_FILE), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record) + '\n')
+        self.index.append(record)
+        self.write_size += len(data)
+        self.pending_bytes += len(data)
+
+        while self.pending_bytes > self.max_bytes and self.pending > 1:
+            if not self._drop_oldest_segment():
+                break  # Chỉ còn segment đang gửi / đang ghi dở → vượt max_bytes tạm thời
+
+    def _next_file_number(self) -> int:
+        if self.write_file is None:
+            return 1
+        return int(self.write_file[5:11]) + 1
+
+    def _segment_end(self, start: int, in_segment: bool = False):
+        """Vị trí ngay sau segment bắt đầu từ index[start] (batch: 1 audio, stream: … segment_end). None: chưa ghi xong."""
+        for i in range(start, len(self.index)):
+            record = self.index[i]
+            if record['kind'] == 'J':
+                kind = self._read(record).get('type')
+                if kind == 'segment_start':
+                    in_segment = True
+                elif kind == 'segment_end':
+                    return i + 1
+            elif not in_segment:
+                return i + 1
+        return None
+
+    def _drop_oldest_segment(self) -> bool:
+        """Bỏ 1 segment hoàn chỉnh chưa gửi. False nếu không có segment nào bỏ được."""
+        start = self.cursor
+        if self.draining:
+            # Segment ở cursor đang gửi (server đã nhận segment_start) → bỏ segment sau nó
+            start = self._segment_end(self.cursor, self.open_segment)
+            if start is None:
+                return False
+            end = self._segment_end(start)
+        else:
+            end = self._segment_end(start, self.open_segment)
+        if end is None:
+            return False
+
+        if start == self.cursor:
+            for _ in range(end - start):
+                self._advance()
+        else:
+            self._remove_records(start, end)
+        self.dropped_segments += 1
+        print(f"⚠️ Spool full → dropped oldest segment (total {self.dropped_segments})")
+        return True
+
+    def _remove_records(self, start: int, end: int):
+        """Xóa index[start:end] (sau cursor): ghi lại index.jsonl, xóa file dữ liệu không còn record nào."""
+        dropped = self.index[start:end]
+        del self.index[start:end]
+        self.pending_bytes -= sum(r['length'] for r in dropped)
+        tmp = self._path(self.INDEX_FILE + '.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.writelines(json.dumps(r) + '\n' for r in self.index)
+        os.replace(tmp, self._path(self.INDEX_FILE))
+        live = {r['file'] for r in self.index} | {self.write_file}
+        for name in {r['file'] for r in dropped} - live:
+            self._remove(name)
+
+    # ---------- read ----------
+    def _read(self, record: dict):
+        with open(self._path(record['file']), 'rb') as f:
+            f.seek(record['offset'])
+            data = f.read(record['length'])
+        return json.loads(data) if record['kind'] == 'J' else data
+
+    def peek(self):
+        """(message, captured_at, record) của record cũ nhất chưa gửi, None nếu rỗng. record: truyền lại cho pop()."""
+        if not self.pending:
+            return None
+        record = self.index[self.cursor]
+        return self._read(record), record['ts'], record
+
+    def pop(self, record: dict = None) -> bool:
+        """
+        Đánh dấu record cũ nhất đã gửi. Có record (từ peek): chỉ pop nếu nó vẫn là record cũ nhất,
+        không bao giờ pop nhầm record sau (khi draining, spool đầy không bỏ record đang gửi).
+        """
+        if not self.pending:
+            return False
+        if record is not None and self.index[self.cursor] is not record:
+            return False
+        self._advance()
+        return True
+
+    def _advance(self):
+        record = self.index[self.cursor]
+        if record['kind'] == 'J':
+            kind = self._read(record).get('type')
+            if kind in ('segment_start', 'segment_end'):
+                self.open_segment = kind == 'segment_start'
+        self.cursor += 1
+        self.pending_bytes -= record['length']
+
+        if not self.pending:
+            self._compact()
+            return
+        # File dữ liệu đã gửi hết (và không còn ghi vào) → xóa
+        if self.index[self.cursor]['file'] != record['file'] and record['file'] != self.write_file:
+            self._remove(record['file'])
+        self._save_cursor()
+
+    def _compact(self):
+        """Gửi hết → xóa toàn bộ file, bắt đầu lại từ đầu."""
+        for name in {r['file'] for r in self.index}:
+            self._remove(name)
+        self.index = []
+        self.cursor = 0
+        self.pending_bytes = 0
+        self.write_file = None
+        self.write_size = 0
+        self.open_segment = False
+        self._remove(self.INDEX_FILE)
+        self._save_cursor()
+
+    def _remove(self, name: str):
+        try:
+            os.remove(self._path(name))
+        except OSError:
+            pass
+
+    def get_stats(self) -> dict:
+        return {
+            'pending': self.pending,
+            'pending_kb': round(self.pending_bytes / 1024, 1),
+            'dropped_segments': self.dropped_segments,
+        }
@@ -83,21 +83,14 @@ def update_env_file(api_url):
         if not found:
             env_lines.append(f'API_URL={api_url}\n')
 
-        # Ghi lại file
-        with open(ENV_FILE_PATH, 'w') as f:
+        # Ghi file tạm rồi rename: real_time.py đang theo dõi .env không bao giờ đọc phải file ghi dở
+        tmp_path = ENV_FILE_PATH + '.tmp'
+        with open(tmp_path, 'w') as f:
             f.writelines(env_lines)
+        os.replace(tmp_path, ENV_FILE_PATH)
 
-        print(f"✅ Đã cập nhật .env thành công!")
-
-        # Restart service chính (real_time.py) để nhận config mới
-        try:
-            subprocess.run(
-                ['sudo', 'systemctl', 'restart', 'signify'],
-                capture_output=True, timeout=10
-            )
-            print("🔄 Đã restart service chính (signify)")
-        except Exception:
-            print("⚠️ Không tìm thấy service 'signify' để restart (bỏ qua)")
+        # Không restart service: real_time.py tự thấy .env đổi, chuyển sang server mới trong ~1 giây
+        print(f"✅ Đã cập nhật .env thành công! (real_time.py tự nạp lại API_URL)")
 
     except Exception as e:
         print(f"❌ Lỗi cập nhật .env: {e}")
@@ -26,6 +26,7 @@ from gi.repository import GLib
 
 # Import constants from constraint.py
 from constraint import *
+from ble_transfer import ChunkError, NotifyPipeline, VslReceiver
 
 # ============ FONT ============
 try:
@@ -299,6 +300,7 @@ stop_video = False
 _shell_cwd = '/home/pi/IOT-Raspberry'  # CWD hiện tại cho shell
 _shell_output_char = None  # Tham chiếu ShellOutputCharacteristic
 _ble_connected = False  # Trạng thái kết nối BLE
+_ble_att_mtu = 23  # ATT MTU hiện tại (BlueZ gửi trong options['mtu'] của ReadValue / WriteValue)
 
 def enqueue_video_job(job: VideoJob):
     with video_queue_lock:
@@ -388,6 +390,14 @@ def video_playback_worker():
             gc.collect()
 
 # ============ BLE HELPER FUNCTIONS ============
+def update_att_mtu(options):
+    """Lưu ATT MTU BlueZ báo kèm mỗi lần Read/Write (app gọi requestMtu → thường 185-517)."""
+    global _ble_att_mtu
+    mtu = int(options.get('mtu', 0))
+    if mtu and mtu != _ble_att_mtu:
+        _ble_att_mtu = mtu
+        print(f"📶 BLE MTU: {mtu}")
+
 def get_device_ips():
     ips = {}
     try:
@@ -434,8 +444,10 @@ def update_env_file(api_url):
                         env_lines.append(line)
         if not found:
             env_lines.append(f'API_URL={api_url}\n')
-        with open(ENV_FILE_PATH, 'w') as f:
+        tmp_path = ENV_FILE_PATH + '.tmp'
+        with open(tmp_path, 'w') as f:
             f.writelines(env_lines)
+        os.replace(tmp_path, ENV_FILE_PATH)  # real_time.py theo dõi .env: không đọc phải file ghi dở
         print(f"✅ Đã cập nhật .env thành công!")
     except Exception as e:
         print(f"❌ Lỗi cập nhật .env: {e}")
@@ -563,7 +575,8 @@ class IPInfoCharacteristic(dbus.service.Object):
         return dbus.Array([dbus.Byte(b) for b in ip_json.encode('utf-8')], signature='y')
 
 class VslCharacteristic(dbus.service.Object):
-    _BUFFER_MAX_SIZE = 8192   # Giới hạn buffer tránh rò rỉ RAM
+    _BUFFER_MAX_SIZE = 8192   # Giới hạn buffer text cũ tránh rò rỉ RAM
+    _MESSAGE_MAX_SIZE = 65536 # Giới hạn 1 message chunk nhị phân
     _BUFFER_TIMEOUT_S = 10    # Xóa buffer nếu không nhận hết chunk trong 10s
 
     def __init__(self, bus, index, service):
@@ -571,10 +584,10 @@ class VslCharacteristic(dbus.service.Object):
         self.bus = bus
         self.uuid = VSL_CHRC_UUID
         self.service = service
-        self.flags = ['write']
+        self.flags = ['write', 'write-without-response']
         self.value = []
-        self._buffer = ""
-        self._buffer_started_at = None
+        self._receiver = VslReceiver(max_message_bytes=self._MESSAGE_MAX_SIZE,
+                                     legacy_max_size=self._BUFFER_MAX_SIZE, timeout=self._BUFFER_TIMEOUT_S)
         dbus.service.Object.__init__(self, bus, self.path)
     def get_properties(self):
         return {
@@ -588,50 +601,21 @@ class VslCharacteristic(dbus.service.Object):
     def get_path(self): return dbus.ObjectPath(self.path)
     @dbus.service.method(DBUS_PROP_IFACE, in_signature='s', out_signature='a{sv}')
     def GetAll(self, interface): return self.get_properties()[GATT_CHRC_IFACE]
-    @dbus.service.method(GATT_CHRC_IFACE, in_signature='aya{sv}', out_signature='')
+    # byte_arrays=True: value là dbus.ByteArray (bytes) thay vì Array các dbus.Byte → khỏi đổi từng byte
+    @dbus.service.method(GATT_CHRC_IFACE, in_signature='aya{sv}', out_signature='', byte_arrays=True)
     def WriteValue(self, value, options):
         try:
-            raw_bytes = bytes([int(b) for b in value])
-            decoded = raw_bytes.decode('utf-8')
-            
-            # Xóa buffer cũ nếu quá timeout (client gửi dang dở rồi bỏ)
-            if self._buffer and self._buffer_started_at:
-                if time.time() - self._buffer_started_at > self._BUFFER_TIMEOUT_S:
-                    print("⚠️ VSL buffer timeout, xóa buffer cũ")
-                    self._buffer = ""
-                    self._buffer_started_at = None
-
-            # Xử lý logic chunking [1/3]...
-            if decoded.startswith('['):
-                end_idx = decoded.find(']')
-                if end_idx != -1:
-                    chunk_info = decoded[1:end_idx].split('/')
-                    if len(chunk_info) == 2:
-                        idx = int(chunk_info[0])
-                        total = int(chunk_info[1])
-                        if idx == 1:
-                            self._buffer = ""  # Reset khi bắt đầu chuỗi chunk mới
-                            self._buffer_started_at = time.time()
-                        self._buffer += decoded[end_idx+1:]
-                        # Bảo vệ: xóa buffer nếu quá lớn
-                        if len(self._buffer) > self._BUFFER_MAX_SIZE:
-                            print("⚠️ VSL buffer quá lớn, xóa")
-                            self._buffer = ""
-                            self._buffer_started_at = None
-                            return
-                        if idx == total:
-                            self._process_message(self._buffer)
-                            self._buffer = ""
-                            self._buffer_started_at = None
-                        return
-            
-            # Gửi luôn trong 1 cục (nếu payload ngắn)
-            self._process_message(decoded)
-            
+            update_att_mtu(options)
+            message = self._receiver.write(value, int(options.get('offset', 0)))
+            if message is not None:
+                self._process_message(message)
+        except ChunkError as e:
+            print(f"⚠️ VSL chunk lỗi: {e}")
         except Exception as e:
             print(f"❌ Lỗi xử lý VSL data: {e}")
 
     def _process_message(self, message):
+        """message: str (text cũ) hoặc bytearray UTF-8 (chunk nhị phân) — json.loads nhận cả hai."""
         try:
             data = json.loads(message)
             print(f"📥 Nhận JSON qua BLE: {data}")
@@ -721,13 +705,13 @@ class VslCharacteristic(dbus.service.Object):
         except Exception as e:
             self._send_shell_output(f"\n❌ Error: {e}\n")
         
-        # Gửi EOT marker
-        self._send_shell_output("\x04")
+        # Gửi EOT marker (gửi ngay phần output còn gom trong buffer)
+        self._send_shell_output("\x04", flush=True)
 
-    def _send_shell_output(self, text):
+    def _send_shell_output(self, text, flush=False):
         global _shell_output_char
         if _shell_output_char:
-            _shell_output_char.send_output(text)
+            _shell_output_char.send_output(text, flush)
 
 class ShellOutputCharacteristic(dbus.service.Object):
     """Characteristic Notify để stream shell output về Flutter."""
@@ -742,6 +726,8 @@ class ShellOutputCharacteristic(dbus.service.Object):
         self.flags = ['notify', 'read']
         self.notifying = False
         self.value = []
+        # Gom output thành notification vừa MTU (ATT MTU - 3 bytes), thread shell không phải chờ BLE
+        self._pipeline = NotifyPipeline(self._emit, lambda: _ble_att_mtu - 3)
         dbus.service.Object.__init__(self, bus, self.path)
     
     def get_properties(self):
@@ -764,6 +750,7 @@ class ShellOutputCharacteristic(dbus.service.Object):
     def ReadValue(self, options):
         # Trả về CWD hiện tại khi Read
         global _shell_cwd
+        update_att_mtu(options)
         prompt = f"{_shell_cwd}"
         return dbus.Array([dbus.Byte(b) for b in prompt.encode('utf-8')], signature='y')
 
@@ -780,31 +767,32 @@ class ShellOutputCharacteristic(dbus.service.Object):
     @dbus.service.method(GATT_CHRC_IFACE, in_signature='', out_signature='')
     def StopNotify(self):
         self.notifying = False
+        self._pipeline.clear()
         print("🔕 Shell Notify: OFF")
         global _ble_connected
         _ble_connected = False
         # Hiển thị lại màn hình chờ kết nối
         show_message(["vui lòng", "kết nối ble"], (100, 200, 255))
 
-    def send_output(self, text):
+    def send_output(self, text, flush=False):
+        """Gọi được từ thread bất kỳ, không chặn. flush=True: gửi ngay, không chờ gom đủ MTU."""
         if not self.notifying:
             return
+        self._pipeline.send(text.encode('utf-8'), flush)
+
+    def _emit(self, data, done):
+        # PropertiesChanged phát từ GLib main loop (dbus-python không an toàn đa luồng)
+        GLib.idle_add(self._emit_on_mainloop, data, done)
+
+    def _emit_on_mainloop(self, data, done):
         try:
-            data = text.encode('utf-8')
-            # Chunk output nếu quá dài (BLE MTU ~500 bytes)
-            chunk_size = 500
-            for i in range(0, len(data), chunk_size):
-                chunk = data[i:i + chunk_size]
-                value = dbus.Array([dbus.Byte(b) for b in chunk], signature='y')
-                self.PropertiesChanged(
-                    GATT_CHRC_IFACE,
-                    {'Value': value},
-                    []
-                )
-                if len(data) > chunk_size:
-                    time.sleep(0.02)  # Delay nhỏ giữa chunks
+            if self.notifying:
+                self.PropertiesChanged(GATT_CHRC_IFACE, {'Value': dbus.ByteArray(data)}, [])
         except Exception as e:
             print(f"❌ Shell notify error: {e}")
+        finally:
+            done()   # Đã giao cho D-Bus (chưa chắc BlueZ đã gửi qua link) → mở 1 slot window
+        return False
 
     @dbus.service.signal(DBUS_PROP_IFACE, signature='sa{sv}as')
     def PropertiesChanged(self, interface, changed, invalidated):
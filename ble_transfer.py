@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Chunked transfer cho BLE Write (VslCharacteristic): 1 message JSON lớn hơn 1 lần write → nhiều chunk nhị phân.
+
+Mỗi chunk = header 16 bytes (little-endian) + payload:
+    magic u8 (0xF5) | version u8 | msg_id u16 | seq u16 | total u16 | length u32 | crc32 u32
+- msg_id: client tự tăng; nhiều message gửi xen kẽ được, mỗi msg_id 1 buffer riêng
+- seq:    0..total-1, không cần đúng thứ tự (offset = seq * chunk_size)
+- chunk_size = ceil(length / total): mọi chunk bằng nhau trừ chunk cuối
+- length: tổng số byte của message → bytearray cấp phát 1 lần khi nhận chunk đầu tiên
+- crc32:  zlib.crc32 của cả message, kiểm tra khi đủ chunk
+
+0xF5 không bao giờ là byte đầu của UTF-8 → client cũ ("[1/3]{..." hoặc JSON thô) vẫn chạy như trước.
+Gửi bằng write-without-response cho nhanh; chunk lớn hơn MTU thì BlueZ nhận kiểu long write
+(Prepare/Execute Write): WriteValue gọi từng đoạn với options['offset'] tăng dần → VslReceiver ghép lại.
+
+Chiều ngược lại (Notify, shell output → app): NotifyPipeline gom output thành notification vừa ATT MTU.
+"""
+
+import struct
+import threading
+import time
+import zlib
+
+MAGIC = 0xF5
+VERSION = 1
+HEADER = struct.Struct('<BBHHHII')
+ATT_OVERHEAD = 3  # opcode + handle của ATT Write
+
+
+class ChunkError(ValueError):
+    pass
+
+
+def chunk_payload_size(mtu: int) -> int:
+    """Payload tối đa mỗi chunk để 1 chunk vừa 1 lần write với ATT MTU đã thương lượng."""
+    return max(1, mtu - ATT_OVERHEAD - HEADER.size)
+
+
+def encode_message(payload: bytes, msg_id: int, max_payload: int) -> list:
+    """Phía gửi (app / test): message → danh sách chunk, mỗi chunk payload <= max_payload."""
+    length = len(payload)
+    total = max(1, -(-length // max_payload))
+    chunk = -(-length // total) if length else 0
+    crc = zlib.crc32(payload)
+    return [HEADER.pack(MAGIC, VERSION, msg_id & 0xFFFF, seq, total, length, crc)
+            + payload[seq * chunk:(seq + 1) * chunk] for seq in range(total)]
+
+
+def is_chunk(data) -> bool:
+    return len(data) >= HEADER.size and data[0] == MAGIC
+
+
+def frame_size(data) -> int:
+    """Độ dài đầy đủ (header + payload) của chunk theo header. data phải có đủ header."""
+    _, _, _, seq, total, length, _ = HEADER.unpack_from(data)
+    chunk = -(-length // total) if total else 0
+    return HEADER.size + max(0, min(chunk, length - seq * chunk))
+
+
+class _Message:
+    __slots__ = ('buffer', 'received', 'count', 'total', 'length', 'crc', 'started')
+
+    def __init__(self, total: int, length: int, crc: int):
+        self.buffer = bytearray(length)
+        self.received = bytearray(total)   # 1 byte / chunk: đã nhận chưa
+        self.count = 0
+        self.total = total
+        self.length = length
+        self.crc = crc
+        self.started = time.monotonic()
+
+
+class ChunkReassembler:
+    """Ghép chunk nhị phân theo msg_id. Giữ tối đa max_messages message dang dở, bỏ message quá timeout."""
+
+    def __init__(self, max_message_bytes: int = 65536, max_messages: int = 8, timeout: float = 10.0):
+        self.max_message_bytes = max_message_bytes
+        self.max_messages = max_messages
+        self.timeout = timeout
+        self._messages = {}   # msg_id → _Message, thứ tự dict = thứ tự bắt đầu
+        self.stats = {'messages': 0, 'chunks': 0, 'duplicates': 0, 'crc_errors': 0, 'expired': 0}
+
+    def feed(self, frame):
+        """1 chunk → message hoàn chỉnh (bytearray) hoặc None nếu chưa đủ. Chunk hỏng → ChunkError."""
+        if len(frame) < HEADER.size:
+            raise ChunkError(f"chunk {len(frame)}B ngắn hơn header")
+        magic, version, msg_id, seq, total, length, crc = HEADER.unpack_from(frame)
+        if magic != MAGIC or version != VERSION:
+            raise ChunkError(f"magic/version {magic:#x}/{version} không hỗ trợ")
+        if seq >= total or length > self.max_message_bytes:
+            raise ChunkError(f"chunk {seq}/{total} ({length}B) không hợp lệ")
+        chunk = -(-length // total)
+        offset = seq * chunk
+        size = len(frame) - HEADER.size
+        if size != max(0, min(chunk, length - offset)):
+            raise ChunkError(f"chunk {seq}/{total} dài {size}B, header báo khác")
+        self.stats['chunks'] += 1
+
+        if total == 1:   # Message vừa 1 write: khỏi cấp buffer
+            payload = bytearray(memoryview(frame)[HEADER.size:])
+            return self._complete(payload, crc)
+
+        message = self._messages.get(msg_id)
+        if message is None or (message.total, message.length, message.crc) != (total, length, crc):
+            message = self._start(msg_id, total, length, crc)
+        if message.received[seq]:
+            self.stats['duplicates'] += 1
+            return None
+        message.buffer[offset:offset + size] = memoryview(frame)[HEADER.size:]
+        message.received[seq] = 1
+        message.count += 1
+        if message.count < total:
+            return None
+        del self._messages[msg_id]
+        return self._complete(message.buffer, crc)
+
+    def _start(self, msg_id: int, total: int, length: int, crc: int) -> _Message:
+        self.expire()
+        self._messages.pop(msg_id, None)   # msg_id bị dùng lại cho message khác → bỏ bản cũ
+        if len(self._messages) >= self.max_messages:
+            oldest = next(iter(self._messages))
+            self._drop(oldest, "quá nhiều message dang dở")
+        message = self._messages[msg_id] = _Message(total, length, crc)
+        return message
+
+    def _complete(self, payload: bytearray, crc: int) -> bytearray:
+        if zlib.crc32(payload) != crc:
+            self.stats['crc_errors'] += 1
+            raise ChunkError("CRC32 không khớp")
+        self.stats['messages'] += 1
+        return payload
+
+    def _drop(self, msg_id: int, reason: str):
+        message = self._messages.pop(msg_id)
+        self.stats['expired'] += 1
+        print(f"⚠️ BLE message #{msg_id} bỏ ({reason}): nhận {message.count}/{message.total} chunk")
+
+    def expire(self):
+        now = time.monotonic()
+        for msg_id in [m for m, msg in self._messages.items() if now - msg.started > self.timeout]:
+            self._drop(msg_id, "timeout")
+
+    @property
+    def pending(self) -> int:
+        return len(self._messages)
+
+
+class VslReceiver:
+    """
+    Phần nhận của VslCharacteristic.WriteValue (không cần dbus → đo / test được trên PC).
+    write(value, offset) → message hoàn chỉnh (bytearray: chunk nhị phân, str: text cũ) hoặc None.
+    """
+
+    def __init__(self, max_message_bytes: int = 65536, legacy_max_size: int = 8192, timeout: float = 10.0):
+        self.chunks = ChunkReassembler(max_message_bytes=max_message_bytes, timeout=timeout)
+        self.legacy_max_size = legacy_max_size
+        self.timeout = timeout
+        self._long_write = None      # bytearray: chunk đang nhận kiểu long write
+        self._buffer = ""            # Text cũ "[idx/total]..."
+        self._buffer_started_at = None
+
+    def write(self, value, offset: int = 0):
+        if offset or self._long_write is not None or (is_chunk(value) and len(value) < frame_size(value)):
+            value = self._append_long_write(value, offset)
+            if value is None:
+                return None
+        if is_chunk(value):
+            return self.chunks.feed(value)
+        return self._write_legacy(bytes(value).decode('utf-8'))
+
+    def _append_long_write(self, value, offset: int):
+        """Long write: BlueZ gọi WriteValue từng đoạn (offset 0, 18, 36, ...) → đủ header + payload thì trả chunk."""
+        if offset == 0:
+            self._long_write = bytearray()
+        if self._long_write is None or offset != len(self._long_write):
+            expected = None if self._long_write is None else len(self._long_write)
+            self._long_write = None
+            raise ChunkError(f"long write lệch offset {offset} (đang chờ {expected})")
+        self._long_write += value
+        data = self._long_write
+        if data and data[0] != MAGIC:
+            self._long_write = None
+            raise ChunkError("long write chỉ hỗ trợ chunk nhị phân")
+        if len(data) < HEADER.size or len(data) < frame_size(data):
+            return None
+        self._long_write = None
+        return data
+
+    def _write_legacy(self, decoded: str):
+        """Giao thức text cũ: "[idx/total]" + đoạn JSON, hoặc JSON thô trong 1 write."""
+        # Xóa buffer cũ nếu quá timeout (client gửi dang dở rồi bỏ)
+        if self._buffer and self._buffer_started_at:
+            if time.monotonic() - self._buffer_started_at > self.timeout:
+                print("⚠️ VSL buffer timeout, xóa buffer cũ")
+                self._buffer = ""
+                self._buffer_started_at = None
+
+        if decoded.startswith('['):
+            end_idx = decoded.find(']')
+            if end_idx != -1:
+                chunk_info = decoded[1:end_idx].split('/')
+                if len(chunk_info) == 2:
+                    idx = int(chunk_info[0])
+                    total = int(chunk_info[1])
+                    if idx == 1:
+                        self._buffer = ""  # Reset khi bắt đầu chuỗi chunk mới
+                        self._buffer_started_at = time.monotonic()
+                    self._buffer += decoded[end_idx + 1:]
+                    # Bảo vệ: xóa buffer nếu quá lớn
+                    if len(self._buffer) > self.legacy_max_size:
+                        print("⚠️ VSL buffer quá lớn, xóa")
+                        self._buffer = ""
+                        self._buffer_started_at = None
+                        return None
+                    if idx == total:
+                        message, self._buffer, self._buffer_started_at = self._buffer, "", None
+                        return message
+                    return None
+
+        # Gửi luôn trong 1 cục (nếu payload ngắn)
+        return decoded
+
+
+# ============ NOTIFY (PI → APP) ============
+def utf8_cut(data, limit: int) -> int:
+    """Số byte đầu của data để gửi, <= limit, không cắt giữa 1 ký tự UTF-8 (app decode từng notification)."""
+    if len(data) <= limit:
+        return len(data)
+    n = limit
+    while n > 0 and (data[n] & 0xC0) == 0x80:
+        n -= 1
+    return n or limit
+
+
+class NotifyPipeline:
+    """
+    send() không bao giờ chặn: chỉ nối vào buffer. Thread riêng gom buffer thành notification
+    payload_size() bytes (ATT MTU - 3), gửi khi đủ 1 notification, sau flush_interval, hoặc khi flush.
+    emit(data, done): gửi 1 notification, gọi done() khi đã giao xong (từ thread bất kỳ).
+    Tối đa window notification chưa done → không sleep cố định, gửi theo tốc độ emit xử lý.
+    Với ble_application, done = GLib main loop đã phát PropertiesChanged (giao cho D-Bus / BlueZ),
+    KHÔNG phải link BLE đã gửi tới điện thoại: window giới hạn tốc độ main loop + D-Bus, còn BlueZ
+    vẫn có thể xếp hàng notification chờ connection event.
+    """
+
+    def __init__(self, emit, payload_size, flush_interval: float = 0.03, window: int = 4,
+                 max_buffer: int = 65536):
+        self.emit = emit
+        self.payload_size = payload_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self._buffer = bytearray()
+        self._first_at = None     # Lúc byte cũ nhất trong buffer được thêm vào
+        self._flush = False
+        self._cond = threading.Condition()
+        self._window = threading.Semaphore(window)
+        self.stats = {'notifications': 0, 'bytes': 0, 'dropped': 0, 'window_wait_ms': 0.0}
+        threading.Thread(target=self._run, daemon=True, name='ble-notify').start()
+
+    def send(self, data: bytes, flush: bool = False):
+        with self._cond:
+            if len(self._buffer) + len(data) > self.max_buffer and not flush:
+                self.stats['dropped'] += len(data)   # App không đọc kịp: bỏ output mới, giữ RAM
+                return
+            if not self._buffer:
+                self._first_at = time.monotonic()
+            self._buffer += data
+            self._flush = self._flush or flush
+            self._cond.notify()
+
+    def clear(self):
+        with self._cond:
+            self._buffer.clear()
+            self._first_at = None
+            self._flush = False
+
+    @property
+    def pending(self) -> int:
+        return len(self._buffer)
+
+    def _next(self) -> bytes:
+        """Chờ tới lúc gửi được 1 notification, trả payload."""
+        with self._cond:
+            while True:
+                while not self._buffer:
+                    self._cond.wait()
+                size = self.payload_size()
+                remaining = self._first_at + self.flush_interval - time.monotonic()
+                if len(self._buffer) >= size or self._flush or remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            n = utf8_cut(self._buffer, size)
+            data = bytes(self._buffer[:n])
+            del self._buffer[:n]
+            if not self._buffer:
+                self._first_at = None
+                self._flush = False
+            return data
+
+    def _run(self):
+        while True:
+            data = self._next()
+            t0 = time.monotonic()
+            self._window.acquire()
+            self.stats['window_wait_ms'] += (time.monotonic() - t0) * 1000
+            self.stats['notifications'] += 1
+            self.stats['bytes'] += len(data)
+            try:
+                self.emit(data, self._window.release)
+            except Exception as e:
+                self._window.release()
+                print(f"❌ BLE notify error: {e}")
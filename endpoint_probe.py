@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Nhiều server (API_URL=ws://a:8000,ws://b:8000): đo song song, chọn server nhanh nhất còn sống.
+
+Probe 1 endpoint = mở WebSocket (connect: TCP + TLS + upgrade) → chờ 'connected'
+→ gửi {'type': 'ping'} → chờ 'pong' (rtt: app server trả lời được, không chỉ proxy).
+Kết quả lưu ra file JSON: lần chạy sau (trong cache_ttl) vào thẳng server tốt gần nhất, không probe.
+"""
+
+import asyncio
+import json
+import os
+import time
+
+import websockets
+
+
+async def probe_endpoint(url: str, path: str, timeout: float = 2.0, **connect_options) -> dict:
+    """
+    {'url', 'ok', 'connect_ms', 'rtt_ms', 'error', 'at'}. Không raise.
+    connect_options: như session thật (SSLContext dùng chung → probe cũng để lại TLS session để resume).
+    """
+    result = {'url': url, 'ok': False, 'connect_ms': None, 'rtt_ms': None, 'error': None, 'at': time.time()}
+    t0 = time.perf_counter()
+    try:
+        async with asyncio.timeout(timeout):
+            async with websockets.connect(f"{url}{path}", open_timeout=timeout, close_timeout=1,
+                                          **connect_options) as ws:
+                result['connect_ms'] = round((time.perf_counter() - t0) * 1000, 1)
+                while json.loads(await ws.recv()).get('type') != 'connected':
+                    pass
+                t1 = time.perf_counter()
+                await ws.send(json.dumps({'type': 'ping'}))
+                while json.loads(await ws.recv()).get('type') != 'pong':
+                    pass
+                result['rtt_ms'] = round((time.perf_counter() - t1) * 1000, 1)
+                result['ok'] = True
+                remember = getattr(connect_options.get('ssl'), 'remember', None)
+                if remember:
+                    remember(ws.transport)
+    except TimeoutError:
+        result['error'] = 'timeout'
+    except Exception as e:
+        result['error'] = str(e)[:80] or type(e).__name__
+    return result
+
+
+class EndpointSelector:
+    """current = endpoint đang dùng. Chỉ 1 URL → không bao giờ probe (như trước)."""
+
+    def __init__(self, urls: list, path: str, cache_path: str, timeout: float = 2.0, cache_ttl: float = 86400,
+                 connect_options=None):
+        self.urls = list(dict.fromkeys(urls))
+        self.connect_options = connect_options or (lambda url: {})
+        self.path = path
+        self.cache_path = cache_path
+        self.timeout = timeout
+        self.cache_ttl = cache_ttl
+        self.current = self.urls[0]
+        self.probes = {}            # url → kết quả probe gần nhất
+        self.from_cache = False
+        self._load_cache()
+
+    @property
+    def multiple(self) -> bool:
+        return len(self.urls) > 1
+
+    # ---------- cache ----------
+    def _load_cache(self):
+        try:
+            with open(self.cache_path, encoding='utf-8') as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.probes = {url: p for url, p in cache.get('probes', {}).items() if url in self.urls}
+        last_good = cache.get('last_good')
+        if last_good in self.urls and time.time() - cache.get('at', 0) < self.cache_ttl:
+            self.current = last_good
+            self.from_cache = True
+
+    def _save_cache(self):
+        tmp = f"{self.cache_path}.tmp"
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({'last_good': self.current, 'at': time.time(), 'probes': self.probes}, f, indent=1)
+            os.replace(tmp, self.cache_path)
+        except OSError as e:
+            print(f"⚠️ Endpoint cache write error: {e}")
+
+    def mark_good(self, url: str):
+        """Kết nối thành công → lần khởi động sau dùng luôn server này."""
+        if self.multiple and url == self.current:
+            self._save_cache()
+
+    def set_urls(self, urls: list):
+        """API_URL đổi lúc đang chạy: dùng server đầu tiên trong danh sách mới (nhiều server → probe lại)."""
+        self.urls = list(dict.fromkeys(urls))
+        self.current = self.urls[0]
+        self.probes = {}
+        self.from_cache = False
+
+    # ---------- chọn ----------
+    async def probe_all(self) -> list:
+        """Probe mọi endpoint cùng lúc; trả danh sách còn sống, nhanh nhất trước."""
+        results = await asyncio.gather(*(probe_endpoint(url, self.path, self.timeout, **self.connect_options(url))
+                                         for url in self.urls))
+        self.probes = {r['url']: r for r in results}
+        for r in results:
+            status = f"connect {r['connect_ms']:.0f}ms + rtt {r['rtt_ms']:.0f}ms" if r['ok'] else f"❌ {r['error']}"
+            print(f"   📡 {r['url']}: {status}")
+        healthy = [r for r in results if r['ok']]
+        return sorted(healthy, key=lambda r: r['connect_ms'] + r['rtt_ms'])
+
+    async def select(self) -> bool:
+        """Chọn endpoint tốt nhất. True nếu đổi endpoint. Không có endpoint nào sống → giữ nguyên."""
+        if not self.multiple:
+            return False
+        healthy = await self.probe_all()
+        if not healthy:
+            return False
+        previous, self.current = self.current, healthy[0]['url']
+        self._save_cache()
+        return self.current != previous
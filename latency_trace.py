@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Đo độ trễ end-to-end theo từng câu nói: từ lúc ngừng nói tới khi ký hiệu hiện trên LCD.
+
+Mỗi câu (segment VAD) có 1 trace_id; các mốc (mark) ghi time.monotonic():
+    speech_start → speech_end → segment_end → sent → result → enqueued → planned → first_frame
+- speech_end:  frame cuối còn tiếng nói (segment_end đến sau đó 1 khoảng hangover)
+- sent:        gửi xong segment, gắn với seq trên wire (server trả result cùng seq)
+
+Lưu trong ring buffer (deque maxlen), xuất ra:
+- JSON lines: 1 mark / dòng
+- Chrome trace (chrome://tracing, ui.perfetto.dev): mỗi câu 1 hàng, mỗi giai đoạn 1 span
+"""
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+MARKS = ('speech_start', 'speech_end', 'segment_end', 'sent', 'result', 'enqueued', 'planned', 'first_frame')
+# (từ mark, tới mark, tên giai đoạn)
+STAGES = (
+    ('speech_start', 'speech_end', 'speech'),
+    ('speech_end', 'segment_end', 'hangover'),
+    ('segment_end', 'sent', 'upload'),
+    ('sent', 'result', 'server'),
+    ('result', 'enqueued', 'receive'),
+    ('enqueued', 'planned', 'queue'),
+    ('planned', 'first_frame', 'render'),
+)
+
+
+class LatencyTracer:
+    """Thread-safe: mark từ event loop (VAD, send, receive) và video worker thread."""
+
+    def __init__(self, max_events: int = 4096, max_segments: int = 64, enabled: bool = True):
+        self.enabled = enabled
+        self.events = deque(maxlen=max_events)   # (trace_id, name, t_monotonic, t_wall, thread, args)
+        self.segments = OrderedDict()            # trace_id → {mark: t_monotonic}
+        self.max_segments = max_segments
+        self.seq_to_trace = {}                   # seq trên wire → trace_id
+        self.awaiting_result = deque()           # trace_id đã gửi, chưa có result (server không trả seq)
+        self.next_id = 0
+        self.lock = threading.Lock()
+
+    # ---------- ghi ----------
+    def new_segment(self) -> int:
+        with self.lock:
+            self.next_id += 1
+            return self.next_id
+
+    def mark(self, trace_id, name: str, t: float = None, **args):
+        if not self.enabled or trace_id is None:
+            return
+        t = time.monotonic() if t is None else t
+        wall = time.time() - (time.monotonic() - t)
+        with self.lock:
+            self.events.append((trace_id, name, t, wall, threading.current_thread().name, args))
+            marks = self.segments.get(trace_id)
+            if marks is None:
+                marks = self.segments[trace_id] = {}
+                while len(self.segments) > self.max_segments:
+                    old_id, _ = self.segments.popitem(last=False)
+                    self._forget(old_id)
+            marks.setdefault(name, t)
+
+    def _forget(self, trace_id):
+        for seq in [s for s, tid in self.seq_to_trace.items() if tid == trace_id]:
+            del self.seq_to_trace[seq]
+        try:
+            self.awaiting_result.remove(trace_id)
+        except ValueError:
+            pass
+
+    def bind_seq(self, trace_id, seq: int):
+        """Segment vừa gửi xong với seq này (ghép result về sau)."""
+        if not self.enabled or trace_id is None:
+            return
+        with self.lock:
+            self.seq_to_trace[seq] = trace_id
+            self.awaiting_result.append(trace_id)
+
+    def match_result(self, seq=None, fifo: bool = True):
+        """trace_id của result: theo seq nếu có, không thì segment gửi sớm nhất chưa có result."""
+        with self.lock:
+            trace_id = self.seq_to_trace.pop(seq, None) if isinstance(seq, int) else None
+            if trace_id is None and fifo and seq is None and self.awaiting_result:
+                trace_id = self.awaiting_result[0]
+            if trace_id is not None:
+                try:
+                    self.awaiting_result.remove(trace_id)
+                except ValueError:
+                    pass
+            return trace_id
+
+    # ---------- đọc ----------
+    def summary(self, trace_id) -> dict:
+        """ms của từng giai đoạn (chỉ giai đoạn có đủ 2 mark) + total = speech_end → first_frame."""
+        with self.lock:
+            marks = dict(self.segments.get(trace_id, {}))
+        result = {}
+        for start, end, stage in STAGES:
+            if start in marks and end in marks:
+                result[stage] = round((marks[end] - marks[start]) * 1000, 1)
+        if 'speech_end' in marks and 'first_frame' in marks:
+            result['total'] = round((marks['first_frame'] - marks['speech_end']) * 1000, 1)
+        return result
+
+    def format_summary(self, trace_id) -> str:
+        summary = self.summary(trace_id)
+        stages = ' · '.join(f"{stage} {summary[stage]:.0f}" for _, _, stage in STAGES[1:] if stage in summary)
+        total = f"speech end → first frame {summary['total']:.0f}ms" if 'total' in summary else "incomplete"
+        return f"Trace #{trace_id}: {total} | {stages}"
+
+    # ---------- xuất ----------
+    def _snapshot(self) -> list:
+        with self.lock:
+            return list(self.events)
+
+    def export_jsonl(self, path: str) -> int:
+        events = self._snapshot()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            for trace_id, name, t, wall, thread, args in events:
+                f.write(json.dumps({'trace_id': trace_id, 'mark': name, 't': round(t, 6),
+                                    'wall': round(wall, 6), 'thread': thread, **args},
+                                   ensure_ascii=False) + '\n')
+        return len(events)
+
+    def export_chrome(self, path: str) -> int:
+        """Chrome trace event format: span 'X' cho từng giai đoạn, instant 'i' cho từng mark."""
+        events = self._snapshot()
+        marks = {}
+        for trace_id, name, t, _, _, _ in events:
+            marks.setdefault(trace_id, {}).setdefault(name, t)
+
+        trace = []
+        for trace_id, seg_marks in marks.items():
+            trace.append({'ph': 'M', 'name': 'thread_name', 'pid': 1, 'tid': trace_id,
+                          'args': {'name': f"segment #{trace_id}"}})
+            for start, end, stage in STAGES:
+                if start in seg_marks and end in seg_marks:
+                    trace.append({'ph': 'X', 'name': stage, 'cat': 'latency', 'pid': 1, 'tid': trace_id,
+                                  'ts': seg_marks[start] * 1e6,
+                                  'dur': (seg_marks[end] - seg_marks[start]) * 1e6})
+        for trace_id, name, t, _, thread, args in events:
+            trace.append({'ph': 'i', 's': 't', 'name': name, 'cat': 'mark', 'pid': 1, 'tid': trace_id,
+                          'ts': t * 1e6, 'args': {'thread': thread, **args}})
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms'}, f, ensure_ascii=False)
+        return len(events)
@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+MOCK SERVER - WebSocket server giả lập VSL backend (không cần backend thật)
+==========================================================================
+Cùng endpoint với server thật: ws://<host>:<port>/api/realtime/ws/vsl
+
+- Gửi 'connected' khi client kết nối, trả 'pong' cho 'ping'
+- Mỗi segment (batch: 1 binary message, stream: segment_start → audio → segment_end):
+    'ack' (seq) ngay, rồi sau --result-delay (± --result-jitter) giây trả 1 trong:
+    'result' (words lấy ngẫu nhiên từ tên clip trong video/), 'filtered' (--filter-rate),
+    'error' (--error-rate) hoặc không trả gì (--lose-rate, server mất kết quả)
+- Segment xử lý lần lượt như 1 worker ASR: client nói nhanh hơn server → result bị dồn
+- Stream mode: 'buffering' (progress) khi nhận audio; --partial: 'partial' trước 'result'
+- In 'playback' report của client (queue phát video, thời gian phát hết) khi thay đổi
+- Wire protocol: chọn subprotocol binary (vsl.v1.msgpack / cbor) nếu client đề nghị, --json: chỉ JSON
+- Session resume: nhận {'type': 'session', 'session_id', ...} → trả {'type': 'resumed', 'last_ack'}
+- Flaky: cứ --drop-every giây (± jitter) đóng mọi kết nối, sau đó từ chối kết nối (HTTP 503)
+  trong --outage giây. --forget: quên session sau mỗi outage (giống server restart).
+- In thời gian client kết nối lại sau mỗi outage (time-to-recover).
+- TLS (wss://) với --tls-cert / --tls-key (chứng chỉ self-signed, client dùng TLS_CA_FILE=cert)
+
+Kịch bản (--scenario file.json): ghi đè tham số trên, 'phases' đổi tham số theo thời gian
+(giây từ lúc server chạy), 'outage' trong phase = rớt mọi kết nối tại thời điểm đó:
+    {"result_delay": 0.4, "vocab": ["xin chào", "cảm ơn"],
+     "phases": [{"at": 20, "result_delay": 2.0, "filter_rate": 0.3},
+                {"at": 40, "outage": 5},
+                {"at": 50, "result_delay": 0.4, "error_rate": 0.1}]}
+
+Chạy:  python3 mock_server.py --port 8765 --drop-every 20 --outage 5
+       python3 mock_server.py --result-delay 1.5 --filter-rate 0.2 --partial --scenario slow.json
+Pi:    API_URL=ws://<ip máy chạy mock>:8765 python3 real_time.py
+Tải:   python3 test_load.py (chạy client thật với audio từ file + mock server này)
+"""
+
+import argparse
+import asyncio
+import http
+import json
+import os
+import random
+import ssl
+import statistics
+import time
+from pathlib import Path
+
+import websockets
+
+from wire_protocol import available_subprotocols, create_protocol
+
+WS_ENDPOINT = "/api/realtime/ws/vsl"
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+VIDEO_DIR = os.path.join(SCRIPT_DIR, "video")
+
+BUFFERING_SEC = 1.0          # Stream mode: progress 100% khi nhận đủ ngần này giây audio
+BYTES_PER_SEC = 16000 * 2    # PCM 16kHz mono (codec khác → progress chỉ tương đối)
+SETTINGS = ('result_delay', 'result_jitter', 'words_min', 'words_max',
+            'filter_rate', 'error_rate', 'lose_rate', 'partial', 'buffering')
+
+
+def load_vocabulary(video_dir: str = VIDEO_DIR) -> list:
+    """Từ / cụm từ có clip: 'bao_nhiêu_tiền.mp4' → 'bao nhiêu tiền'."""
+    words = set()
+    for ext in ('*.mp4', '*.webm'):
+        for f in Path(video_dir).glob(ext):
+            word = f.stem.strip('_').replace('_', ' ').strip()
+            if any(ch.isalnum() for ch in word):
+                words.add(word.lower())
+    return sorted(words)
+
+
+class Scenario:
+    """Tham số mock theo thời gian: giá trị gốc (CLI / file) + các phase {'at': giây, ...}."""
+
+    def __init__(self, args):
+        self.base = {name: getattr(args, name) for name in SETTINGS}
+        self.phases = []
+        self.vocab = None
+        if args.scenario:
+            with open(args.scenario, encoding='utf-8') as f:
+                script = json.load(f)
+            self.phases = sorted(script.pop('phases', []), key=lambda p: p.get('at', 0))
+            self.vocab = script.pop('vocab', None)
+            self.base.update(script)
+        if not self.vocab:
+            self.vocab = load_vocabulary() or ['xin chào']
+        self.started_at = time.monotonic()
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    def current(self) -> dict:
+        settings = dict(self.base, vocab=self.vocab)
+        now = self.elapsed()
+        for phase in self.phases:
+            if phase.get('at', 0) > now:
+                break
+            settings.update({k: v for k, v in phase.items() if k not in ('at', 'outage')})
+        return settings
+
+    def outages(self) -> list:
+        return [(p.get('at', 0), p['outage']) for p in self.phases if p.get('outage')]
+
+
+class MockServer:
+    def __init__(self, args):
+        self.args = args
+        self.scenario = Scenario(args)
+        self.sessions = {}        # session_id → số segment đã nhận
+        self.connections = set()
+        self.down_until = 0.0     # Đang outage tới thời điểm này
+        self.outage_ended_at = None
+        self.recover_times = []
+        self.stats = {'segments': 0, 'result': 0, 'filtered': 0, 'error': 0, 'lost': 0,
+                      'partial': 0, 'max_backlog': 0, 'connections': 0}
+        if args.seed is not None:
+            random.seed(args.seed)
+
+    # ---------- flaky ----------
+    def process_request(self, connection, request):
+        if request.path != WS_ENDPOINT:
+            return connection.respond(http.HTTPStatus.NOT_FOUND, "Not found\n")
+        if time.monotonic() < self.down_until:
+            return connection.respond(http.HTTPStatus.SERVICE_UNAVAILABLE, "Outage\n")
+        return None
+
+    async def outage(self, seconds: float):
+        print(f"💥 Dropping {len(self.connections)} connection(s), outage {seconds:.1f}s")
+        self.down_until = time.monotonic() + seconds
+        if self.args.forget:
+            self.sessions.clear()
+        for ws in list(self.connections):
+            await ws.close(code=1012, reason="mock outage")
+        await asyncio.sleep(seconds)
+        self.outage_ended_at = time.monotonic()
+        print("✅ Outage over")
+
+    async def chaos(self):
+        while True:
+            jitter = random.uniform(-0.2, 0.2) * self.args.drop_every
+            await asyncio.sleep(self.args.drop_every + jitter)
+            await self.outage(self.args.outage)
+
+    async def scripted_outages(self):
+        for at, seconds in self.scenario.outages():
+            await asyncio.sleep(max(0.0, at - self.scenario.elapsed()))
+            await self.outage(seconds)
+
+    # ---------- protocol ----------
+    async def handler(self, ws):
+        if self.outage_ended_at is not None:
+            recover = time.monotonic() - self.outage_ended_at
+            self.recover_times.append(recover)
+            self.outage_ended_at = None
+            print(f"🔁 Client recovered {recover:.2f}s after outage "
+                  f"(median {statistics.median(self.recover_times):.2f}s over {len(self.recover_times)})")
+
+        self.connections.add(ws)
+        self.stats['connections'] += 1
+        wire = create_protocol(ws.subprotocol)
+        segments = asyncio.Queue()   # seq chờ "ASR" xử lý
+        worker = asyncio.create_task(self.recognize(ws, wire, segments))
+        session_id = None
+        stream_mode = False
+        local_seq = 0                # Không có session: seq đếm theo kết nối
+        segment_bytes = 0
+        last_progress = 0
+        last_playback = None
+        try:
+            await ws.send(wire.encode({'type': 'connected', 'message': f'mock server ({wire.name})'}))
+            async for message in ws:
+                data = wire.decode(message)
+                msg_type = data.get('type')
+                if msg_type == 'audio':
+                    if stream_mode:
+                        segment_bytes += len(data.get('data', b''))
+                        progress = min(1.0, segment_bytes / (BYTES_PER_SEC * BUFFERING_SEC))
+                        if self.scenario.current()['buffering'] and progress - last_progress >= 0.25:
+                            last_progress = progress
+                            await ws.send(wire.encode({'type': 'buffering', 'progress': round(progress, 2)}))
+                    else:
+                        local_seq = await self.end_segment(ws, wire, session_id, local_seq, segments)
+                elif msg_type == 'session':
+                    session_id = data.get('session_id')
+                    last_ack = self.sessions.setdefault(session_id, 0)
+                    print(f"🆔 Session {session_id} resume={data.get('resume')} "
+                          f"client_sent={data.get('segments_sent')} server_ack={last_ack} [{wire.name}]")
+                    await ws.send(wire.encode({'type': 'resumed', 'session_id': session_id, 'last_ack': last_ack}))
+                elif msg_type == 'segment_start':
+                    stream_mode = True
+                    segment_bytes = last_progress = 0
+                elif msg_type == 'segment_end':
+                    local_seq = await self.end_segment(ws, wire, session_id, local_seq, segments)
+                elif msg_type == 'playback':
+                    key = (data.get('job_id'), data.get('pending'), data.get('dropped'))
+                    if key != last_playback:
+                        last_playback = key
+                        print(f"📺 Playback: job={data.get('job_id')} pending={data.get('pending')} "
+                              f"drain={data.get('drain_sec')}s dropped={data.get('dropped')}")
+                elif msg_type == 'ping':
+                    await ws.send(wire.encode({'type': 'pong'}))
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            worker.cancel()
+            self.connections.discard(ws)
+
+    async def end_segment(self, ws, wire, session_id, local_seq, segments) -> int:
+        """Ack segment vừa nhận xong và đưa vào hàng đợi nhận dạng."""
+        if session_id is not None:
+            seq = self.sessions.get(session_id, 0) + 1
+            self.sessions[session_id] = seq
+            await ws.send(wire.encode({'type': 'ack', 'seq': seq}, seq))
+        else:
+            seq = local_seq = local_seq + 1
+        self.stats['segments'] += 1
+        segments.put_nowait((seq, time.monotonic()))
+        self.stats['max_backlog'] = max(self.stats['max_backlog'], segments.qsize())
+        return local_seq
+
+    async def recognize(self, ws, wire, segments):
+        """1 worker / kết nối: mỗi segment tốn result_delay (± jitter) giây, trả theo thứ tự nhận."""
+        while True:
+            seq, _ = await segments.get()
+            settings = self.scenario.current()
+            delay = max(0.0, random.gauss(settings['result_delay'], settings['result_jitter']))
+            words = random.sample(settings['vocab'], min(len(settings['vocab']),
+                                                         random.randint(settings['words_min'], settings['words_max'])))
+            transcript = ' '.join(words)
+
+            if settings['partial'] and len(words) > 1:
+                await asyncio.sleep(delay / 2)
+                delay /= 2
+                partial = words[:(len(words) + 1) // 2]
+                await ws.send(wire.encode({'type': 'partial', 'seq': seq, 'words': partial,
+                                           'transcript': ' '.join(partial)}, seq))
+                self.stats['partial'] += 1
+            await asyncio.sleep(delay)
+
+            roll = random.random()
+            if roll < settings['lose_rate']:
+                self.stats['lost'] += 1
+                continue
+            roll -= settings['lose_rate']
+            if roll < settings['error_rate']:
+                message = {'type': 'error', 'seq': seq, 'error': 'mock recognition failure'}
+            elif roll < settings['error_rate'] + settings['filter_rate']:
+                message = {'type': 'filtered', 'seq': seq, 'reason': 'mock_filter', 'transcript': transcript}
+            else:
+                message = {'type': 'result', 'seq': seq, 'transcript': transcript, 'words': words,
+                           'vsl_text': transcript, 'original_text': transcript,
+                           'confidence': round(random.uniform(0.7, 0.99), 2)}
+            self.stats[message['type']] += 1
+            await ws.send(wire.encode(message, seq))
+
+    def select_subprotocol(self, connection, offered):
+        """Chọn binary nếu client đề nghị; không có → None (JSON) thay vì từ chối như mặc định."""
+        supported = [] if self.args.json else available_subprotocols()
+        for name in supported:
+            if name in offered:
+                return name
+        return None
+
+    def tls_context(self):
+        if not self.args.tls_cert:
+            return None
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(self.args.tls_cert, self.args.tls_key)
+        return context
+
+    async def run(self, ready: asyncio.Event = None):
+        tls = self.tls_context()
+        async with websockets.serve(self.handler, self.args.host, self.args.port,
+                                    process_request=self.process_request,
+                                    select_subprotocol=self.select_subprotocol, ssl=tls):
+            scheme = 'wss' if tls else 'ws'
+            print(f"🧪 Mock server {scheme}://{self.args.host}:{self.args.port}{WS_ENDPOINT} "
+                  f"({len(self.scenario.vocab)} words, {len(self.scenario.phases)} phases)")
+            self.scenario.started_at = time.monotonic()
+            if ready is not None:
+                ready.set()
+            tasks = [asyncio.create_task(self.scripted_outages())]
+            if self.args.drop_every > 0:
+                tasks.append(asyncio.create_task(self.chaos()))
+            try:
+                await asyncio.Future()
+            finally:
+                for task in tasks:
+                    task.cancel()
+
+
+def add_mock_arguments(parser: argparse.ArgumentParser):
+    """Tham số mock (dùng chung với test_load.py)."""
+    parser.add_argument('--drop-every', type=float, default=0, help="Giây giữa các lần rớt kết nối (0 = không)")
+    parser.add_argument('--outage', type=float, default=5.0, help="Giây từ chối kết nối sau mỗi lần rớt")
+    parser.add_argument('--forget', action='store_true', help="Quên session sau outage (server restart)")
+    parser.add_argument('--json', action='store_true', help="Không nhận binary protocol (giống server cũ)")
+    parser.add_argument('--result-delay', dest='result_delay', type=float, default=0.5,
+                        help="Giây xử lý mỗi segment trước khi trả result")
+    parser.add_argument('--result-jitter', dest='result_jitter', type=float, default=0.1,
+                        help="Độ lệch chuẩn của result delay (giây)")
+    parser.add_argument('--words', type=int, nargs=2, default=(1, 4), metavar=('MIN', 'MAX'),
+                        help="Số từ mỗi result")
+    parser.add_argument('--filter-rate', dest='filter_rate', type=float, default=0.0, help="Tỉ lệ segment trả 'filtered'")
+    parser.add_argument('--error-rate', dest='error_rate', type=float, default=0.0, help="Tỉ lệ segment trả 'error'")
+    parser.add_argument('--lose-rate', dest='lose_rate', type=float, default=0.0,
+                        help="Tỉ lệ segment không trả gì (server mất kết quả)")
+    parser.add_argument('--partial', action='store_true', help="Gửi 'partial' giữa chừng trước 'result'")
+    parser.add_argument('--no-buffering', dest='buffering', action='store_false',
+                        help="Không gửi 'buffering' khi nhận audio (stream mode)")
+    parser.add_argument('--scenario', help="File JSON kịch bản (ghi đè tham số, phases theo thời gian)")
+    parser.add_argument('--seed', type=int, help="Random seed (lặp lại đúng kịch bản)")
+    parser.add_argument('--tls-cert', dest='tls_cert', help="Chứng chỉ PEM → wss://")
+    parser.add_argument('--tls-key', dest='tls_key', help="Private key PEM (mặc định: nằm trong --tls-cert)")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Mock VSL WebSocket server")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8765)
+    add_mock_arguments(parser)
+    args = parser.parse_args(argv)
+    args.words_min, args.words_max = args.words
+    return args
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(MockServer(parse_args()).run())
+    except KeyboardInterrupt:
+        print("\n👋 Bye")
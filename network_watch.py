@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Phát hiện mạng thay đổi (WiFi lên lại, đổi IP, đổi default route) để reconnect ngay
+thay vì chờ hết backoff.
+
+- Linux: rtnetlink socket (RTMGRP_LINK | IPV4_IFADDR | IPV4_ROUTE), không cần root
+- Không có netlink: poll /proc/net/route (default route) mỗi poll_sec giây
+"""
+
+import asyncio
+import socket
+
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV4_ROUTE = 0x40
+
+
+def default_route_signature() -> str:
+    """Interface + gateway của các default route (rỗng nếu không có mạng)."""
+    try:
+        with open('/proc/net/route') as f:
+            lines = f.read().splitlines()[1:]
+    except OSError:
+        return ''
+    routes = []
+    for line in lines:
+        fields = line.split()
+        if len(fields) > 2 and fields[1] == '00000000':
+            routes.append(f"{fields[0]}:{fields[2]}")
+    return ','.join(sorted(routes))
+
+
+class NetworkWatcher:
+    """
+    changed (asyncio.Event) được set khi mạng thay đổi, bên chờ tự clear sau khi xử lý
+    (vòng reconnect chờ chung với nút bấm / đổi server qua wait_any). Tạo trong event loop sử dụng nó.
+    """
+
+    def __init__(self, poll_sec: float = 2.0):
+        self.poll_sec = poll_sec
+        self.changed = asyncio.Event()
+        self.sock = None
+        self.poll_task = None
+        self.loop = asyncio.get_running_loop()
+        try:
+            self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+            self.sock.bind((0, RTMGRP_LINK | RTMGRP_IPV4_IFADDR | RTMGRP_IPV4_ROUTE))
+            self.sock.setblocking(False)
+            self.loop.add_reader(self.sock.fileno(), self._on_netlink)
+            self.mode = 'netlink'
+        except (AttributeError, OSError):
+            if self.sock:
+                self.sock.close()
+            self.sock = None
+            self.poll_task = asyncio.create_task(self._poll_routes())
+            self.mode = 'poll'
+
+    def _on_netlink(self):
+        try:
+            while self.sock.recv(65536):
+                pass
+        except BlockingIOError:
+            pass
+        except OSError:
+            return
+        self.changed.set()
+
+    async def _poll_routes(self):
+        last = default_route_signature()
+        while True:
+            await asyncio.sleep(self.poll_sec)
+            current = default_route_signature()
+            if current != last:
+                last = current
+                self.changed.set()
+
+    def close(self):
+        if self.sock:
+            self.loop.remove_reader(self.sock.fileno())
+            self.sock.close()
+            self.sock = None
+        if self.poll_task:
+            self.poll_task.cancel()
+            self.poll_task = None
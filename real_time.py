@@ -7,21 +7,36 @@ import spidev
 import RPi.GPIO as GPIO
 import time
 import os
-import subprocess
 import asyncio
 import websockets
+from websockets.extensions.permessage_deflate import ClientPerMessageDeflateFactory
 import json
+import math
+import random
+import uuid
 import threading
 import re
+import signal
 import struct
 import queue
+import unicodedata
 from collections import deque
 from pathlib import Path
-from dotenv import load_dotenv
+from dotenv import dotenv_values, load_dotenv
 from PIL import Image, ImageDraw, ImageFont
 from dataclasses import dataclass
+from functools import lru_cache
 from typing import List, Optional
 
+from audio_codec import create_codec, downsample_pcm
+from audio_source import create_audio_source
+from audio_spool import AudioSpool
+from endpoint_probe import EndpointSelector
+from latency_trace import LatencyTracer
+from network_watch import NetworkWatcher
+from tls_session import ResumingSSLContext, create_tls_context
+from wire_protocol import JsonProtocol, available_subprotocols, create_protocol
+
 # WebRTC VAD for speech detection
 try:
     import webrtcvad
@@ -32,15 +47,20 @@ except ImportError:
 
 # ============ LOAD .ENV ============
 load_dotenv()
-_api_url = os.getenv("API_URL", "ws://172.20.10.11:8000")
+def _to_ws_url(url: str) -> str:
+    # Auto-convert http:// to ws://
+    if url.startswith("http://"):
+        return url.replace("http://", "ws://", 1)
+    if url.startswith("https://"):
+        return url.replace("https://", "wss://", 1)
+    return url
+
+def parse_api_urls(value: str) -> list:
+    # Nhiều server cách nhau dấu phẩy: API_URL=ws://a:8000,ws://b:8000 → probe, chọn server nhanh nhất
+    return [_to_ws_url(u.strip()) for u in value.split(",") if u.strip()]
 
-# Auto-convert http:// to ws://
-if _api_url.startswith("http://"):
-    API_URL = _api_url.replace("http://", "ws://", 1)
-elif _api_url.startswith("https://"):
-    API_URL = _api_url.replace("https://", "wss://", 1)
-else:
-    API_URL = _api_url
+API_URLS = parse_api_urls(os.getenv("API_URL", "ws://172.20.10.11:8000"))
+API_URL = API_URLS[0]
 
 WS_ENDPOINT = "/api/realtime/ws/vsl"
 
@@ -48,8 +68,29 @@ VIDEO_SPEED = 2.0
 FINGERSPELL_SPEED = 3.5
 
 # ============ CONNECTION SETTINGS ============
-RECONNECT_DELAY = 3
-MAX_RECONNECT_ATTEMPTS = 5
+# Reconnect không giới hạn: chờ ngẫu nhiên trong [cap/2, cap], cap = BASE x 2^(n-1) tối đa MAX_DELAY
+RECONNECT_BASE_DELAY = 1.0
+RECONNECT_MAX_DELAY = 30.0
+RECONNECT_STABLE_SEC = 5.0             # Session sống lâu hơn → reset backoff (tránh connect/drop liên tục)
+MAX_RECONNECT_ATTEMPTS = 5             # Thất bại liên tiếp → báo offline trên LCD
+SESSION_RESUME = os.getenv("SESSION_RESUME", "1").strip() != "0"  # Gửi handshake 'session' khi connect
+SESSION_HANDSHAKE_TIMEOUT = 2.0
+NETWORK_POLL_SEC = 2.0                 # Fallback khi không có netlink
+ENDPOINT_PROBE_TIMEOUT = 2.0           # Nhiều API_URL: connect + ping/pong tối đa ngần này giây / server
+ENDPOINT_CACHE_TTL_SEC = 24 * 3600     # Server tốt lần trước còn dùng thẳng (không probe) trong khoảng này
+CONFIG_POLL_SEC = 1.0                  # BLE ghi API_URL mới vào .env → đổi server trong ~1s, không restart service
+CONFIG_DRAIN_SEC = 2.0                 # Đổi server: chờ câu đang nói gửi xong + result còn thiếu tối đa ngần này
+# auto: đề nghị binary framing (msgpack/CBOR nếu đã cài), server cũ → JSON | json: luôn JSON
+WIRE_PROTOCOL = os.getenv("WIRE_PROTOCOL", "auto").strip().lower()
+# wss://: 1 SSLContext dùng chung, resume TLS session khi reconnect | TLS_CA_FILE: CA riêng (server self-signed)
+TLS_SESSION_RESUME = os.getenv("TLS_SESSION_RESUME", "1").strip() != "0"
+TLS_CA_FILE = os.getenv("TLS_CA_FILE", "").strip() or None
+# permessage-deflate: deflate = nén result JSON (cửa sổ nhỏ đỡ RAM/CPU khi nén audio gửi đi) | off = không nén
+WS_COMPRESSION = os.getenv("WS_COMPRESSION", "deflate").strip().lower()
+# RAM bộ nén zlib = (1 << (window_bits + 2)) + (1 << (mem_level + 9)):
+# 12 / 5 → 16KB + 16KB, thay vì 128KB + 16KB của websockets mặc định (15 / 5)
+WS_DEFLATE_WINDOW_BITS = 12            # Cửa sổ 4KB thay vì 32KB (result JSON vài trăm bytes)
+WS_DEFLATE_MEM_LEVEL = 5               # Giữ như websockets mặc định (zlib mặc định 8 = 128KB)
 
 # ============ VAD SETTINGS (ULTRA SENSITIVE - mic cùi, âm lượng rất nhỏ) ============
 SAMPLE_RATE = 16000
@@ -57,6 +98,7 @@ CHANNELS = 1
 
 FRAME_DURATION_MS = 30
 FRAME_SIZE = SAMPLE_RATE * FRAME_DURATION_MS // 1000  # 480 samples
+AUDIO_RING_SECONDS = 30                # Ring buffer PCM cấp phát sẵn (~960KB), segment gửi đi là memoryview vào ring
 
 PREROLL_FRAMES = 25                    # 750ms - giữ thật nhiều context đầu
 HANGOVER_FRAMES = 50                   # 1500ms - giữ rất lâu tránh cắt giữa câu
@@ -64,13 +106,78 @@ MIN_SPEECH_FRAMES = 1                  # 30ms - giữ cả đoạn cực ngắn
 
 # NOTE: SEND_INTERVAL_* removed - no longer needed, always send immediately
 
-MIN_RMS_THRESHOLD = 0                  # KHÔNG gate RMS - chấp nhận mọi âm thanh
+MIN_RMS_THRESHOLD = 0                  # Sàn tuyệt đối cho ngưỡng RMS (0 = chỉ dựa vào noise floor)
 MAX_RMS_THRESHOLD = 32767              # max int16 - không bỏ clipping
 
 # NOTE: Cooldown removed - audio stream always runs regardless of video playback
 NOISE_CALIBRATION_FRAMES = 50          # ~1.5s calibration
-
-MAX_PENDING_BATCHES = 5
+NOISE_FLOOR_PERCENTILE = 20            # Noise floor = percentile thấp của RMS lúc calibrate (chịu được nói ngay từ đầu)
+NOISE_FLOOR_MULTIPLIER = 2.0           # Speech khi RMS >= noise floor x 2 (mic yếu → không để cao)
+NOISE_FLOOR_ADAPT_RATE = 0.05          # EMA cập nhật noise floor trên frame không phải speech
+
+# ============ SEND QUEUE ============
+# Capture → SendQueue → sender task: ws.send chậm không chặn đọc mic
+MAX_PENDING_BATCHES = 5                # Số message audio tối đa chờ gửi (control không tính)
+# drop_oldest: bỏ audio cũ nhất | merge: nối vào audio cuối hàng đợi | spill: ghi tạm ra đĩa
+SEND_QUEUE_POLICY = os.getenv("SEND_QUEUE_POLICY", "drop_oldest").strip().lower()
+SEND_QUEUE_DRAIN_SEC = 2.0             # Thời gian chờ gửi nốt hàng đợi khi dừng stream
+SEND_MAX_AGE_SEC = 20.0                # Audio chờ lâu hơn → bỏ (quá cũ, server trả result cũng không còn ý nghĩa)
+
+# ============ STREAM MODE ============
+# batch:  gửi cả segment (binary) khi hết câu
+# stream: gửi chunk STREAM_CHUNK_MS ngay khi có speech, kèm segment_start / segment_end (JSON)
+STREAM_MODE = os.getenv("STREAM_MODE", "batch").strip().lower()
+STREAM_CHUNK_MS = 200
+
+# Codec uplink: pcm | mulaw | alaw | opus (báo server qua handshake 'audio_config')
+AUDIO_CODEC = os.getenv("AUDIO_CODEC", "pcm").strip().lower()
+
+# ============ UPLINK RATE CONTROL ============
+# Level 0 = chất lượng cấu hình, càng cao càng nhẹ. Mỗi lần đổi level gửi lại 'audio_config'.
+UPLINK_LEVELS = [
+    {'codec': AUDIO_CODEC, 'sample_rate': SAMPLE_RATE, 'chunk_ms': STREAM_CHUNK_MS},
+    {'codec': 'mulaw', 'sample_rate': SAMPLE_RATE, 'chunk_ms': 200},
+    {'codec': 'mulaw', 'sample_rate': 8000, 'chunk_ms': 300},
+]
+UPLINK_SLOW_RATIO = 0.5                # send time / audio duration (EMA) > 0.5 → hạ level
+UPLINK_FAST_RATIO = 0.1                # < 0.1 liên tục UPLINK_RECOVER_SENDS lần → nâng level
+UPLINK_RECOVER_SENDS = 20
+UPLINK_MAX_BACKLOG_BYTES = 64 * 1024   # Socket write buffer tồn đọng → hạ level ngay
+UPLINK_MIN_HOLD_SEC = 5.0              # Giữ level tối thiểu giữa 2 lần đổi
+
+# ============ OFFLINE SPOOL ============
+# Mất kết nối: segment vẫn được tách và ghi ra đĩa, có mạng lại thì gửi bù theo thứ tự
+SPOOL_ENABLED = os.getenv("SPOOL_ENABLED", "1").strip() != "0"
+SPOOL_MAX_MB = 50                      # Đầy → bỏ segment cũ nhất
+SPOOL_DRAIN_SPEED = 2.0                # Gửi bù tối đa nhanh gấp 2 real-time (không dồn server)
+SPOOL_RESULT_MAX_AGE_SEC = float(os.getenv("SPOOL_RESULT_MAX_AGE_SEC", "120"))  # Kết quả cũ hơn → không phát
+
+# ============ FUZZY MATCH SETTINGS ============
+FUZZY_MAX_DISTANCE = 2                 # 1 = sai dấu, 2 = sai 2 dấu hoặc thừa/thiếu 1 chữ (không đổi chữ: 'tieng' ≠ 'mieng')
+FUZZY_MIN_WORD_LEN = 6                 # Từ ngắn hơn chỉ cho phép sai 1 dấu (tránh "chào" → "cho")
+FUZZY_CACHE_MAX = 512
+BASE_FORM_CACHE_MAX = 8192             # Tên clip (~3.600) + từ server gửi
+
+# ============ NUMBER SETTINGS ============
+NUMBER_MAX_DIGITS = 12                 # Đọc tới hàng trăm tỷ, dài hơn thì đánh vần từng số
+NUMBER_CACHE_MAX = 512
+
+# ============ CLIP PREFETCH ============
+# Server gửi 'partial' (words tạm) → mở sẵn clip + decode frame đầu trước khi có 'result' cuối
+SPECULATIVE_PREFETCH = os.getenv("SPECULATIVE_PREFETCH", "1").strip() != "0"
+PREFETCH_MAX_CLIPS = 4                 # Clip mở sẵn tối đa (mỗi clip giữ 1 decoder + 1 frame)
+PREFETCH_PAGE_CACHE_CLIPS = 16         # Clip được fadvise(WILLNEED) vào page cache (rẻ, không decode)
+PREFETCH_TTL_SEC = 10.0                # Clip mở sẵn không dùng tới sau 10s → đóng
+
+# ============ PLAYBACK FEEDBACK ============
+# Báo server trạng thái phát (queue, thời gian phát hết) để server gộp / rút gọn / giữ lại result
+PLAYBACK_REPORT = os.getenv("PLAYBACK_REPORT", "1").strip() != "0"
+PLAYBACK_REPORT_SEC = 1.0              # Đang phát → báo mỗi 1s; rảnh → chỉ báo khi thay đổi
+
+# ============ LATENCY TRACE ============
+# Mốc thời gian mỗi câu: nói xong → gửi → result → frame đầu trên LCD. Xuất: kill -USR1 <pid> hoặc khi thoát
+TRACE_ENABLED = os.getenv("TRACE_ENABLED", "1").strip() != "0"
+TRACE_RING_EVENTS = 4096               # ~500 câu (8 mark/câu)
 
 # ============ BUTTON SETTINGS ============
 STOP_DOUBLE_PRESS_WINDOW_SEC = 1.5
@@ -90,11 +197,16 @@ BL_PIN = 18
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 VIDEO_DIR = os.path.join(SCRIPT_DIR, "video")
 FONT_PATH = os.path.join(SCRIPT_DIR, "SVN-Arial Regular.ttf")
+SEND_SPILL_DIR = os.path.join(SCRIPT_DIR, "spill")
+SPOOL_DIR = os.path.join(SCRIPT_DIR, "spool")
+TRACE_DIR = os.path.join(SCRIPT_DIR, "traces")
+ENDPOINT_CACHE = os.path.join(SCRIPT_DIR, "endpoint_cache.json")
+ENV_FILE = os.path.join(SCRIPT_DIR, ".env")
 
 # ============ STATE ============
 class State:
-    IDLE = 0        # Chưa kết nối
-    CONNECTING = 1  # Đang kết nối WebSocket
+    IDLE = 0        # Không ghi (kết nối WebSocket vẫn giữ sẵn ở nền)
+    CONNECTING = 1  # Đang ghi nhưng chưa có kết nối (audio vào spool)
     RECORDING = 2   # Đang ghi âm (kết nối + stream)
     PLAYING = 3     # Đang phát video (vẫn stream audio)
 
@@ -102,44 +214,54 @@ current_state = State.IDLE
 is_recording = False  # Toggle for recording mode
 stop_streaming = False
 stop_video = False
+shutting_down = False       # Thoát chương trình → đóng kết nối giữ sẵn
 websocket_connected = False
 reconnect_count = 0
 ws_thread = None
+ws_loop = None              # Event loop của connection thread (chạy từ lúc boot)
+recording_event = None      # asyncio.Event: set khi nút bật ghi → bắt đầu gửi audio trên kết nối sẵn có
+playback_changed = None     # asyncio.Event: video worker báo queue / job thay đổi → gửi 'playback' ngay
+endpoint_changed = None     # asyncio.Event: API_URL trong .env đổi → drain session hiện tại, kết nối server mới
+endpoint_changed_at = None
+network_watcher = None      # NetworkWatcher của connection thread: mạng đổi trong lúc chờ reconnect → thử lại ngay
+record_pressed_at = None    # Thời điểm bấm nút (đo press → streaming)
 stop_armed = False
 stop_armed_at = 0.0
-
-# ============ AUDIO DEVICE ============
-def get_usb_audio_device():
-    """Auto-detect USB audio device."""
-    try:
-        result = subprocess.run(['arecord', '-l'], capture_output=True, text=True)
-        for line in result.stdout.split('\n'):
-            if 'card' in line.lower() and ('usb' in line.lower() or 'pnp' in line.lower()):
-                match = re.search(r'card (\d+):', line)
-                if match:
-                    device = f"plughw:{match.group(1)},0"
-                    print(f"🎤 USB Audio: {device}")
-                    return device
-        return "plughw:0,0"
-    except Exception:
-        return "plughw:0,0"
-
-AUDIO_DEVICE = get_usb_audio_device()
-
-def boost_mic_capture_volume():
-    # fail-open: không phụ thuộc card cụ thể
-    for cmd in [
-        ["amixer", "set", "Capture", "100%"],
-        ["amixer", "set", "Mic", "100%"],
-        ["amixer", "set", "PCM", "100%"],
-        ["amixer", "set", "Auto Gain Control", "off"],
-    ]:
-        try:
-            subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        except:
-            pass
-
-boost_mic_capture_volume()
+capture_daemon = None       # CaptureDaemon chạy suốt, không phụ thuộc WebSocket session
+resume_seq = None           # Frame bắt đầu đọc lại khi reconnect (None = đọc từ hiện tại)
+resume_noise_floor = None   # Noise floor của session trước (bỏ qua calibration khi reconnect)
+audio_spool = None          # AudioSpool (tạo khi cần)
+session_id = None           # ID của connection session (giữ qua các lần reconnect)
+segments_sent = 0           # Số segment đã gửi xong trong session
+last_ack_seq = None         # Segment cuối server xác nhận ('ack')
+segment_resume_points = deque(maxlen=64)  # (segments_sent, resume_seq) để quay lại segment chưa ack
+server_supports_resume = None  # None = chưa biết, False = server cũ (không chờ 'resumed' nữa)
+spooled_result_times = deque()  # captured_at của segment gửi bù, chờ result (server trả theo thứ tự)
+wire = JsonProtocol()       # Protocol của kết nối hiện tại (chọn lúc connect)
+segment_sent_times = {}     # seq → thời điểm gửi xong segment (ghép với result cùng seq)
+tracer = LatencyTracer(TRACE_RING_EVENTS, enabled=TRACE_ENABLED)
+tls_context = create_tls_context(TLS_CA_FILE, TLS_SESSION_RESUME) if any(u.startswith("wss://") for u in API_URLS) else None
+
+def connect_options(url: str) -> dict:
+    """Tham số websockets.connect chung cho session và endpoint probe: SSLContext dùng chung + nén."""
+    options = {'compression': None}
+    if url.startswith("wss://") and tls_context is not None:
+        options['ssl'] = tls_context
+    if WS_COMPRESSION != 'off':
+        options['extensions'] = [ClientPerMessageDeflateFactory(client_max_window_bits=WS_DEFLATE_WINDOW_BITS,
+                                                                compress_settings={'memLevel': WS_DEFLATE_MEM_LEVEL})]
+    return options
+
+endpoints = EndpointSelector(API_URLS, WS_ENDPOINT, ENDPOINT_CACHE, timeout=ENDPOINT_PROBE_TIMEOUT,
+                             cache_ttl=ENDPOINT_CACHE_TTL_SEC, connect_options=connect_options)
+
+# ============ AUDIO SOURCE ============
+# arecord[:device] | file:recording_20260121_163605.wav | synthetic:speech (xem audio_source.py)
+# Device auto-detect + amixer chạy khi bắt đầu ghi, không chạy lúc import
+AUDIO_SOURCE = os.getenv("AUDIO_SOURCE", "arecord").strip()
+AUDIO_SOURCE_SPEED = float(os.getenv("AUDIO_SOURCE_SPEED", "1.0"))
+CAPTURE_RING_SECONDS = 60              # Capture daemon giữ 60s audio gần nhất (~1.9MB) để gửi lại sau reconnect
+CAPTURE_RESTART_DELAY_SEC = 1.0        # arecord chết → mở lại sau 1s
 
 # ============ FONT ============
 try:
@@ -292,6 +414,42 @@ def show_message(lines, color=(255, 255, 255), bg_color=(0, 0, 0), show_recent=T
     show_frame(frame, show_recent_results=show_recent)
 
 # ============ VIDEO MAPPER ============
+@lru_cache(maxsize=BASE_FORM_CACHE_MAX)
+def _base_form(text: str) -> str:
+    """Bỏ toàn bộ dấu: 'tiếng' → 'tieng', 'đ' → 'd' (giữ nguyên độ dài)."""
+    return ''.join(unicodedata.normalize('NFD', c)[0] for c in text).replace('đ', 'd')
+
+def vn_edit_distance(a: str, b: str) -> int:
+    """
+    Levenshtein có trọng số cho tiếng Việt:
+    - Sai dấu (cùng chữ gốc, vd 'ô'/'ồ'/'o'): 1
+    - Thay / thêm / bớt chữ cái: 2
+    """
+    if a == b:
+        return 0
+    if len(a) < len(b):
+        a, b = b, a
+    base_b = _base_form(b)
+    prev = list(range(0, 2 * len(b) + 1, 2))
+    for i, (ca, base_a) in enumerate(zip(a, _base_form(a)), 1):
+        cur = [2 * i]
+        for j, cb in enumerate(b, 1):
+            if ca == cb:
+                sub = prev[j - 1]
+            elif base_a == base_b[j - 1]:
+                sub = prev[j - 1] + 1
+            else:
+                sub = prev[j - 1] + 2
+            ins = cur[j - 1] + 2
+            dele = prev[j] + 2
+            cur.append(sub if sub <= ins and sub <= dele else (ins if ins < dele else dele))
+        prev = cur
+    return prev[-1]
+
+def _deletions(text: str) -> set:
+    """text và mọi biến thể bớt đúng 1 ký tự."""
+    return {text} | {text[:i] + text[i + 1:] for i in range(len(text))}
+
 class VideoMapper:
     RESERVED_NAMES = {'con', 'prn', 'aux', 'nul', 'com1', 'com2', 'lpt1'}
     TONE_MAP = {
@@ -312,6 +470,11 @@ class VideoMapper:
     def __init__(self, video_dir: str):
         self.video_dir = Path(video_dir)
         self.video_cache = {}
+        self.phrase_trie = {}  # token -> node; node[None] = video path (cụm nhiều từ)
+        self.fuzzy_index = {}  # dạng không dấu (bớt <= 1 chữ) -> {stem}
+        self._fuzzy_cache = {}
+        self._number_cache = {}  # '2500' -> [('2000', path), ('500', path)]
+        self._plan_lock = threading.Lock()  # plan_words gọi từ video worker và clip prefetcher
         self._scan_videos()
         print(f"📹 VideoMapper: {len(self.video_cache)} videos")
 
@@ -321,6 +484,33 @@ class VideoMapper:
         for ext in ['*.mp4', '*.webm']:
             for f in self.video_dir.glob(ext):
                 self.video_cache[f.stem.lower()] = f
+        self._build_phrase_trie()
+        self._build_fuzzy_index()
+
+    def _build_phrase_trie(self):
+        """Prefix trie theo từ của tên clip: 'bao_nhiêu_tiền' → bao → nhiêu → tiền."""
+        for stem, path in self.video_cache.items():
+            tokens = [t for t in stem.split('_') if t]
+            if len(tokens) < 2:
+                continue
+            node = self.phrase_trie
+            for tok in tokens:
+                node = node.setdefault(tok, {})
+            # Ưu tiên tên chuẩn 'cung_cấp' hơn biến thể 'cung_cấp_'
+            if None not in node or stem == '_'.join(tokens):
+                node[None] = path
+
+    def _build_fuzzy_index(self):
+        """
+        Index xoá-1-ký-tự trên dạng không dấu của toàn bộ tên clip ('con_' → 'con').
+        Mọi key cách query <= FUZZY_MAX_DISTANCE (chỉ sai dấu, hoặc 1 chữ thêm/bớt)
+        đều chung ít nhất một dạng xoá với query → chỉ cần tính distance trên vài ứng viên.
+        """
+        for stem in self.video_cache:
+            key = stem.strip('_')
+            if key and not key.isdigit():
+                for variant in _deletions(_base_form(key)):
+                    self.fuzzy_index.setdefault(variant, set()).add(stem)
 
     def normalize_for_pronunciation(self, text: str) -> str:
         return ''.join(self.TONE_MAP.get(c, c) for c in text.lower())
@@ -355,6 +545,134 @@ class VideoMapper:
 
         return None
 
+    @staticmethod
+    def _fuzzy_allowed(key: str, name: str) -> bool:
+        """
+        Chỉ nhận sai dấu, hoặc thừa/thiếu 1 chữ không phải chữ đầu.
+        Đổi chữ cái ('tieng' → 'mieng') hay thêm chữ đầu ('hương' → 'thương') là từ khác hẳn.
+        """
+        base_key, base_name = _base_form(key), _base_form(name)
+        return base_key == base_name or (len(key) != len(name) and base_key[0] == base_name[0])
+
+    def find_video_fuzzy(self, word: str):
+        """Tìm clip gần đúng (sai dấu, lỗi gõ, ASR nghe nhầm). Chỉ gọi khi find_video trượt."""
+        key = self.normalize_word(word)
+        if len(key) < 2 or key.isdigit():
+            return None
+        if key in self._fuzzy_cache:
+            return self._fuzzy_cache[key]
+
+        max_distance = FUZZY_MAX_DISTANCE if len(key) >= FUZZY_MIN_WORD_LEN else 1
+        candidates = set()
+        for variant in _deletions(_base_form(key)):
+            candidates |= self.fuzzy_index.get(variant, set())
+
+        match = None
+        for stem in candidates:
+            name = stem.strip('_')
+            d = vn_edit_distance(key, name)
+            if d <= max_distance and self._fuzzy_allowed(key, name) and (match is None or (d, stem) < (match[1], match[0])):
+                match = (stem, d)
+        video = self.video_cache[match[0]] if match else None
+        if video:
+            print(f"🔎 Fuzzy: '{key}' → '{match[0]}' (d={match[1]})")
+        if len(self._fuzzy_cache) >= FUZZY_CACHE_MAX:
+            self._fuzzy_cache.clear()
+        self._fuzzy_cache[key] = video
+        return video
+
+    NUMBER_SCALES = ((10 ** 9, 'tỷ'), (10 ** 6, 'triệu'), (10 ** 3, 'ngàn'))
+    ZERO_TENS_WORDS = ('lẻ', 'linh')
+
+    def _zero_tens_clip(self) -> Optional[str]:
+        """Clip 'lẻ' / 'linh', khớp đúng tên (không bỏ dấu: 'le' có thể là 'lê')."""
+        for key in self.ZERO_TENS_WORDS:
+            if key in self.video_cache and self.video_cache[key].exists():
+                return key
+        return None
+
+    def _group_clips(self, n: int, after_unit: bool = False) -> Optional[list]:
+        """
+        Đọc số 0..999 kiểu 'hai trăm bốn mươi lăm' → ['200', '40', '5'].
+        Hàng chục = 0 phải có 'lẻ': "hai trăm năm" là 250, 205 là "hai trăm lẻ năm".
+        after_unit: n đứng cuối, ngay sau ngàn / triệu / tỷ ("hai ngàn năm" là 2500).
+        None: không đọc rõ được bằng clip đang có → đánh vần.
+        """
+        hundreds, rest = divmod(n, 100)
+        if self.find_video(str(n)) and not (after_unit and n < 10):
+            return [str(n)]
+        keys = []
+        if hundreds:
+            keys += [str(hundreds * 100)] if self.find_video(str(hundreds * 100)) else [str(hundreds), 'trăm']
+        if rest >= 10 and self.find_video(str(rest)):
+            return keys + [str(rest)]
+        tens, ones = divmod(rest, 10)
+        if tens:
+            if self.find_video(str(tens * 10)):
+                keys.append(str(tens * 10))
+            elif tens >= 2:
+                keys += [str(tens), 'mươi']
+            else:
+                return None
+        elif ones and (hundreds or after_unit):
+            zero = self._zero_tens_clip()
+            if zero is None:
+                return None
+            keys.append(zero)
+        if ones:
+            keys.append(str(ones))
+        return keys
+
+    def _number_clips(self, n: int, after_unit: bool = False) -> Optional[list]:
+        """Tách số thành ít clip nhất theo cách đọc tiếng Việt (tỷ / triệu / ngàn / trăm / mươi / lẻ)."""
+        if n < 1000:
+            return self._group_clips(n, after_unit)
+        if self.find_video(str(n)):
+            return [str(n)]
+
+        for scale, unit in self.NUMBER_SCALES:
+            if n < scale:
+                continue
+            head, rest = divmod(n, scale)
+            options = []
+            if self.find_video(str(head * scale)):
+                lead = [str(head * scale)]  # '2000', '1000000'
+            else:
+                lead = self._number_clips(head)
+                lead = lead + [unit] if lead is not None else None
+            tail = self._number_clips(rest, after_unit=True) if rest else []
+            if lead is not None and tail is not None:
+                options.append(lead + tail)
+
+            # Clip gộp cả nhóm kế tiếp, vd 1.100.250 → '1100000' + 250
+            covered = n - n % (scale // 1000)
+            if covered != n and covered % scale and self.find_video(str(covered)):
+                tail = self._number_clips(n - covered, after_unit=True)
+                if tail is not None:
+                    options.append([str(covered)] + tail)
+            return min(options, key=len) if options else None
+
+    def get_number_videos(self, word: str) -> list:
+        """Clip cho một số (vd '2500' → 2000 + 500). Rỗng nếu không đọc được → đánh vần."""
+        key = self.normalize_word(word)
+        if not key.isdigit() or len(key) > NUMBER_MAX_DIGITS or (len(key) > 1 and key[0] == '0'):
+            return []
+        if key in self._number_cache:
+            return self._number_cache[key]
+
+        result = []
+        for clip in self._number_clips(int(key)) or []:
+            video = self.find_video(clip)
+            if not video:
+                result = []
+                break
+            result.append((clip, video))
+
+        if len(self._number_cache) >= NUMBER_CACHE_MAX:
+            self._number_cache.clear()
+        self._number_cache[key] = result
+        return result
+
     def get_fingerspell_videos(self, word: str) -> list:
         result = []
         for char in word.lower():
@@ -373,8 +691,201 @@ class VideoMapper:
                     return []
         return result
 
+    def tokenize(self, words: list) -> list:
+        """Tách job.words thành từng từ đơn (server có thể gửi 'anh hùng' hoặc 'anh_hùng')."""
+        tokens = []
+        for word in words:
+            for part in re.split(r'[\s_]+', word or ''):
+                tok = self.normalize_word(part)
+                if tok:
+                    tokens.append(tok)
+        return tokens
+
+    def _phrase_matches(self, tokens: list, start: int) -> list:
+        """Các cụm (end, path) dài >= 2 từ trong trie bắt đầu tại tokens[start], dài nhất trước."""
+        matches = []
+        node = self.phrase_trie
+        for end in range(start, len(tokens)):
+            node = node.get(tokens[end])
+            if node is None:
+                break
+            if None in node and end > start and node[None].exists():
+                matches.append((end + 1, node[None]))
+        return matches[::-1]
+
+    def plan_words(self, words: list) -> list:
+        """
+        Lập kế hoạch phát: ghép cụm dài nhất có clip, ít clip nhất (DP).
+        Trả về list (label, video_path, speed_multiplier).
+        """
+        with self._plan_lock:
+            return self._plan_words(words)
+
+    def _plan_words(self, words: list) -> list:
+        tokens = self.tokenize(words)
+        n = len(tokens)
+        # best[i] = (số từ bị bỏ, số clip, plan) cho tokens[i:]
+        best = [None] * (n + 1)
+        best[n] = (0, 0, [])
+        for i in range(n - 1, -1, -1):
+            options = []
+            for end, path in self._phrase_matches(tokens, i):
+                dropped, clips, plan = best[end]
+                label = ' '.join(tokens[i:end])
+                options.append((dropped, clips + 1, [(label, path, VIDEO_SPEED)] + plan))
+
+            dropped, clips, plan = best[i + 1]
+            video = self.find_video(tokens[i]) or self.find_video_fuzzy(tokens[i])
+            numbers = [] if video else self.get_number_videos(tokens[i])
+            if video:
+                options.append((dropped, clips + 1, [(tokens[i], video, VIDEO_SPEED)] + plan))
+            elif numbers:
+                options.append((dropped, clips + len(numbers), [(label, v, VIDEO_SPEED) for label, v in numbers] + plan))
+            else:
+                letters = [(letter, v, FINGERSPELL_SPEED) for letter, v in self.get_fingerspell_videos(tokens[i])]
+                options.append((dropped + (0 if letters else 1), clips + len(letters), letters + plan))
+
+            # min() giữ option đầu tiên khi hòa → cụm dài nhất thắng
+            best[i] = min(options, key=lambda o: (o[0], o[1]))
+        return best[0][2]
+
 video_mapper = VideoMapper(VIDEO_DIR)
 
+# ============ CLIP PREFETCH ============
+class ClipPrefetcher:
+    """
+    Mở sẵn clip theo kết quả tạm ('partial') của server trước khi có 'result' cuối:
+    page cache (fadvise WILLNEED) + cv2.VideoCapture + decode frame đầu.
+    'result' tới → giữ clip khớp plan cuối, đóng phần đoán sai.
+    Chạy thread riêng để plan_words / decode không chặn event loop hay video worker.
+    """
+
+    def __init__(self, max_clips: int = PREFETCH_MAX_CLIPS, ttl: float = PREFETCH_TTL_SEC):
+        self.max_clips = max_clips
+        self.ttl = ttl
+        self.lock = threading.Condition()
+        self.warm = {}              # path → (cap, first_frame, warmed_at)
+        self.keep = set()           # Path thuộc hypothesis / result mới nhất
+        self.to_warm = deque()      # Path chờ mở sẵn (theo thứ tự phát)
+        self.pending = None         # (words, final) chờ plan
+        # Counters
+        self.speculations = 0
+        self.hits = 0
+        self.misses = 0
+        self.wasted = 0
+        threading.Thread(target=self._run, daemon=True).start()
+
+    # ---------- gọi từ receive loop / video worker ----------
+    def speculate(self, words: list):
+        """Kết quả tạm: mở sẵn clip của words (hypothesis mới thay hypothesis cũ)."""
+        with self.lock:
+            self.pending = (list(words), False)
+            self.speculations += 1
+            self.lock.notify()
+
+    def commit(self, words: list):
+        """Kết quả cuối: giữ clip nằm trong plan, đóng phần còn lại."""
+        with self.lock:
+            self.pending = (list(words), True)
+            self.lock.notify()
+
+    def take(self, path):
+        """(cap, first_frame) đã mở sẵn cho path; None → video worker tự mở."""
+        with self.lock:
+            entry = self.warm.pop(str(path), None)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[0], entry[1]
+
+    def discard_all(self):
+        with self.lock:
+            self.pending = None
+            self.keep = set()
+            self.to_warm.clear()
+            self._release([p for p in self.warm])
+
+    def get_stats(self) -> dict:
+        return {
+            'speculations': self.speculations,
+            'hits': self.hits,
+            'misses': self.misses,
+            'wasted': self.wasted,
+            'warm': len(self.warm),
+        }
+
+    # ---------- prefetch thread ----------
+    def _release(self, paths):
+        """Gọi khi đang giữ lock."""
+        for path in paths:
+            cap, _, _ = self.warm.pop(path)
+            cap.release()
+            self.wasted += 1
+
+    def _expire(self):
+        now = time.monotonic()
+        self._release([p for p, (_, _, at) in self.warm.items() if now - at > self.ttl])
+
+    def _apply_plan(self, words: list, final: bool):
+        paths = [str(path) for _, path, _ in video_mapper.plan_words(words)]
+        for path in dict.fromkeys(paths[:PREFETCH_PAGE_CACHE_CLIPS]):
+            self._advise_page_cache(path)
+        head = list(dict.fromkeys(paths))[:self.max_clips]
+        with self.lock:
+            self.keep = set(head)
+            self._release([p for p in self.warm if p not in self.keep])
+            # Kết quả cuối: video worker sắp mở các clip này, không mở thêm (tránh tranh CPU)
+            self.to_warm = deque() if final else deque(p for p in head if p not in self.warm)
+
+    @staticmethod
+    def _advise_page_cache(path: str):
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+        except (AttributeError, OSError):
+            pass
+        finally:
+            os.close(fd)
+
+    def _open(self, path: str):
+        cap = cv2.VideoCapture(path)
+        if not cap.isOpened():
+            return None
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        ret, frame = cap.read()
+        if not ret:
+            cap.release()
+            return None
+        return cap, frame
+
+    def _run(self):
+        while True:
+            with self.lock:
+                while self.pending is None and not self.to_warm:
+                    self.lock.wait(timeout=self.ttl / 2)
+                    self._expire()
+                job, self.pending = self.pending, None
+                path = None if job else self.to_warm.popleft()
+
+            if job:
+                self._apply_plan(*job)
+                continue
+
+            opened = self._open(path)
+            if opened is None:
+                continue
+            with self.lock:
+                if path in self.keep and path not in self.warm:
+                    self.warm[path] = (opened[0], opened[1], time.monotonic())
+                else:
+                    opened[0].release()  # Hypothesis đã đổi trong lúc mở
+
+clip_prefetcher = ClipPrefetcher() if SPECULATIVE_PREFETCH else None
+
 # ============ VIDEO JOB & QUEUE ============
 @dataclass
 class VideoJob:
@@ -384,12 +895,21 @@ class VideoJob:
     vsl_text: str = ""
     confidence: float = 0.0
     original_text: str = ""
+    received_at: float = 0.0  # time.monotonic() lúc nhận result (đo result → frame đầu)
+    seq: int = 0              # Segment sinh ra result (server ghép với playback report)
+    job_id: int = 0
+    plan: Optional[list] = None  # plan_words (tính 1 lần, dùng cho cả ước lượng lẫn phát)
+    duration: float = 0.0     # Thời gian phát ước tính (giây, đã tính tốc độ)
+    trace_id: Optional[int] = None  # LatencyTracer của câu sinh ra result
 
 # Pending queue: maxlen=3 tự động drop oldest
 pending_video_queue = deque(maxlen=3)
 video_queue_lock = threading.Condition()
 video_thread_running = True
 currently_playing_job = None  # Job đang phát (KHÔNG tính vào pending)
+current_job_started_at = 0.0
+video_job_counter = 0
+dropped_video_jobs = 0        # Result bị bỏ vì pending queue đầy (maxlen)
 
 last_displayed_frame = None  # Giữ khung hình cuối cùng khi hết response
 last_displayed_frame_lock = threading.Lock()
@@ -401,20 +921,110 @@ def clear_response_cache():
 
 def enqueue_video_job(job: VideoJob):
     """Thêm job vào pending queue. Tự động drop oldest nếu đầy (maxlen=3)."""
+    global video_job_counter, dropped_video_jobs
     with video_queue_lock:
+        video_job_counter += 1
+        job.job_id = video_job_counter
+        if len(pending_video_queue) == pending_video_queue.maxlen:
+            dropped_video_jobs += 1
+            print(f"⚠️ Pending queue full → dropped job #{pending_video_queue[0].job_id} (total {dropped_video_jobs})")
         pending_video_queue.append(job)  # deque tự drop left nếu maxlen exceeded
+        tracer.mark(job.trace_id, 'enqueued', job_id=job.job_id)
         video_queue_lock.notify()  # Wake up worker
         print(f"📥 Enqueued: {job.words[:3] if len(job.words) > 3 else job.words}... | Pending: {len(pending_video_queue)}")
+    notify_playback_changed()
+
+# ============ PLAYBACK STATE ============
+_clip_info_cache = {}  # path → (fps, total_frames) đọc từ header
+clip_overhead_sec = 0.05  # Mở clip + decode frame đầu, EMA đo từ các job đã phát (Pi chậm hơn PC)
+
+def get_clip_play_time(video_path, speed_multiplier: float) -> float:
+    """
+    Thời gian play_single_video phát clip (giây): số frame hiển thị x nhịp LCD,
+    giống cách nó skip frame (chậm hơn duration / speed khi nhịp LCD không chia hết).
+    """
+    key = str(video_path)
+    if key not in _clip_info_cache:
+        cap = cv2.VideoCapture(key)
+        _clip_info_cache[key] = (cap.get(cv2.CAP_PROP_FPS) or 25, int(cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+        cap.release()
+    fps, total_frames = _clip_info_cache[key]
+    duration = total_frames / fps if fps > 0 else 0
+    if duration > 10.0 or duration <= 0:
+        return 0.0  # play_single_video bỏ qua
+    effective_fps = fps * speed_multiplier
+    if effective_fps > TARGET_LCD_FPS:
+        frame_skip = int(effective_fps / TARGET_LCD_FPS)
+        return total_frames // frame_skip * LCD_FRAME_TIME
+    return total_frames / effective_fps
+
+def plan_job(job: VideoJob) -> list:
+    """Plan + thời gian phát ước tính của job (tính 1 lần)."""
+    if job.plan is None:
+        plan = video_mapper.plan_words(job.words)
+        job.duration = sum(get_clip_play_time(path, speed) for _, path, speed in plan)
+        job.plan = plan
+    return job.plan
+
+def job_play_time(job: VideoJob) -> float:
+    return job.duration + len(job.plan or []) * clip_overhead_sec
+
+def update_clip_overhead(job: VideoJob, elapsed: float):
+    """Job phát hết (không bị dừng) → cập nhật overhead mỗi clip cho ước lượng drain."""
+    global clip_overhead_sec
+    if job.plan:
+        measured = max(0.0, (elapsed - job.duration) / len(job.plan))
+        clip_overhead_sec += 0.3 * (measured - clip_overhead_sec)
+
+def get_playback_state() -> dict:
+    """Snapshot trạng thái phát để báo server (có thể mở file clip lần đầu → gọi ngoài event loop)."""
+    with video_queue_lock:
+        pending = list(pending_video_queue)
+        current = currently_playing_job
+        started_at = current_job_started_at
+
+    drain = 0.0
+    if current is not None:
+        drain += max(0.0, job_play_time(current) - (time.monotonic() - started_at))
+    for job in pending:
+        plan_job(job)
+        drain += job_play_time(job)
+
+    return {
+        'type': 'playback',
+        'playing': current is not None,
+        'job_id': current.job_id if current else None,
+        'seq': current.seq if current else None,
+        'pending': len(pending),
+        'pending_seqs': [job.seq for job in pending],
+        'capacity': pending_video_queue.maxlen - len(pending),
+        'drain_sec': round(drain, 1),
+        'dropped': dropped_video_jobs,
+    }
+
+def notify_playback_changed():
+    """Gọi từ thread bất kỳ: đánh thức report_playback trên connection loop."""
+    loop = ws_loop
+    if loop is not None and playback_changed is not None:
+        loop.call_soon_threadsafe(playback_changed.set)
 
-def play_single_video(video_path: str, overlay_word: str = "", max_duration: float = 10.0, speed_multiplier: float = 1.0):
+def play_single_video(video_path: str, overlay_word: str = "", max_duration: float = 10.0, speed_multiplier: float = 1.0,
+                      latency_since: float = None, trace_id: Optional[int] = None):
     """
     Play video với frame skipping thông minh để đạt TARGET_LCD_FPS.
     Video vẫn chạy đúng tốc độ (speed_multiplier), nhưng chỉ hiển thị mỗi N frame.
+    Clip đã được prefetch (mở sẵn + frame đầu đã decode) → dùng luôn.
+    latency_since: thời điểm nhận result → in độ trễ tới frame đầu (clip đầu của job),
+    kèm mark 'first_frame' cho trace_id.
     """
     global stop_video
-    cap = cv2.VideoCapture(video_path)
-    if not cap.isOpened():
-        return
+    warm = clip_prefetcher.take(video_path) if clip_prefetcher else None
+    if warm:
+        cap, pending_frame = warm
+    else:
+        cap, pending_frame = cv2.VideoCapture(video_path), None
+        if not cap.isOpened():
+            return
 
     cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
     fps = cap.get(cv2.CAP_PROP_FPS) or 25
@@ -437,20 +1047,31 @@ def play_single_video(video_path: str, overlay_word: str = "", max_duration: flo
         display_interval = 1.0 / effective_fps
     
     frame_count = 0
+    frame = None
     last_display_time = time.time()
     start_time = time.time()
 
     try:
         while not stop_video:
-            ret, frame = cap.read()
+            if pending_frame is not None:
+                ret, frame, pending_frame = True, pending_frame, None
+            else:
+                ret, frame = cap.read()
             if not ret:
                 break
             
             frame_count += 1
             
-            # Chỉ hiển thị mỗi N frame
-            if frame_count % frame_skip == 0:
+            # Chỉ hiển thị mỗi N frame (frame đầu luôn hiển thị ngay)
+            if frame_count % frame_skip == 0 or frame_count == 1:
                 show_frame(frame, overlay_word)
+                if latency_since is not None:
+                    print(f"⏱️ Result → first frame: {(time.monotonic() - latency_since) * 1000:.0f}ms"
+                          f"{' (prefetched)' if warm else ''}")
+                    latency_since = None
+                    if trace_id is not None:
+                        tracer.mark(trace_id, 'first_frame', prefetched=bool(warm))
+                        print(f"⏱️ {tracer.format_summary(trace_id)}")
                 
                 # Throttle LCD refresh
                 elapsed = time.time() - last_display_time
@@ -472,7 +1093,7 @@ def play_single_video(video_path: str, overlay_word: str = "", max_duration: flo
 
 def video_playback_worker():
     """✅ Worker thread: lấy job từ pending queue và phát video (độc lập với websocket)."""
-    global video_thread_running, current_state, stop_video, currently_playing_job
+    global video_thread_running, current_state, stop_video, currently_playing_job, current_job_started_at
     
     while video_thread_running:
         job = None
@@ -502,33 +1123,32 @@ def video_playback_worker():
             # Text hiển thị ở bottom: cả câu response
             response_text = job.original_text or job.transcript or job.vsl_text or ""
             
+            # Ghép cụm dài nhất + fingerspell fallback
+            plan = plan_job(job)
+            tracer.mark(job.trace_id, 'planned', clips=len(plan))
+            current_job_started_at = time.monotonic()
+            notify_playback_changed()
+            print(f"🧩 Plan: {len(plan)} clips ~{job.duration:.1f}s | {[label for label, _, _ in plan]}")
+
             # Phát từng video
-            for word in job.words:
+            latency_since = job.received_at or None
+            for label, video_path, speed in plan:
                 if stop_video:
                     break
-                    
-                video_path = video_mapper.find_video(word)
-                if video_path:
-                    play_single_video(
-                        str(video_path),
-                        overlay_word=response_text,
-                        speed_multiplier=VIDEO_SPEED
-                    )
-                else:
-                    # Fingerspell fallback
-                    letters = video_mapper.get_fingerspell_videos(word)
-                    if letters:
-                        for letter, letter_video in letters:
-                            if stop_video:
-                                break
-                            play_single_video(
-                                str(letter_video),
-                                overlay_word=response_text,
-                                speed_multiplier=FINGERSPELL_SPEED
-                            )
+                play_single_video(
+                    str(video_path),
+                    overlay_word=response_text,
+                    speed_multiplier=speed,
+                    latency_since=latency_since,
+                    trace_id=job.trace_id
+                )
+                latency_since = None
             
             # NOTE: signal_playback_ended() removed - no cooldown needed
             
+            if not stop_video:
+                update_clip_overhead(job, time.monotonic() - current_job_started_at)
+
             # ✅ Về RECORDING nếu vẫn đang recording mode
             if not stop_video and is_recording:
                 current_state = State.RECORDING
@@ -537,6 +1157,7 @@ def video_playback_worker():
             print(f"❌ Video worker error: {e}")
         finally:
             currently_playing_job = None
+            notify_playback_changed()
 
 def play_video_sequence(words: list, transcript: str = "", vsl_text: str = "", original_text: str = "", confidence: float = 0.0):
     """✅ [BACKWARD COMPAT] Wrapper cho enqueue_video_job()."""
@@ -548,104 +1169,351 @@ video_thread.start()
 
 # NOTE: Cooldown signal removed - no longer needed since audio stream runs continuously
 
+# ============ CAPTURE DAEMON ============
+class CaptureDaemon:
+    """
+    Đọc audio source liên tục trong thread riêng (mở ALSA 1 lần), ghi vào ring theo frame:
+    frame thứ seq nằm ở slot seq % capacity, kèm timestamp lúc capture.
+    WebSocket session attach() → CaptureReader đọc từ seq bất kỳ còn trong ring,
+    nên audio nói trong lúc reconnect vẫn được gửi.
+    """
+
+    def __init__(self, spec: str = AUDIO_SOURCE, speed: float = AUDIO_SOURCE_SPEED,
+                 seconds: int = CAPTURE_RING_SECONDS):
+        self.spec = spec
+        self.speed = speed
+        self.frame_bytes = FRAME_SIZE * 2 * CHANNELS
+        self.capacity = seconds * 1000 // FRAME_DURATION_MS
+        self.ring = bytearray(self.capacity * self.frame_bytes)
+        self.ring_view = memoryview(self.ring)
+        self.timestamps = [0.0] * self.capacity
+        self.next_seq = 0           # seq của frame sẽ ghi tiếp theo
+        self.ended = False          # Source hết (file/synthetic) → reader trả None
+        self.readers = set()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def oldest_seq(self) -> int:
+        return max(0, self.next_seq - self.capacity)
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self.thread = threading.Thread(target=lambda: asyncio.run(self._run()), daemon=True)
+        self.thread.start()
+
+    async def _run(self):
+        while True:
+            source = create_audio_source(self.spec, SAMPLE_RATE, CHANNELS, speed=self.speed)
+            try:
+                await source.start()
+                print(f"🎙️ Capture daemon: {source.describe()}")
+                while True:
+                    frame = await source.read(self.frame_bytes)
+                    if frame is None:
+                        break
+                    self._write(frame)
+            except Exception as e:
+                print(f"❌ Capture error: {e}")
+            finally:
+                await source.close()
+
+            # Chỉ mic thật mới mở lại, file/synthetic hết là hết
+            if source.name != 'arecord':
+                break
+            print(f"🔄 Capture restarting in {CAPTURE_RESTART_DELAY_SEC}s...")
+            await asyncio.sleep(CAPTURE_RESTART_DELAY_SEC)
+
+        self.ended = True
+        self._notify()
+
+    def _write(self, frame: bytes):
+        slot = self.next_seq % self.capacity
+        self.ring[slot * self.frame_bytes:(slot + 1) * self.frame_bytes] = frame
+        self.timestamps[slot] = time.time()
+        self.next_seq += 1
+        self._notify()
+
+    def _notify(self):
+        with self.lock:
+            readers = list(self.readers)
+        for reader in readers:
+            reader.wake()
+
+    def attach(self, from_seq: Optional[int] = None) -> 'CaptureReader':
+        """Reader bắt đầu từ from_seq (None = frame tiếp theo). Gọi trong event loop của session."""
+        reader = CaptureReader(self, self.next_seq if from_seq is None else from_seq)
+        with self.lock:
+            self.readers.add(reader)
+        return reader
+
+    def detach(self, reader: 'CaptureReader'):
+        with self.lock:
+            self.readers.discard(reader)
+
+class CaptureReader:
+    """Con trỏ đọc của 1 session vào ring của CaptureDaemon (thread-safe qua call_soon_threadsafe)."""
+    CATCH_UP_YIELD_FRAMES = 10   # Đang đọc bù → nhường event loop mỗi 10 frame
+
+    def __init__(self, daemon: CaptureDaemon, seq: int):
+        self.daemon = daemon
+        self.seq = seq
+        self.idle_start = seq    # Frame đầu của đoạn im lặng hiện tại (None = đang trong segment)
+        self.overruns = 0
+        self.loop = asyncio.get_running_loop()
+        self.event = asyncio.Event()
+
+    @property
+    def lag_frames(self) -> int:
+        return self.daemon.next_seq - self.seq
+
+    def safe_resume_seq(self, seq: int, in_speech: bool) -> Optional[int]:
+        """
+        Vị trí đọc lại an toàn sau frame seq (None nếu đang trong segment):
+        không lùi vào segment đã gửi, nhưng giữ tối đa PREROLL_FRAMES frame im lặng làm pre-roll.
+        """
+        if in_speech:
+            self.idle_start = None
+            return None
+        if self.idle_start is None:
+            self.idle_start = seq + 1
+        return max(self.idle_start, seq + 1 - PREROLL_FRAMES)
+
+    def wake(self):
+        try:
+            self.loop.call_soon_threadsafe(self.event.set)
+        except RuntimeError:
+            pass  # Loop của session đã đóng
+
+    async def read(self):
+        """(seq, timestamp, frame) tiếp theo, None khi source đã hết."""
+        daemon = self.daemon
+        if self.seq < daemon.next_seq:
+            if self.seq % self.CATCH_UP_YIELD_FRAMES == 0:
+                await asyncio.sleep(0)
+        while self.seq >= daemon.next_seq:
+            if daemon.ended:
+                return None
+            self.event.clear()
+            if self.seq < daemon.next_seq:
+                break
+            await self.event.wait()
+
+        oldest = daemon.oldest_seq
+        if self.seq < oldest:
+            self.overruns += oldest - self.seq
+            print(f"⚠️ Capture reader overrun: skipped {oldest - self.seq} frames")
+            self.seq = oldest
+        slot = self.seq % daemon.capacity
+        frame = bytes(daemon.ring_view[slot * daemon.frame_bytes:(slot + 1) * daemon.frame_bytes])
+        seq = self.seq
+        self.seq += 1
+        return seq, daemon.timestamps[slot], frame
+
+def get_capture_daemon() -> CaptureDaemon:
+    """Daemon dùng chung, tạo lại nếu source cũ đã hết (file replay)."""
+    global capture_daemon, resume_seq
+    if capture_daemon is None or capture_daemon.ended:
+        capture_daemon = CaptureDaemon()
+        resume_seq = None  # seq của daemon cũ không còn ý nghĩa
+    capture_daemon.start()
+    return capture_daemon
+
 # ============ VAD-BASED AUDIO STREAMING (OPTIMIZED) ============
 class VADAudioStreamer:
     """
-    Ultra-sensitive VAD Streamer cho mic yếu/cùi.
+    VAD Streamer cho mic yếu/cùi.
     - webrtcvad mode 0 (least aggressive)
-    - Gần như không lọc - gửi mọi âm thanh có tín hiệu
-    - Chỉ bỏ dead silence (RMS ≈ 0)
+    - Noise floor tự học (calibration + EMA), speech = RMS > floor x NOISE_FLOOR_MULTIPLIER + webrtcvad
+    - Hết speech → hangover → flush segment, tiếng ồn phòng không bị gửi lên
+    - process_frame() trả về list message cần gửi: memoryview (audio) hoặc dict (control JSON)
+    - Audio nằm trong 1 ring buffer cấp phát sẵn: pre-roll = lùi read pointer,
+      segment/chunk = memoryview [read_pos:write_pos], không copy bytes
+    - on_wrap: gọi ngay trước khi ring quay vòng (vùng cũ sắp bị ghi đè) → bên giữ memoryview
+      chưa gửi (SendQueue) phải copy ra bytes. Xử lý nhanh hơn real-time (đọc bù, file replay) vẫn an toàn.
     """
     MAX_SPEECH_SECONDS = 5.0   # 5s là đủ
+    MAX_SEGMENT_SECONDS = 8.0  # Giới hạn cứng (pre-roll + speech + hangover) để segment luôn nằm gọn trong ring
+    NO_MESSAGES = ()
 
-    def __init__(self):
+    def __init__(self, stream_chunk_ms: Optional[int] = None, noise_floor: Optional[float] = None):
         # Mode 0 = least aggressive (giữ nhiều tiếng nói hơn)
         self.vad = webrtcvad.Vad(0) if VAD_AVAILABLE else None
 
-        self.preroll_buffer = deque(maxlen=PREROLL_FRAMES)
-        self.speech_buffer = bytearray()
+        frame_bytes = FRAME_SIZE * 2
+        self.ring = bytearray(AUDIO_RING_SECONDS * 1000 // FRAME_DURATION_MS * frame_bytes)
+        self.ring_view = memoryview(self.ring)
+        self.ring_samples = np.frombuffer(self.ring, dtype=np.int16)
+        self.write_pos = 0         # Vị trí ghi frame tiếp theo
+        self.read_pos = 0          # Đầu phần audio của segment chưa gửi
+        self.preroll_bytes = 0     # Số byte im lặng ngay trước write_pos dùng làm pre-roll
+        self.preroll_max_bytes = PREROLL_FRAMES * frame_bytes
+        self.max_segment_bytes = int(self.MAX_SEGMENT_SECONDS * SAMPLE_RATE) * 2
+        self.rms_scratch = np.empty(FRAME_SIZE, dtype=np.float32)
+        self.on_wrap = None
 
         self.in_speech = False
         self.hangover_counter = 0
         self.speech_frame_count = 0
+        self.trace_id = None       # Câu hiện tại / vừa kết thúc (LatencyTracer)
+        self.last_speech_at = 0.0  # monotonic của frame có tiếng nói cuối cùng
+
+        # Streaming mode: gửi chunk ngay khi đủ stream_chunk_bytes thay vì chờ hết segment
+        self.stream_chunk_bytes = SAMPLE_RATE * stream_chunk_ms // 1000 * 2 if stream_chunk_ms else 0
+        self.segment_id = 0
+        self.messages = []
+
+        # Noise floor: học trong NOISE_CALIBRATION_FRAMES đầu, sau đó bám theo môi trường
+        self.calibration_rms = []
+        self.noise_floor = None
+        if noise_floor is not None:
+            # Reconnect: dùng lại noise floor của session trước, coi như đã calibrate
+            self.calibration_rms = [noise_floor] * NOISE_CALIBRATION_FRAMES
+            self.noise_floor = noise_floor
 
         # Stats
         self.frames_processed = 0
         self.frames_sent = 0
 
-    def _calculate_rms(self, audio_bytes: bytes) -> float:
-        """RMS calculation using numpy for speed."""
-        if len(audio_bytes) < 2:
+    def _calculate_rms(self, start: int, end: int) -> float:
+        """RMS của ring[start:end], dùng scratch float32 có sẵn (không tạo mảng tạm)."""
+        n = (end - start) // 2
+        if n < 1:
             return 0.0
-        samples = np.frombuffer(audio_bytes, dtype=np.int16)
-        return float(np.sqrt(np.mean(samples.astype(np.float32) ** 2)))
+        scratch = self.rms_scratch if n == len(self.rms_scratch) else np.empty(n, dtype=np.float32)
+        np.copyto(scratch, self.ring_samples[start // 2:end // 2])
+        return math.sqrt(float(np.dot(scratch, scratch)) / n)
+
+    def _write_frame(self, frame_bytes: bytes) -> int:
+        """Copy frame vào ring, trả về vị trí bắt đầu. Hết chỗ → dời phần đang giữ về đầu ring."""
+        n = len(frame_bytes)
+        if self.write_pos + n > len(self.ring):
+            # Dời segment đang gom (hoặc pre-roll) về đầu ring để memoryview luôn liền mạch.
+            # Từ đây vùng đã gửi đi bị ghi đè dần → memoryview còn nằm trong queue phải thành bytes trước.
+            if self.on_wrap:
+                self.on_wrap()
+            keep_from = self.read_pos if self.in_speech else self.write_pos - self.preroll_bytes
+            keep = self.write_pos - keep_from
+            self.ring_samples[:keep // 2] = self.ring_samples[keep_from // 2:self.write_pos // 2]
+            self.read_pos -= keep_from
+            self.write_pos = keep
+        start = self.write_pos
+        self.ring[start:start + n] = frame_bytes
+        self.write_pos = start + n
+        return start
+
+    def _update_noise_floor(self, rms: float, is_speech: bool):
+        """Calibration bằng percentile thấp, sau đó EMA chậm trên frame im lặng."""
+        if len(self.calibration_rms) < NOISE_CALIBRATION_FRAMES:
+            self.calibration_rms.append(rms)
+            self.noise_floor = float(np.percentile(self.calibration_rms, NOISE_FLOOR_PERCENTILE))
+            if len(self.calibration_rms) == NOISE_CALIBRATION_FRAMES:
+                print(f"🔇 Noise floor calibrated: RMS={self.noise_floor:.0f}")
+        elif not is_speech:
+            self.noise_floor += NOISE_FLOOR_ADAPT_RATE * (rms - self.noise_floor)
+
+    def _speech_threshold(self) -> float:
+        if self.noise_floor is None:
+            return MIN_RMS_THRESHOLD
+        return max(MIN_RMS_THRESHOLD, self.noise_floor * NOISE_FLOOR_MULTIPLIER)
+
+    def _is_speech(self, frame_bytes: bytes, rms: float) -> bool:
+        """RMS vượt noise floor VÀ webrtcvad xác nhận là giọng nói."""
+        if rms < 0.1 or rms < self._speech_threshold() or rms > MAX_RMS_THRESHOLD:
+            return False
+        if self.vad is None:
+            return True
+        try:
+            return self.vad.is_speech(frame_bytes, SAMPLE_RATE)
+        except Exception:
+            return True
 
-    def process_frame(self, frame_bytes: bytes) -> bytes:
+    def process_frame(self, frame_bytes: bytes) -> list:
         self.frames_processed += 1
 
-        rms = self._calculate_rms(frame_bytes)
+        frame_pos = self._write_frame(frame_bytes)
+        rms = self._calculate_rms(frame_pos, self.write_pos)
+        is_speech = self._is_speech(frame_bytes, rms)
+        self._update_noise_floor(rms, is_speech)
 
         # Debug log mỗi 200 frames (~6s)
         if self.frames_processed % 200 == 0:
-            print(f"🎤 RMS={rms:.0f} | in_speech={self.in_speech}")
-
-        # CHỈ bỏ khi hoàn toàn im lặng tuyệt đối (digital zero)
-        if rms < 0.1:
-            if not self.in_speech:
-                self.preroll_buffer.append(frame_bytes)
-            return b''
-
-        # KHÔNG skip clipping - mic yếu không bao giờ clip
-
-        # ===== ULTRA SENSITIVE: coi MỌI tín hiệu > 0 là speech =====
-        # VAD chỉ dùng làm tham khảo, nhưng RMS > 0 luôn = speech
-        is_speech = True  # Mọi âm thanh không phải dead silence đều là speech
+            print(f"🎤 RMS={rms:.0f} | floor={self.noise_floor:.0f} | in_speech={self.in_speech}")
 
         if is_speech:
             if not self.in_speech:
                 self.in_speech = True
                 self.speech_frame_count = 0
-                print(f"🎙️ Speech START (rms={rms:.0f})")
-                for pf in self.preroll_buffer:
-                    self.speech_buffer.extend(pf)
-                self.preroll_buffer.clear()
+                self.segment_id += 1
+                self.trace_id = tracer.new_segment()
+                tracer.mark(self.trace_id, 'speech_start', segment_id=self.segment_id)
+                print(f"🎙️ Speech START #{self.segment_id} (rms={rms:.0f}, threshold={self._speech_threshold():.0f})")
+                if self.stream_chunk_bytes:
+                    self.messages.append({'type': 'segment_start', 'segment_id': self.segment_id})
+                # Pre-roll: lùi read pointer, audio đã nằm sẵn trong ring
+                self.read_pos = frame_pos - self.preroll_bytes
+                self.preroll_bytes = 0
 
-            self.speech_buffer.extend(frame_bytes)
             self.speech_frame_count += 1
             self.hangover_counter = HANGOVER_FRAMES
+            self.last_speech_at = time.monotonic()
 
-            if self.speech_frame_count >= int(self.MAX_SPEECH_SECONDS * 1000 / FRAME_DURATION_MS):
-                return self._flush()
+            if (self.speech_frame_count >= int(self.MAX_SPEECH_SECONDS * 1000 / FRAME_DURATION_MS)
+                    or self.write_pos - self.read_pos >= self.max_segment_bytes):
+                self._flush()
+            else:
+                self._emit_stream_chunk()
         else:
             if self.in_speech:
-                if self.hangover_counter > 0:
-                    self.speech_buffer.extend(frame_bytes)
+                if self.hangover_counter > 0 and self.write_pos - self.read_pos < self.max_segment_bytes:
                     self.hangover_counter -= 1
+                    self._emit_stream_chunk()
                 else:
-                    return self._flush()
+                    print("🤫 Speech END")
+                    self._flush(end=frame_pos)  # Frame im lặng hiện tại không thuộc segment
             else:
-                self.preroll_buffer.append(frame_bytes)
+                self.preroll_bytes = min(self.preroll_bytes + len(frame_bytes), self.preroll_max_bytes)
+
+        return self._take_messages()
 
-        return b''
+    def _take_messages(self) -> list:
+        if not self.messages:
+            return self.NO_MESSAGES
+        messages, self.messages = self.messages, []
+        return messages
 
-    def _flush(self) -> bytes:
-        """Flush speech buffer if meets minimum length."""
+    def _emit_stream_chunk(self):
+        """Streaming mode: đẩy audio đã gom đi ngay khi đủ 1 chunk."""
+        if self.stream_chunk_bytes and self.write_pos - self.read_pos >= self.stream_chunk_bytes:
+            self.messages.append(self.ring_view[self.read_pos:self.write_pos])
+            self.read_pos = self.write_pos
+
+    def _flush(self, end: Optional[int] = None):
+        """Kết thúc segment: batch → cả segment (nếu đủ dài), stream → phần còn lại + segment_end."""
+        end = self.write_pos if end is None else end
         self.in_speech = False
         self.hangover_counter = 0
-        
-        if self.speech_frame_count >= MIN_SPEECH_FRAMES:
-            result = bytes(self.speech_buffer)
+        tracer.mark(self.trace_id, 'speech_end', t=self.last_speech_at)
+        tracer.mark(self.trace_id, 'segment_end', frames=self.speech_frame_count)
+
+        if self.stream_chunk_bytes:
+            if end > self.read_pos:
+                self.messages.append(self.ring_view[self.read_pos:end])
+            self.messages.append({'type': 'segment_end', 'segment_id': self.segment_id})
             self.frames_sent += self.speech_frame_count
-        else:
-            result = b''
-        
-        self.speech_buffer = bytearray()
+        elif self.speech_frame_count >= MIN_SPEECH_FRAMES:
+            self.messages.append(self.ring_view[self.read_pos:end])
+            self.frames_sent += self.speech_frame_count
+
+        self.read_pos = self.write_pos
         self.speech_frame_count = 0
-        return result
 
-    def flush(self) -> bytes:
+    def flush(self) -> list:
         """Force flush remaining buffer."""
-        return self._flush()
+        if self.in_speech:
+            self._flush()
+        return self._take_messages()
 
     def get_stats(self) -> dict:
         total = self.frames_processed or 1
@@ -655,125 +1523,603 @@ class VADAudioStreamer:
             'reduction': f"{100 * (1 - self.frames_sent / total):.1f}%"
         }
 
-async def stream_audio_to_server(ws):
-    """Stream audio to server with VAD filtering."""
-    global stop_streaming, current_state
-    
-    streamer = VADAudioStreamer()
-    frame_bytes = FRAME_SIZE * 2  # 16-bit
+# ============ SEND QUEUE ============
+class SendQueue:
+    """
+    Hàng đợi bounded giữa VADAudioStreamer và WebSocket.
+    put() không bao giờ block (gọi từ vòng đọc mic), sender task gọi get().
+    Chỉ message audio (bytes/memoryview) bị giới hạn; control (dict) luôn giữ để segment không lệch.
+    Audio chờ quá max_age giây bị bỏ (quá cũ).
+    memoryview vào ring của VADAudioStreamer: giữ nguyên (không copy) tới khi ring quay vòng → detach_views().
+    """
+
+    def __init__(self, max_audio: int = MAX_PENDING_BATCHES, policy: str = SEND_QUEUE_POLICY,
+                 spill_dir: str = SEND_SPILL_DIR, max_age: float = SEND_MAX_AGE_SEC):
+        if policy not in ('drop_oldest', 'merge', 'spill'):
+            print(f"⚠️ SEND_QUEUE_POLICY không hỗ trợ: {policy} → drop_oldest")
+            policy = 'drop_oldest'
+        self.max_audio = max_audio
+        self.policy = policy
+        self.spill_dir = spill_dir
+        self.max_age = max_age
+        self.items = deque()    # (thời điểm put, message, trace_id)
+        self.audio_count = 0
+        self.spilled = deque()  # (file spill, trace_id) theo thứ tự FIFO (luôn mới hơn self.items)
+        self.spill_seq = 0
+        self.ready = asyncio.Event()
+        self.closed = False
+        self.sending = False    # Sender đang await ws.send
+        # Counters
+        self.max_depth = 0
+        self.dropped = 0
+        self.dropped_bytes = 0
+        self.expired = 0
+        self.merged = 0
+        self.spill_count = 0
+        self.detached = 0
+
+    @property
+    def depth(self) -> int:
+        return len(self.items) + len(self.spilled)
+
+    @property
+    def idle(self) -> bool:
+        """Mọi message đã put đều đã ghi xong vào socket."""
+        return not self.items and not self.spilled and not self.sending
+
+    @property
+    def full(self) -> bool:
+        return self.audio_count >= self.max_audio
+
+    def put(self, message, trace_id: Optional[int] = None):
+        """trace_id: câu (segment VAD) chứa message, để LatencyTracer ghép lúc gửi xong."""
+        if self.closed:
+            return
+        is_audio = not isinstance(message, dict)
+        if self.spilled:
+            # Đang có dữ liệu trên đĩa → ghi tiếp ra đĩa để giữ thứ tự
+            self._spill(message, trace_id)
+        elif not is_audio or self.audio_count < self.max_audio:
+            self._append(message, trace_id)
+        elif self.policy == 'merge' and self.items and not isinstance(self.items[-1][1], dict):
+            put_time, last, _ = self.items[-1]
+            self.items[-1] = (put_time, bytes(last) + message, trace_id)
+            self.merged += 1
+        elif self.policy == 'spill':
+            self._spill(message, trace_id)
+        else:
+            self._drop_oldest_audio()
+            self._append(message, trace_id)
+        self.max_depth = max(self.max_depth, self.depth)
+        self.ready.set()
+
+    def _append(self, message, trace_id):
+        self.items.append((time.monotonic(), message, trace_id))
+        if not isinstance(message, dict):
+            self.audio_count += 1
+
+    def _drop_oldest_audio(self):
+        for i, (_, item, _) in enumerate(self.items):
+            if not isinstance(item, dict):
+                del self.items[i]
+                self.audio_count -= 1
+                self.dropped += 1
+                self.dropped_bytes += len(item)
+                print(f"⚠️ Send queue full → dropped {len(item)} bytes (total {self.dropped})")
+                return
+
+    def detach_views(self):
+        """Ring sắp ghi đè: copy memoryview còn chờ gửi ra bytes (hiếm: chỉ khi queue tồn qua 1 vòng ring)."""
+        for i, (put_time, message, trace_id) in enumerate(self.items):
+            if isinstance(message, memoryview):
+                self.items[i] = (put_time, bytes(message), trace_id)
+                self.detached += 1
+
+    def _spill(self, message, trace_id):
+        os.makedirs(self.spill_dir, exist_ok=True)
+        path = os.path.join(self.spill_dir, f"{self.spill_seq:08d}.bin")
+        self.spill_seq += 1
+        with open(path, 'wb') as f:
+            if isinstance(message, dict):
+                f.write(b'J' + json.dumps(message).encode('utf-8'))
+            else:
+                f.write(b'A')
+                f.write(message)
+        self.spilled.append((path, trace_id))
+        self.spill_count += 1
 
-    print(f"🎤 Starting audio stream (frame={FRAME_DURATION_MS}ms)")
+    def _unspill(self):
+        path, trace_id = self.spilled.popleft()
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        finally:
+            os.remove(path)
+        return (json.loads(data[1:]) if data[:1] == b'J' else data[1:]), trace_id
 
-    process = subprocess.Popen([
-        'arecord', '-D', AUDIO_DEVICE,
-        '-f', 'S16_LE', '-r', str(SAMPLE_RATE),
-        '-c', str(CHANNELS), '-t', 'raw', '-'
-    ], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=frame_bytes * 2)
+    async def get(self):
+        """(message, trace_id) tiếp theo, None khi đã close và gửi hết."""
+        while True:
+            if self.items:
+                put_time, message, trace_id = self.items.popleft()
+                if isinstance(message, dict):
+                    return message, trace_id
+                self.audio_count -= 1
+                if time.monotonic() - put_time <= self.max_age:
+                    return message, trace_id
+                self.expired += 1
+                self.dropped_bytes += len(message)
+                print(f"⚠️ Dropped stale audio ({len(message)} bytes, >{self.max_age:.0f}s in queue)")
+                continue
+            if self.spilled:
+                return self._unspill()
+            if self.closed:
+                return None
+            self.ready.clear()
+            await self.ready.wait()
+
+    def close(self):
+        self.closed = True
+        self.ready.set()
+
+    def discard(self):
+        """Bỏ toàn bộ phần còn lại (kể cả file spill)."""
+        self.items.clear()
+        self.audio_count = 0
+        while self.spilled:
+            try:
+                os.remove(self.spilled.popleft()[0])
+            except OSError:
+                pass
+
+    def get_stats(self) -> dict:
+        return {
+            'policy': self.policy,
+            'depth': self.depth,
+            'max_depth': self.max_depth,
+            'dropped': self.dropped,
+            'expired': self.expired,
+            'dropped_bytes': self.dropped_bytes,
+            'merged': self.merged,
+            'spilled': self.spill_count,
+            'detached': self.detached,
+        }
+
+def is_segment_end(message) -> bool:
+    """Batch: mỗi audio là 1 segment. Stream: segment kết thúc ở 'segment_end'."""
+    if isinstance(message, dict):
+        return message.get('type') == 'segment_end'
+    return STREAM_MODE != 'stream'
+
+async def send_queue_worker(ws, send_queue: SendQueue, uplink: 'UplinkController'):
+    """Sender task: lấy từ SendQueue và gửi, dừng khi queue close + rỗng hoặc mất kết nối."""
+    global segments_sent
+    while True:
+        item = await send_queue.get()
+        if item is None:
+            return
+        message, trace_id = item
+        send_queue.sending = True
+        try:
+            await send_stream_message(ws, message, uplink)
+            if is_segment_end(message):
+                segments_sent += 1
+                tracer.bind_seq(trace_id, segments_sent)
+                tracer.mark(trace_id, 'sent', seq=segments_sent)
+                segment_sent_times[segments_sent] = time.time()
+                while len(segment_sent_times) > 64:
+                    del segment_sent_times[next(iter(segment_sent_times))]
+        except websockets.exceptions.ConnectionClosed:
+            print("🔌 Connection closed during send")
+            return
+        except Exception as e:
+            print(f"❌ Send error: {e}")
+            return
+        finally:
+            send_queue.sending = False
+
+# ============ UPLINK RATE CONTROL ============
+class UplinkController:
+    """
+    Chọn UPLINK_LEVELS theo tình trạng mạng đo được khi gửi:
+    - thời gian ws.send hoàn tất so với độ dài audio (EMA)
+    - số byte còn nằm trong write buffer của socket
+    Hạ level ngay khi nghẽn, nâng lại chậm (hysteresis) để không dao động.
+    """
+
+    def __init__(self, streamer: Optional['VADAudioStreamer'] = None):
+        self.streamer = streamer
+        self.level = 0
+        self.send_ratio = 0.0
+        self.fast_sends = 0
+        self.changed_at = time.monotonic()
+        self.announce = False
+        self._apply_level()
+
+    def _apply_level(self):
+        cfg = UPLINK_LEVELS[self.level]
+        self.codec = create_codec(cfg['codec'], cfg['sample_rate'], CHANNELS)
+        self.sample_rate = cfg['sample_rate']
+        self.downsample = max(1, SAMPLE_RATE // self.sample_rate)
+        if self.streamer and self.streamer.stream_chunk_bytes:
+            self.streamer.stream_chunk_bytes = SAMPLE_RATE * cfg['chunk_ms'] // 1000 * 2
+
+    def describe(self) -> dict:
+        info = self.codec.describe()
+        info['level'] = self.level
+        return info
+
+    def encode(self, pcm: bytes) -> bytes:
+        return self.codec.encode(downsample_pcm(pcm, self.downsample))
+
+    @staticmethod
+    def backlog(ws) -> int:
+        transport = getattr(ws, 'transport', None)
+        try:
+            return transport.get_write_buffer_size() if transport else 0
+        except Exception:
+            return 0
+
+    def on_sent(self, ws, pcm_bytes: int, send_seconds: float):
+        """Cập nhật số đo sau mỗi lần gửi audio, đổi level nếu cần."""
+        audio_seconds = pcm_bytes / 2 / SAMPLE_RATE or FRAME_DURATION_MS / 1000
+        self.send_ratio += 0.3 * (send_seconds / audio_seconds - self.send_ratio)
+        backlog = self.backlog(ws)
+        now = time.monotonic()
+
+        congested = self.send_ratio > UPLINK_SLOW_RATIO or backlog > UPLINK_MAX_BACKLOG_BYTES
+        self.fast_sends = self.fast_sends + 1 if self.send_ratio < UPLINK_FAST_RATIO and not backlog else 0
+
+        if congested and self.level < len(UPLINK_LEVELS) - 1:
+            self._set_level(self.level + 1, now, f"ratio={self.send_ratio:.2f} backlog={backlog}")
+        elif (self.fast_sends >= UPLINK_RECOVER_SENDS and self.level > 0
+              and now - self.changed_at >= UPLINK_MIN_HOLD_SEC):
+            self._set_level(self.level - 1, now, f"ratio={self.send_ratio:.2f}")
+
+    def _set_level(self, level: int, now: float, reason: str):
+        self.level = level
+        self.changed_at = now
+        self.fast_sends = 0
+        self.send_ratio = 0.0
+        self.announce = True
+        self._apply_level()
+        cfg = UPLINK_LEVELS[level]
+        print(f"📶 Uplink level {level}: {cfg['codec']} {cfg['sample_rate']}Hz {cfg['chunk_ms']}ms ({reason})")
+
+def wire_seq(message) -> int:
+    """Seq trong header binary: audio / segment_* thuộc segment đang gửi (segments_sent + 1), control khác = 0."""
+    if not isinstance(message, dict) or message.get('type') in ('segment_start', 'segment_end'):
+        return segments_sent + 1
+    return 0
+
+async def send_control(ws, message: dict):
+    """Control message theo protocol đã thương lượng (JSON text hoặc binary frame)."""
+    await ws.send(wire.encode(message, wire_seq(message)))
+
+async def send_stream_message(ws, message, uplink: UplinkController):
+    """bytes → audio frame (đã encode codec), dict → control frame."""
+    if isinstance(message, dict):
+        await send_control(ws, message)
+        print(f"📤 {message['type']} #{message.get('segment_id', '')}")
+        return
+
+    # Đổi level → báo server trước khi gửi audio theo định dạng mới
+    if uplink.announce:
+        uplink.announce = False
+        message = bytes(message)  # memoryview vào ring: trong lúc chờ gửi control, ring có thể quay vòng
+        await send_control(ws, uplink.describe())
+
+    payload = uplink.encode(message)
+    start = time.monotonic()
+    await ws.send(wire.encode_audio(payload, wire_seq(message)))
+    uplink.on_sent(ws, len(message), time.monotonic() - start)
+    print(f"📤 Sent {len(payload)} bytes ({uplink.codec.name}, pcm={len(message)})")
+
+# ============ OFFLINE SPOOL ============
+def get_audio_spool() -> Optional[AudioSpool]:
+    global audio_spool
+    if audio_spool is None and SPOOL_ENABLED:
+        audio_spool = AudioSpool(SPOOL_DIR, max_bytes=SPOOL_MAX_MB * 1024 * 1024)
+    return audio_spool
+
+async def spool_offline_audio(seconds: float, wake: tuple = ()):
+    """
+    Đang offline: đọc capture daemon trong `seconds` giây, tách segment bằng VAD và ghi vào spool.
+    Chỉ ghi segment trọn vẹn; segment dở dang được đọc lại lần sau (resume_seq không qua nó).
+    Dừng sớm khi 1 event trong `wake` được set (mạng vừa thay đổi, đổi API_URL).
+    """
+    global resume_seq, resume_noise_floor
+
+    spool = get_audio_spool()
+    if spool is None:
+        await wait_any(wake, seconds)
+        return
+
+    daemon = get_capture_daemon()
+    start_seq = None if resume_seq is None else max(resume_seq, daemon.oldest_seq)
+    reader = daemon.attach(start_seq)
+    if resume_seq is None:
+        resume_seq = reader.seq
+    streamer = VADAudioStreamer(stream_chunk_ms=STREAM_CHUNK_MS if STREAM_MODE == 'stream' else None,
+                                noise_floor=resume_noise_floor)
+    segment = []
+    deadline = time.monotonic() + seconds
 
     try:
-        while not stop_streaming and websocket_connected:
-            frame = process.stdout.read(frame_bytes)
-            if not frame or len(frame) < frame_bytes:
+        while not stop_streaming and not any(event.is_set() for event in wake):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
                 break
+            try:
+                item = await asyncio.wait_for(reader.read(), remaining)
+            except asyncio.TimeoutError:
+                break
+            if item is None:
+                break
+            seq, captured_at, frame = item
+
+            for message in streamer.process_frame(frame):
+                segment.append((message, captured_at))
+            resume = reader.safe_resume_seq(seq, streamer.in_speech)
+            if resume is not None:
+                for message, ts in segment:
+                    spool.append(message, ts)
+                if segment:
+                    print(f"💾 Spooled segment #{streamer.segment_id} | {spool.get_stats()}")
+                segment = []
+                resume_seq = resume
+    finally:
+        daemon.detach(reader)
+        resume_noise_floor = streamer.noise_floor
 
-            # Xử lý VAD và gửi khi có speech
-            speech_data = streamer.process_frame(frame)
+async def drain_spool(spool: AudioSpool, send_queue: SendQueue, sender: asyncio.Task):
+    """Gửi bù spool theo thứ tự, giới hạn SPOOL_DRAIN_SPEED x real-time. Record chỉ bị xóa sau khi đã gửi."""
+    if not spool.pending:
+        return
+    print(f"📤 Draining spool: {spool.get_stats()}")
+    spool.draining = True  # Spool đầy trong lúc gửi → bỏ segment sau, không bỏ segment đang gửi dở
+    try:
+        while spool.pending and not sender.done():
+            message, captured_at, record = spool.peek()
+            send_queue.put(message)
+            while not send_queue.idle and not sender.done():
+                await asyncio.sleep(FRAME_DURATION_MS / 1000)
+            if sender.done():
+                break  # Mất kết nối giữa chừng → record còn trong spool, gửi lại lần sau
+            spool.pop(record)
+
+            # Mỗi segment (batch: 1 audio, stream: tới segment_end) sẽ có 1 result
+            if is_segment_end(message):
+                spooled_result_times.append(captured_at)
+            if not isinstance(message, dict):
+                await asyncio.sleep(len(message) / 2 / SAMPLE_RATE / SPOOL_DRAIN_SPEED)
+    finally:
+        spool.draining = False
+    if not spool.pending:
+        print("✅ Spool drained")
+
+def is_stale_result(data: dict) -> bool:
+    """Result của segment gửi bù quá SPOOL_RESULT_MAX_AGE_SEC → bỏ, không phát."""
+    if not spooled_result_times:
+        return False
+    captured_at = spooled_result_times.popleft()
+    captured_at = data.get('captured_at', captured_at)  # Server echo thì dùng giá trị đó
+    age = time.time() - captured_at
+    if age > SPOOL_RESULT_MAX_AGE_SEC:
+        print(f"⌛ Dropped late result ({age:.0f}s old): {data.get('transcript', '')}")
+        return True
+    print(f"📬 Late result ({age:.0f}s old)")
+    return False
 
-            if speech_data:
-                try:
-                    await ws.send(speech_data)
-                    print(f"📤 Sent {len(speech_data)} bytes")
-                except websockets.exceptions.ConnectionClosed:
-                    print("🔌 Connection closed during send")
-                    break
-                except Exception as e:
-                    print(f"❌ Send error: {e}")
-                    break
-            
-            # Nhỏ delay để không block asyncio
-            await asyncio.sleep(0.001)
+async def stream_audio_to_server(ws):
+    """Stream audio to server with VAD filtering."""
+    global stop_streaming, current_state, resume_seq, resume_noise_floor, record_pressed_at
+    
+    streaming = STREAM_MODE == 'stream'
+    streamer = VADAudioStreamer(stream_chunk_ms=STREAM_CHUNK_MS if streaming else None,
+                                noise_floor=resume_noise_floor)
+    uplink = UplinkController(streamer)
+    send_queue = SendQueue()
+    streamer.on_wrap = send_queue.detach_views
+
+    print(f"🎤 Starting audio stream (frame={FRAME_DURATION_MS}ms, mode={'stream' if streaming else 'batch'}, codec={uplink.codec.name})")
+
+    # Handshake: báo codec để server decode đúng
+    await send_control(ws, uplink.describe())
+
+    # Capture daemon chạy suốt; reconnect → đọc lại từ frame cuối đã gửi xong (resume_seq đã gồm pre-roll im lặng)
+    daemon = get_capture_daemon()
+    start_seq = None
+    if resume_seq is not None:
+        start_seq = max(resume_seq, daemon.oldest_seq)
+        print(f"⏪ Resuming {(daemon.next_seq - start_seq) * FRAME_DURATION_MS / 1000:.1f}s of buffered audio")
+    reader = daemon.attach(start_seq)
+    if resume_seq is None:
+        resume_seq = reader.seq
+    if record_pressed_at is not None:
+        print(f"⚡ Press → streaming: {(time.monotonic() - record_pressed_at) * 1000:.0f}ms")
+        record_pressed_at = None
+
+    sender = asyncio.create_task(send_queue_worker(ws, send_queue, uplink))
+
+    # Spool còn dữ liệu (offline / reboot trước đó) → gửi bù trước, audio mới xếp sau trong spool
+    spool = get_audio_spool()
+    spooled_result_times.clear()
+    drainer = asyncio.create_task(drain_spool(spool, send_queue, sender)) if spool else None
+
+    def deliver(message, captured_at):
+        if spool and spool.pending:
+            spool.append(message, captured_at)
+        else:
+            send_queue.put(message, streamer.trace_id)
 
-    finally:
-        # Flush remaining
-        if websocket_connected:
-            try:
-                remain = streamer.flush()
-                if remain:
-                    await ws.send(remain)
-                await ws.send(json.dumps({'type': 'flush'}))
-            except:
-                pass
+    try:
+        while not stop_streaming and websocket_connected and not sender.done():
+            # Đang đọc bù audio cũ: chờ queue vơi thay vì drop (daemon vẫn ghi, không mất gì)
+            while reader.lag_frames > 1 and send_queue.full and not sender.done():
+                await asyncio.sleep(FRAME_DURATION_MS / 1000)
 
-        process.terminate()
-        process.wait()
-        print(f"🎤 Stream ended: {streamer.get_stats()}")
+            item = await reader.read()
+            if item is None:
+                break
+            seq, captured_at, frame = item
+
+            # Xử lý VAD, đưa vào hàng đợi gửi (không chờ mạng)
+            for message in streamer.process_frame(frame):
+                deliver(message, captured_at)
+
+            # Không có segment dở dang và mọi thứ đã gửi (hoặc đã nằm trong spool) → điểm resume an toàn.
+            # Sender đã chết thì message cuối có thể gửi hỏng → không tiến resume_seq.
+            resume = reader.safe_resume_seq(seq, streamer.in_speech)
+            if resume is not None and not sender.done() and (send_queue.idle or (spool and spool.pending)):
+                resume_seq = resume
+                # Map segment đã gửi → vị trí capture ngay sau nó (không map được khi còn spool)
+                if spool and spool.pending:
+                    segment_resume_points.clear()
+                elif not segment_resume_points or segment_resume_points[-1][0] != segments_sent:
+                    segment_resume_points.append((segments_sent, resume))
+                if endpoint_changed.is_set():
+                    break  # Đổi server: dừng ở ranh giới segment, server mới nhận tiếp từ resume_seq
+
+    finally:
+        if drainer:
+            drainer.cancel()
+        # Flush remaining (đổi server giữa câu → câu dở gửi lại cho server mới từ resume_seq, không flush ở đây)
+        if websocket_connected and not sender.done() and not endpoint_changed.is_set():
+            for message in streamer.flush():
+                deliver(message, time.time())
+            if not (spool and spool.pending):
+                send_queue.put({'type': 'flush'})
+        send_queue.close()
+        try:
+            await asyncio.wait_for(sender, timeout=SEND_QUEUE_DRAIN_SEC)
+        except asyncio.TimeoutError:
+            print(f"⚠️ Send queue not drained in {SEND_QUEUE_DRAIN_SEC}s, discarding {send_queue.depth} messages")
+        send_queue.discard()
+
+        daemon.detach(reader)
+        resume_noise_floor = streamer.noise_floor
+        print(f"🎤 Stream ended: {streamer.get_stats()} | queue: {send_queue.get_stats()}")
+
+def forget_sent_segment(seq):
+    """Segment đã có phản hồi (filtered / error): bỏ khỏi segment_sent_times. Không có seq → segment gửi sớm nhất."""
+    if seq is None and segment_sent_times:
+        seq = next(iter(segment_sent_times))
+    segment_sent_times.pop(seq, None)
+
+def describe_result_segment(data: dict) -> str:
+    """Result có seq (binary header / server echo) → ghép với segment đã gửi, kèm độ trễ từ lúc gửi xong."""
+    seq = data.get('seq')
+    if not isinstance(seq, int) or seq <= 0:
+        return ""
+    sent_at = segment_sent_times.pop(seq, None)
+    if sent_at is None:
+        return f" #{seq}"
+    return f" #{seq} (+{(time.time() - sent_at) * 1000:.0f}ms)"
+
+def handle_server_message(data: dict):
+    """Xử lý 1 message JSON từ server (dùng chung cho handshake và receive loop)."""
+    global current_state, websocket_connected
+
+    msg_type = data.get('type', '')
+
+    if msg_type == 'connected':
+        websocket_connected = True
+        print(f"✅ Connected: {data.get('message', '')}")
+        # State do nút bấm quyết định (kết nối mở sẵn cả khi chưa ghi)
+
+    elif msg_type == 'buffering':
+        progress = data.get('progress', 0)
+        print(f"   📊 Buffering: {progress*100:.0f}%")
+
+    elif msg_type == 'result':
+        # Result của segment gửi bù từ spool không có trace (không ghép theo thứ tự khi thiếu seq)
+        trace_id = tracer.match_result(data.get('seq'), fifo=not spooled_result_times)
+        tracer.mark(trace_id, 'result', seq=data.get('seq'))
+        transcript = data.get('transcript', '')
+        words = data.get('words', [])
+        vsl_text = data.get('vsl_text', '')
+        original_text = data.get('original_text', '')
+        confidence = data.get('confidence', 0)
+        
+        print(f"📝 Result{describe_result_segment(data)}: {transcript} → {words}")
+        print(f"   VSL: {vsl_text} | Conf: {confidence:.2f}")
+        
+        if is_stale_result(data):
+            pass
+        elif words:
+            if clip_prefetcher:
+                clip_prefetcher.commit(words)
+            # ✅ CHỈ enqueue, KHÔNG block receive loop
+            job = VideoJob(
+                words=words,
+                transcript=transcript,
+                vsl_text=vsl_text,
+                original_text=original_text,
+                confidence=confidence,
+                received_at=time.monotonic(),
+                seq=data.get('seq') or 0,
+                trace_id=trace_id
+            )
+            enqueue_video_job(job)
+            
+        else:
+            print(f"⚠️ Empty words: {transcript}")
+
+    elif msg_type in ('partial', 'interim'):
+        # Kết quả tạm: chỉ mở sẵn clip, không phát
+        words = data.get('words', [])
+        if clip_prefetcher and words:
+            clip_prefetcher.speculate(words)
+            print(f"🔮 Partial: {words}")
+
+    elif msg_type == 'filtered':
+        tracer.mark(tracer.match_result(data.get('seq'), fifo=not spooled_result_times), 'filtered')
+        forget_sent_segment(data.get('seq'))
+        if spooled_result_times:
+            spooled_result_times.popleft()
+        reason = data.get('reason', 'unknown')
+        transcript = data.get('transcript', '')
+        print(f"🚫 Filtered: {transcript} ({reason})")
+        # Không hiển thị lên LCD - giữ nguyên màn hình
+
+    elif msg_type == 'ack':
+        on_segment_ack(data.get('seq'))
+
+    elif msg_type == 'resumed':
+        on_session_resumed(data)
+
+    elif msg_type == 'error':
+        # Server trả đúng 1 message / segment (result, filtered hoặc error)
+        tracer.mark(tracer.match_result(data.get('seq'), fifo=not spooled_result_times), 'error')
+        forget_sent_segment(data.get('seq'))
+        if spooled_result_times:
+            spooled_result_times.popleft()
+        error_msg = data.get('error', 'Unknown error')
+        print(f"❌ Server error: {error_msg}")
+        show_message(["❌ Lỗi", "", error_msg[:30]], (255, 100, 100))
+
+    elif msg_type == 'pong':
+        pass  # Heartbeat response
 
 async def receive_results(ws):
     """✅ Receive results và CHỈ enqueue job. KHÔNG phát video ở đây (avoid blocking)."""
-    global current_state, stop_streaming, websocket_connected
+    global websocket_connected
 
     try:
         async for message in ws:
-            if stop_streaming:
+            if shutting_down:
                 break
 
             try:
-                data = json.loads(message)
-                msg_type = data.get('type', '')
-
-                if msg_type == 'connected':
-                    websocket_connected = True
-                    print(f"✅ Connected: {data.get('message', '')}")
-                    current_state = State.RECORDING
-                    # Giữ nguyên màn hình - đang chờ kết quả
-
-                elif msg_type == 'buffering':
-                    progress = data.get('progress', 0)
-                    print(f"   📊 Buffering: {progress*100:.0f}%")
-
-                elif msg_type == 'result':
-                    transcript = data.get('transcript', '')
-                    words = data.get('words', [])
-                    vsl_text = data.get('vsl_text', '')
-                    original_text = data.get('original_text', '')
-                    confidence = data.get('confidence', 0)
-                    
-                    print(f"📝 Result: {transcript} → {words}")
-                    print(f"   VSL: {vsl_text} | Conf: {confidence:.2f}")
-                    
-                    if words:
-                        # ✅ CHỈ enqueue, KHÔNG block receive loop
-                        job = VideoJob(
-                            words=words,
-                            transcript=transcript,
-                            vsl_text=vsl_text,
-                            original_text=original_text,
-                            confidence=confidence
-                        )
-                        enqueue_video_job(job)
-                        
-                    else:
-                        print(f"⚠️ Empty words: {transcript}")
-
-                elif msg_type == 'filtered':
-                    reason = data.get('reason', 'unknown')
-                    transcript = data.get('transcript', '')
-                    print(f"🚫 Filtered: {transcript} ({reason})")
-                    # Không hiển thị lên LCD - giữ nguyên màn hình
-
-                elif msg_type == 'error':
-                    error_msg = data.get('error', 'Unknown error')
-                    print(f"❌ Server error: {error_msg}")
-                    show_message(["❌ Lỗi", "", error_msg[:30]], (255, 100, 100))
-
-                elif msg_type == 'pong':
-                    pass  # Heartbeat response
+                data = wire.decode(message)
+                handle_server_message(data)
 
                 # Free memory
                 del data
 
-            except json.JSONDecodeError as e:
-                print(f"❌ JSON decode error: {e}")
+            except ValueError as e:
+                print(f"❌ Decode error ({wire.name}): {e}")
             except Exception as e:
                 print(f"❌ Message handling error: {e}")
 
@@ -784,105 +2130,425 @@ async def receive_results(ws):
     finally:
         websocket_connected = False
 
+# ============ SESSION RESUME ============
+def on_segment_ack(seq):
+    """Server đã xử lý xong segment seq → không cần giữ điểm quay lại của các segment trước nó."""
+    global last_ack_seq
+    if not isinstance(seq, int):
+        return
+    last_ack_seq = seq if last_ack_seq is None else max(last_ack_seq, seq)
+    while len(segment_resume_points) > 1 and segment_resume_points[1][0] <= last_ack_seq:
+        segment_resume_points.popleft()
+
+def on_session_resumed(data: dict):
+    """
+    Server báo segment cuối nó nhận được của session. Nếu ít hơn số đã gửi
+    (server restart / mất message), quay resume_seq về ngay sau segment đó để gửi lại.
+    """
+    global resume_seq, segments_sent, last_ack_seq
+    server_ack = data.get('last_ack')
+    print(f"🔁 Session resumed: server last_ack={server_ack}, sent={segments_sent}")
+    if not isinstance(server_ack, int) or server_ack >= segments_sent:
+        return
+    for sent, frame_seq in segment_resume_points:
+        if sent == server_ack:
+            resume_seq = frame_seq
+            segments_sent = server_ack
+            last_ack_seq = server_ack
+            print(f"⏪ Rewinding to segment {server_ack} (frame {frame_seq})")
+            return
+    print("⚠️ Segment chưa ack đã ra khỏi capture ring, không gửi lại được")
+
+async def resume_session(ws):
+    """
+    Handshake: gửi session_id + số segment đã gửi/ack, chờ 'resumed' trước khi stream audio
+    (để kịp quay resume_seq). Message khác đến trước vẫn được xử lý bình thường.
+    """
+    global server_supports_resume
+    await send_control(ws, {
+        'type': 'session',
+        'session_id': session_id,
+        'resume': segments_sent > 0 or reconnect_count > 0,
+        'segments_sent': segments_sent,
+        'last_ack': last_ack_seq,
+    })
+    if server_supports_resume is False:
+        return
+
+    deadline = time.monotonic() + SESSION_HANDSHAKE_TIMEOUT
+    while True:
+        try:
+            reply = await asyncio.wait_for(ws.recv(), deadline - time.monotonic())
+        except asyncio.TimeoutError:
+            print("⚠️ Server không hỗ trợ session resume, bỏ qua handshake")
+            server_supports_resume = False
+            return
+        try:
+            data = wire.decode(reply)
+        except (ValueError, TypeError):
+            continue
+        handle_server_message(data)
+        if data.get('type') == 'resumed':
+            server_supports_resume = True
+            return
+
 # ❌ REMOVED: play_video_sequence_direct()
 # Lý do: Function này BLOCK receive_results loop → không nhận result mới khi phát video
 # ✅ Thay bằng: enqueue_video_job() + video_playback_worker() thread độc lập
 
 async def send_heartbeat(ws):
-    """Send periodic heartbeat."""
+    """Send periodic heartbeat (giữ kết nối ấm cả khi không ghi)."""
     try:
-        while not stop_streaming and websocket_connected:
+        while not shutting_down and websocket_connected:
             await asyncio.sleep(15)
             if websocket_connected:
                 try:
-                    await ws.send(json.dumps({'type': 'ping'}))
+                    await send_control(ws, {'type': 'ping'})
                 except:
                     break
     except:
         pass
 
-async def websocket_session():
-    """Main WebSocket session - uses asyncio.wait like old working code."""
-    global current_state, stop_streaming, websocket_connected, reconnect_count, is_recording
+async def stream_while_recording(ws):
+    """Kết nối mở sẵn: chỉ gửi audio khi nút bật ghi. Dừng ghi → chờ lần bấm sau, không đóng kết nối."""
+    while websocket_connected and not shutting_down and not endpoint_changed.is_set():
+        await wait_any((recording_event, endpoint_changed))
+        if endpoint_changed.is_set():
+            break
+        if stop_streaming:
+            recording_event.clear()  # Vừa bấm dừng (clear từ thread nút chưa tới)
+            continue
+        await stream_audio_to_server(ws)
 
-    ws_url = f"{API_URL}{WS_ENDPOINT}"
+async def report_playback(ws):
+    """
+    Báo server trạng thái phát: khi queue / job đổi và mỗi PLAYBACK_REPORT_SEC lúc đang phát,
+    để server gộp / rút gọn / giữ lại result thay vì gửi result sẽ bị pending queue bỏ.
+    """
+    last_key = None
+    try:
+        while websocket_connected and not shutting_down:
+            state = await asyncio.to_thread(get_playback_state)
+            key = (state['job_id'], state['pending'], state['dropped'])
+            if key != last_key or state['playing'] or state['pending']:
+                await send_control(ws, state)
+                last_key = key
+            try:
+                await asyncio.wait_for(playback_changed.wait(), PLAYBACK_REPORT_SEC)
+            except asyncio.TimeoutError:
+                pass
+            playback_changed.clear()
+    except websockets.exceptions.ConnectionClosed:
+        pass
+
+def describe_connection(ws, handshake_ms: float):
+    """In thời gian connect (TCP + TLS + upgrade), TLS resume hay full handshake, có nén không."""
+    ssl_object = ws.transport.get_extra_info('ssl_object')
+    tls = ""
+    if ssl_object is not None:
+        tls = f", {ssl_object.version()} {'resumed' if ssl_object.session_reused else 'full handshake'}"
+    deflate = ws.response.headers.get('Sec-WebSocket-Extensions', '')
+    print(f"🔐 Connected in {handshake_ms:.0f}ms{tls}{', permessage-deflate' if 'deflate' in deflate else ''}")
+
+def remember_tls_session(ws):
+    """Lưu TLS session của kết nối này để lần reconnect sau resume."""
+    if isinstance(tls_context, ResumingSSLContext):
+        tls_context.remember(ws.transport)
+
+async def websocket_session() -> float:
+    """Main WebSocket session - uses asyncio.wait like old working code. Trả về số giây đã kết nối."""
+    global current_state, websocket_connected, wire, endpoint_changed_at
+
+    api_url = endpoints.current
+    ws_url = f"{api_url}{WS_ENDPOINT}"
     print(f"🔌 Connecting to: {ws_url}")
+    connected_at = None
+    subprotocols = available_subprotocols() if WIRE_PROTOCOL != 'json' else []
+    started = time.perf_counter()
 
     try:
         async with websockets.connect(
             ws_url,
+            subprotocols=subprotocols or None,
             ping_interval=30,
             ping_timeout=60,
-            close_timeout=10
+            close_timeout=10,
+            **connect_options(api_url)
         ) as ws:
             websocket_connected = True
-            current_state = State.RECORDING
-            reconnect_count = 0
+            connected_at = time.monotonic()
+            endpoints.mark_good(api_url)
+            if network_watcher:
+                # Mạng đổi lúc còn kết nối (DHCP renew, IPv6) không liên quan lần rớt sau → không bỏ qua backoff
+                network_watcher.changed.clear()
+            wire = create_protocol(ws.subprotocol)
+            print(f"🧬 Wire protocol: {wire.name}")
+            describe_connection(ws, (time.perf_counter() - started) * 1000)
+            if endpoint_changed_at is not None:
+                print(f"🔧 Server switched in {(time.monotonic() - endpoint_changed_at) * 1000:.0f}ms (no restart)")
+                endpoint_changed_at = None
+            if is_recording and current_state != State.PLAYING:
+                current_state = State.RECORDING
             # Giữ nguyên màn hình chờ - không hiển thị trạng thái
 
+            if SESSION_RESUME:
+                await resume_session(ws)
+                remember_tls_session(ws)  # Ticket TLS 1.3 đến sau handshake, trước 'resumed'
+
             # Tạo tasks
-            sender = asyncio.create_task(stream_audio_to_server(ws))
+            sender = asyncio.create_task(stream_while_recording(ws))
             receiver = asyncio.create_task(receive_results(ws))
             heartbeat = asyncio.create_task(send_heartbeat(ws))
+            switch = asyncio.create_task(endpoint_changed.wait())
+            tasks = [sender, receiver, heartbeat, switch]
+            if PLAYBACK_REPORT:
+                tasks.append(asyncio.create_task(report_playback(ws)))
 
             # Chờ bất kỳ task nào hoàn thành (giống code cũ)
             done, pending = await asyncio.wait(
-                [sender, receiver, heartbeat],
+                tasks,
                 return_when=asyncio.FIRST_COMPLETED
             )
+            if switch in done:
+                await drain_for_endpoint_switch(sender)
 
             # Cancel pending tasks
             for task in pending:
                 task.cancel()
+            remember_tls_session(ws)
 
     except websockets.exceptions.ConnectionClosed:
         print("🔌 Connection closed")
     except ConnectionRefusedError:
         print("❌ Connection refused - is server running?")
-        show_message(["Không thể kết nối!", "Server chưa chạy?"], (255, 100, 100))
+        if is_recording:
+            show_message(["Không thể kết nối!", "Server chưa chạy?"], (255, 100, 100))
     except Exception as e:
         print(f"❌ Connection error: {e}")
-        show_message(["Lỗi kết nối!", str(e)[:20]], (255, 100, 100))
+        if is_recording:
+            show_message(["Lỗi kết nối!", str(e)[:20]], (255, 100, 100))
     finally:
         websocket_connected = False
-        current_state = State.IDLE
+        if current_state != State.PLAYING:
+            current_state = State.CONNECTING if is_recording else State.IDLE
+
+    return time.monotonic() - connected_at if connected_at else 0.0
+
+# ============ CONFIG RELOAD ============
+async def wait_any(events, timeout: float = None) -> bool:
+    """Chờ tới khi 1 trong các asyncio.Event được set (True) hoặc hết timeout (False)."""
+    if not events:
+        await asyncio.sleep(timeout)
+        return False
+    waiters = [asyncio.create_task(event.wait()) for event in events]
+    try:
+        done, _ = await asyncio.wait(waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        return bool(done)
+    finally:
+        for waiter in waiters:
+            waiter.cancel()
+
+def _env_signature():
+    try:
+        st = os.stat(ENV_FILE)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_ino, st.st_size
+
+async def watch_config():
+    """
+    Poll .env mỗi CONFIG_POLL_SEC (BLE ghi API_URL mới) → đổi endpoint ngay trong process:
+    không import lại, không reset GPIO / LCD, không quét lại thư mục video như khi restart service.
+    """
+    global API_URLS, API_URL, tls_context, endpoint_changed_at
+    last = _env_signature()
+    while not shutting_down:
+        await asyncio.sleep(CONFIG_POLL_SEC)
+        current = _env_signature()
+        if current == last:
+            continue
+        last = current
+        try:
+            urls = parse_api_urls(dotenv_values(ENV_FILE).get("API_URL") or "")
+        except OSError:
+            continue
+        if not urls or urls == endpoints.urls:
+            continue
+        print(f"🔧 API_URL changed: {', '.join(endpoints.urls)} → {', '.join(urls)}")
+        API_URLS, API_URL = urls, urls[0]
+        if tls_context is None and any(u.startswith("wss://") for u in urls):
+            tls_context = create_tls_context(TLS_CA_FILE, TLS_SESSION_RESUME)
+        endpoints.set_urls(urls)
+        endpoint_changed_at = time.monotonic()
+        endpoint_changed.set()
+
+def awaiting_results(window_sec: float = 5.0) -> int:
+    """Segment gửi trong window_sec gần đây mà chưa có result / filtered."""
+    now = time.time()
+    return sum(1 for sent_at in segment_sent_times.values() if now - sent_at < window_sec)
+
+async def drain_for_endpoint_switch(sender):
+    """
+    Đổi server khi đang kết nối: để câu đang nói gửi xong (uplink tự dừng ở ranh giới segment)
+    và nhận nốt result của segment đã gửi, tối đa CONFIG_DRAIN_SEC rồi mới đóng kết nối cũ.
+    """
+    deadline = time.monotonic() + CONFIG_DRAIN_SEC
+    await asyncio.wait({sender}, timeout=CONFIG_DRAIN_SEC)
+    if not sender.done():
+        print("⚠️ Segment chưa xong khi đổi server → gửi lại cho server mới")
+    while awaiting_results() and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+    print(f"🔧 Old session drained ({awaiting_results()} result(s) not received)")
+
+def begin_new_session():
+    """Server mới không biết session cũ → session mới (không resume / rewind theo số segment cũ)."""
+    global session_id, segments_sent, last_ack_seq, server_supports_resume
+    session_id = uuid.uuid4().hex[:12]
+    segments_sent = 0
+    last_ack_seq = None
+    server_supports_resume = None
+    segment_resume_points.clear()
+    segment_sent_times.clear()
+
+async def run_session() -> float:
+    """websocket_session(); đang connect dở (server cũ không trả lời) mà đổi API_URL → bỏ luôn lần connect đó."""
+    session = asyncio.create_task(websocket_session())
+    switch = asyncio.create_task(endpoint_changed.wait())
+    try:
+        await asyncio.wait({session, switch}, return_when=asyncio.FIRST_COMPLETED)
+        if not session.done() and not websocket_connected:
+            session.cancel()
+            try:
+                await session
+            except asyncio.CancelledError:
+                pass
+            return 0.0
+        return await session  # Đã kết nối → session tự drain rồi đóng
+    finally:
+        switch.cancel()
+
+def reconnect_delay(attempt: int) -> float:
+    """Exponential backoff có jitter: ngẫu nhiên trong [cap/2, cap] để nhiều máy không reconnect cùng lúc."""
+    cap = min(RECONNECT_MAX_DELAY, RECONNECT_BASE_DELAY * 2 ** (attempt - 1))
+    return random.uniform(cap / 2, cap)
+
+async def wait_reconnect(seconds: float, network: NetworkWatcher):
+    """
+    Chờ backoff. Đang ghi → vẫn tách speech vào spool; chưa ghi → chỉ chờ,
+    bấm nút hoặc mạng đổi thì thử kết nối lại ngay.
+    """
+    if is_recording:
+        await spool_offline_audio(seconds, wake=(network.changed, endpoint_changed))
+        return
+    await wait_any((network.changed, recording_event, endpoint_changed), seconds)
 
 async def websocket_session_with_reconnect():
-    global reconnect_count, stop_streaming
+    global reconnect_count, network_watcher
 
-    while not stop_streaming and reconnect_count < MAX_RECONNECT_ATTEMPTS:
-        await websocket_session()
+    network_watcher = NetworkWatcher(poll_sec=NETWORK_POLL_SEC)
+    print(f"🌐 Network watcher: {network_watcher.mode}")
 
-        if stop_streaming:
-            break
+    if endpoints.multiple:
+        if endpoints.from_cache:
+            print(f"📡 Last good server (cached): {endpoints.current}")
+        else:
+            print(f"📡 Probing {len(endpoints.urls)} servers...")
+            await endpoints.select()
+
+    config_watch = asyncio.create_task(watch_config())
+
+    try:
+        while not shutting_down:
+            if endpoint_changed.is_set():
+                endpoint_changed.clear()
+                begin_new_session()
+                reconnect_count = 0
+                if endpoints.multiple:
+                    await endpoints.select()
+
+            connected_for = await run_session()
 
-        reconnect_count += 1
-        if reconnect_count < MAX_RECONNECT_ATTEMPTS:
-            print(f"🔄 Reconnecting ({reconnect_count}/{MAX_RECONNECT_ATTEMPTS})...")
-            await asyncio.sleep(RECONNECT_DELAY)
+            if shutting_down:
+                break
+            if endpoint_changed.is_set():
+                continue  # Đổi API_URL: kết nối server mới ngay, không backoff
+
+            # Session ổn định một lúc rồi mới rớt → coi như lỗi mới, backoff lại từ đầu
+            if connected_for >= RECONNECT_STABLE_SEC:
+                reconnect_count = 0
+            reconnect_count += 1
+
+            # Nhiều server: probe lại, server khác còn sống → chuyển sang ngay (vòng đầu không backoff)
+            if endpoints.multiple:
+                previous = endpoints.current
+                if await endpoints.select() and reconnect_count <= len(endpoints.urls):
+                    print(f"🔀 Failover: {previous} → {endpoints.current}")
+                    continue
+            if reconnect_count == MAX_RECONNECT_ATTEMPTS and is_recording:
+                print("📴 Server unreachable → offline mode" + (", speech is spooled to disk" if SPOOL_ENABLED else ""))
+                show_message(["Mất kết nối", "", "Đang lưu offline", "sẽ gửi khi có mạng"], (255, 220, 120))
+
+            delay = reconnect_delay(reconnect_count)
+            print(f"🔄 Reconnecting #{reconnect_count} in {delay:.1f}s...")
+            # Chờ backoff (đang ghi thì lưu speech vào spool); mạng đổi → thử lại ngay
+            await wait_reconnect(delay, network_watcher)
+            if network_watcher.changed.is_set():
+                network_watcher.changed.clear()
+                print("🌐 Network changed → reconnecting now")
+    finally:
+        config_watch.cancel()
+        network_watcher.close()
 
 def start_websocket_thread():
-    global stop_streaming, reconnect_count
-    stop_streaming = False
+    """Connection thread chạy từ lúc boot: DNS/TCP/TLS/handshake xong trước khi bấm nút."""
+    global ws_loop, recording_event, playback_changed, endpoint_changed, reconnect_count, session_id, segments_sent, last_ack_seq
     reconnect_count = 0
+    session_id = uuid.uuid4().hex[:12]
+    segments_sent = 0
+    last_ack_seq = None
+    segment_resume_points.clear()
 
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
+    recording_event = asyncio.Event()
+    playback_changed = asyncio.Event()
+    endpoint_changed = asyncio.Event()
+    ws_loop = loop
+    if is_recording:
+        recording_event.set()
 
     try:
         loop.run_until_complete(websocket_session_with_reconnect())
     finally:
+        ws_loop = None
         loop.close()
 
+def _begin_recording():
+    """Chạy trong connection loop: lần ghi mới bắt đầu từ hiện tại, không gửi lại audio cũ."""
+    global resume_seq
+    resume_seq = None
+    segment_resume_points.clear()
+    recording_event.set()
+
+def set_recording(active: bool):
+    """Gọi từ thread nút bấm: bật/tắt gửi audio trên kết nối giữ sẵn."""
+    loop = ws_loop
+    if loop is None:
+        return  # Thread chưa chạy xong khởi tạo → đọc is_recording khi khởi tạo
+    if active:
+        loop.call_soon_threadsafe(_begin_recording)
+    else:
+        loop.call_soon_threadsafe(recording_event.clear)
+
 # ============ BUTTON HANDLER (TOGGLE MODE) ============
 def handle_button():
     """
-    Simple toggle button flow:
-    - Press 1: Connect + Start recording
-    - Press 2: Stop recording + Disconnect (double-press)
+    Simple toggle button flow (kết nối WebSocket đã mở sẵn từ lúc boot):
+    - Press 1: Start recording (bắt đầu gửi audio ngay)
+    - Press 2: Stop recording (double-press), kết nối vẫn giữ
     - During video: Stop video
     """
-    global current_state, is_recording, stop_streaming, stop_video, ws_thread, stop_armed, stop_armed_at
+    global current_state, is_recording, stop_streaming, stop_video, stop_armed, stop_armed_at, record_pressed_at
 
     state_names = {0: 'IDLE', 1: 'CONNECTING', 2: 'RECORDING', 3: 'PLAYING'}
     print(f"🔘 Button! State: {state_names.get(current_state, current_state)}, Recording: {is_recording}")
@@ -899,23 +2565,27 @@ def handle_button():
         with video_queue_lock:
             pending_video_queue.clear()
             print(f"🧹 Cleared pending queue")
+        notify_playback_changed()
         return
 
     # === Toggle recording ===
     if not is_recording:
         # ===== START RECORDING =====
-        print("� Starting recording...")
+        print("🎙️ Starting recording...")
+        record_pressed_at = time.monotonic()
         is_recording = True
         stop_streaming = False
         stop_video = False
-        current_state = State.CONNECTING
         stop_armed = False
 
-        show_message(["Đang kết nối...", "", "Vui lòng chờ"], (100, 200, 255), (0, 20, 50))
+        if websocket_connected:
+            current_state = State.RECORDING
+            show_message(["Đang nghe...", "", "Nói vào mic"], (100, 200, 255), (0, 20, 50))
+        else:
+            current_state = State.CONNECTING
+            show_message(["Đang kết nối...", "", "Vui lòng chờ"], (100, 200, 255), (0, 20, 50))
 
-        # Start WebSocket in background thread
-        ws_thread = threading.Thread(target=start_websocket_thread, daemon=True)
-        ws_thread.start()
+        set_recording(True)
 
     else:
         # ===== STOP RECORDING (DOUBLE PRESS) =====
@@ -930,20 +2600,38 @@ def handle_button():
         stop_streaming = True
         stop_video = True
         stop_armed = False
+        set_recording(False)
+        if clip_prefetcher:
+            clip_prefetcher.discard_all()
 
         # ✅ Clear pending queue
         with video_queue_lock:
             pending_video_queue.clear()
             print(f"🧹 Cleared pending queue")
+        notify_playback_changed()
 
         current_state = State.IDLE
         show_message(["Đã dừng", "", "Nhấn nút để", "bắt đầu lại"], (100, 255, 100), show_recent=False)
 
 # ============ MAIN ============
+def export_latency_trace(*_):
+    """SIGUSR1 hoặc lúc thoát: ghi trace ra TRACE_DIR (JSON lines + Chrome trace)."""
+    if not tracer.enabled or not tracer.events:
+        return
+    stamp = time.strftime('%Y%m%d_%H%M%S')
+    jsonl_path = os.path.join(TRACE_DIR, f"latency_{stamp}.jsonl")
+    chrome_path = os.path.join(TRACE_DIR, f"latency_{stamp}.trace.json")
+    try:
+        count = tracer.export_jsonl(jsonl_path)
+        tracer.export_chrome(chrome_path)
+        print(f"📊 Trace exported: {count} marks → {jsonl_path}, {chrome_path}")
+    except OSError as e:
+        print(f"❌ Trace export error: {e}")
+
 def main():
-    global current_state
+    global current_state, ws_thread, shutting_down, stop_streaming, stop_video
 
-    print(f"📡 Server: {API_URL}")
+    print(f"📡 Server: {', '.join(API_URLS)}")
     print(f"📹 Videos: {len(video_mapper.video_cache)}")
     print(f"🎙️ VAD: {'ENABLED' if VAD_AVAILABLE else 'DISABLED (RMS only)'}")
     print(f"🔧 Frame: {FRAME_DURATION_MS}ms, Pre-roll: {PREROLL_FRAMES * FRAME_DURATION_MS}ms, Hangover: {HANGOVER_FRAMES * FRAME_DURATION_MS}ms")
@@ -952,6 +2640,17 @@ def main():
     init_lcd()
     print("✅ LCD OK!")
 
+    # kill -USR1 <pid> → xuất latency trace mà không dừng chương trình
+    signal.signal(signal.SIGUSR1, export_latency_trace)
+
+    # Mic mở 1 lần lúc boot (file/synthetic: mở khi bắt đầu ghi)
+    if AUDIO_SOURCE.lower().startswith('arecord'):
+        get_capture_daemon()
+
+    # Kết nối server ngay từ lúc boot, nút bấm chỉ bật/tắt gửi audio
+    ws_thread = threading.Thread(target=start_websocket_thread, daemon=True)
+    ws_thread.start()
+
     show_message(["Real-Time VSL", "", "Nhấn nút để", "bắt đầu"], (100, 255, 100))
 
     last_state = GPIO.HIGH
@@ -970,8 +2669,11 @@ def main():
 
     except KeyboardInterrupt:
         print("\n👋 Exiting...")
+        shutting_down = True
         stop_streaming = True
         stop_video = True
+        set_recording(False)
+        export_latency_trace()
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+TEST AUDIO SOURCE - đọc từng nguồn audio theo frame 30ms
+========================================================
+Đọc hết mỗi nguồn của audio_source.py (file WAV/m4a, synthetic) như real_time.py,
+in ra: số frame, độ dài audio, thời gian đọc (kiểm tra pacing) và RMS trung bình.
+
+Không cần phần cứng (không dùng GPIO / SPI / mic). m4a cần ffmpeg.
+
+Chạy: python3 test_audio_source.py [speed]     (mặc định 0 = nhanh nhất, 1 = real-time)
+"""
+
+import asyncio
+import sys
+import time
+
+import numpy as np
+
+from audio_source import create_audio_source
+
+# ============ CẤU HÌNH ============
+SAMPLE_RATE = 16000
+FRAME_BYTES = SAMPLE_RATE * 30 // 1000 * 2
+SOURCES = [
+    "file:recording_20260121_163605.wav",
+    "file:test-voice-AI.m4a",
+    "synthetic:tone",
+    "synthetic:noise",
+    "synthetic:speech",
+]
+
+
+async def read_all(spec: str, speed: float):
+    source = create_audio_source(spec, SAMPLE_RATE, speed=speed)
+    try:
+        await source.start()
+    except Exception as e:
+        print(f"⏭️  {spec} bỏ qua ({e})")
+        return
+    frames = 0
+    rms = []
+    t0 = time.perf_counter()
+    while True:
+        frame = await source.read(FRAME_BYTES)
+        if frame is None:
+            break
+        frames += 1
+        samples = np.frombuffer(frame, dtype='<i2').astype(np.float32)
+        rms.append(np.sqrt(np.mean(samples ** 2)))
+    elapsed = time.perf_counter() - t0
+    await source.close()
+
+    audio_sec = frames * 0.03
+    print(f"✅ {source.describe():45s} | {frames:4d} frames | {audio_sec:5.1f}s audio "
+          f"đọc trong {elapsed:5.2f}s | RMS tb {np.mean(rms):6.0f}")
+
+
+# ============ MAIN ============
+speed = float(sys.argv[1]) if len(sys.argv) > 1 else 0.0
+print("=" * 60)
+for spec in SOURCES:
+    asyncio.run(read_all(spec, speed))
+print("=" * 60)
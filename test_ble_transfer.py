@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+TEST BLE TRANSFER - messages/s qua phần nhận của VslCharacteristic.WriteValue (ble_transfer.VslReceiver)
+=======================================================================================================
+Không cần BLE / dbus: đưa thẳng các lần write (bytes như BlueZ gửi) vào handler, so sánh:
+- text cũ "[i/n]" + value kiểu dbus.Array (list byte, bytes([int(b) ...]) như trước)
+- text cũ "[i/n]" + value bytes (byte_arrays=True)
+- chunk nhị phân: đúng thứ tự / 4 message xen kẽ + đảo thứ tự / long write (offset, MTU 23)
+Kiểm tra message ghép lại đúng từng byte, CRC hỏng bị bắt, chunk trùng bị bỏ qua.
+
+Notify (ShellOutputCharacteristic): output lệnh shell từng dòng qua main loop + D-Bus giả lập (LINK_NOTIFY_MS / notification,
+done() khi đã xử lý xong - giống GLib main loop phát PropertiesChanged, không mô phỏng hàng đợi của BlueZ / link),
+cách cũ (1 notification / dòng, chunk 500 bytes + sleep 20ms) so với NotifyPipeline (gom theo MTU).
+
+Chạy: python3 test_ble_transfer.py [số message]     (mặc định 2000)
+"""
+
+import json
+import queue
+import random
+import sys
+import threading
+import time
+
+from ble_transfer import ChunkError, NotifyPipeline, VslReceiver, chunk_payload_size, encode_message
+
+# ============ CẤU HÌNH ============
+COUNT = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+MTU = 185            # requestMtu điển hình trên Android / iOS
+INTERLEAVE = 4
+LINK_NOTIFY_MS = 2.0   # Thời gian main loop + D-Bus xử lý xong 1 notification
+SHELL_LINES = 400
+random.seed(1)
+
+
+def make_message(i: int, words: int) -> bytes:
+    vocab = ["xin chào", "cảm ơn", "tạm biệt", "gia đình", "trường học", "bệnh viện", "hôm nay", "vui"]
+    data = {'type': 'result', 'transcript': f"câu số {i}",
+            'words': [vocab[(i + k) % len(vocab)] for k in range(words)]}
+    return json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+
+def legacy_writes(message: bytes, mtu: int) -> list:
+    """Client cũ: cắt text UTF-8 (không cắt giữa ký tự) thành '[i/n]' + đoạn."""
+    text = message.decode('utf-8')
+    room = mtu - 3 - 12
+    parts, current = [], ""
+    for ch in text:
+        if len((current + ch).encode('utf-8')) > room:
+            parts.append(current)
+            current = ""
+        current += ch
+    parts.append(current)
+    return [f"[{i + 1}/{len(parts)}]{p}".encode('utf-8') for i, p in enumerate(parts)]
+
+
+def long_writes(chunk: bytes, att_mtu: int = 23) -> list:
+    """1 chunk lớn hơn MTU → Prepare Write từng đoạn (MTU - 5 bytes), BlueZ gọi WriteValue với offset."""
+    step = att_mtu - 5
+    return [(chunk[o:o + step], o) for o in range(0, len(chunk), step)]
+
+
+def run(name: str, messages: list, writes: list, as_list: bool = False):
+    """writes: [(value, offset)] theo thứ tự BlueZ gọi WriteValue."""
+    receiver = VslReceiver()
+    if as_list:   # Giả lập dbus.Array: trước đây đổi từng byte bằng bytes([int(b) for b in value])
+        writes = [([b for b in value], offset) for value, offset in writes]
+    received = []
+    t0 = time.perf_counter()
+    for value, offset in writes:
+        if as_list:
+            value = bytes([int(b) for b in value])
+        message = receiver.write(value, offset)
+        if message is not None:
+            received.append(message)
+    elapsed = time.perf_counter() - t0
+    got = sorted(m.encode('utf-8') if isinstance(m, str) else bytes(m) for m in received)
+    ok = "✅" if got == sorted(messages) else "❌ SAI"
+    total_bytes = sum(len(m) for m in messages)
+    print(f"{name:40s} | {len(writes) / len(messages):5.1f} write/msg | {len(messages) / elapsed:9.0f} msg/s "
+          f"| {total_bytes / elapsed / 1e6:6.1f} MB/s | {ok}")
+
+
+def binary_writes(messages: list, mtu: int, interleave: int = 1, shuffle: bool = False) -> list:
+    writes = []
+    for start in range(0, len(messages), interleave):
+        group = [encode_message(m, start + i, chunk_payload_size(mtu))
+                 for i, m in enumerate(messages[start:start + interleave])]
+        frames = [f for chunks in group for f in chunks]
+        if shuffle:
+            random.shuffle(frames)
+        writes.extend((f, 0) for f in frames)
+    return writes
+
+
+def check_errors():
+    receiver = VslReceiver()
+    frames = encode_message(make_message(0, 40), 7, chunk_payload_size(MTU))
+    bad = bytearray(frames[-1])
+    bad[-1] ^= 0xFF
+    for f in frames[:-1]:
+        receiver.write(f)
+    receiver.write(frames[0])   # Trùng → bỏ qua
+    try:
+        receiver.write(bytes(bad))
+        print("❌ CRC hỏng không bị bắt")
+    except ChunkError as e:
+        print(f"✅ CRC hỏng bị bắt: {e} | stats {receiver.chunks.stats}")
+
+
+# ============ NOTIFY ============
+class FakeLink:
+    """Main loop + D-Bus giả: xử lý lần lượt từng notification, mỗi cái LINK_NOTIFY_MS, rồi gọi done()."""
+
+    def __init__(self, mtu: int):
+        self.mtu = mtu
+        self.queue = queue.Queue()
+        self.received = bytearray()
+        self.notifications = 0
+        self.truncated = 0
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def emit(self, data: bytes, done=None):
+        self.queue.put((data, done))
+
+    def _run(self):
+        while True:
+            data, done = self.queue.get()
+            time.sleep(LINK_NOTIFY_MS / 1000)
+            self.truncated += max(0, len(data) - (self.mtu - 3))   # BlueZ cắt notification dài hơn MTU - 3
+            self.received += data[:self.mtu - 3]
+            self.notifications += 1
+            if done:
+                done()
+            self.queue.task_done()
+
+
+def shell_lines() -> list:
+    return [f"-rw-r--r-- 1 pi pi {i * 37 % 99999:6d} Jan 21 16:36 video/từ_vựng_{i:04d}.mp4\n" for i in range(SHELL_LINES)]
+
+
+def notify_old(lines: list, mtu: int):
+    link = FakeLink(mtu)
+    t0 = time.perf_counter()
+    for line in lines + ["\x04"]:
+        data = line.encode('utf-8')
+        for i in range(0, len(data), 500):
+            chunk = data[i:i + 500]
+            link.emit(bytes([int(b) for b in chunk]))   # dbus.Array([dbus.Byte(b) ...])
+            if len(data) > 500:
+                time.sleep(0.02)
+    producer = time.perf_counter() - t0
+    link.queue.join()
+    return link, producer, time.perf_counter() - t0
+
+
+def notify_pipeline(lines: list, mtu: int):
+    link = FakeLink(mtu)
+    pipeline = NotifyPipeline(link.emit, lambda: mtu - 3)
+    t0 = time.perf_counter()
+    for line in lines:
+        pipeline.send(line.encode('utf-8'))
+    pipeline.send(b"\x04", flush=True)
+    producer = time.perf_counter() - t0
+    deadline = time.monotonic() + 30
+    while not link.received.endswith(b"\x04") and time.monotonic() < deadline:   # EOT là byte cuối
+        time.sleep(0.001)
+    return link, producer, time.perf_counter() - t0
+
+
+def check_notify():
+    lines = shell_lines()
+    expected = "".join(lines).encode('utf-8') + b"\x04"
+    print(f"\nShell output {len(lines)} dòng ({len(expected)}B), main loop {LINK_NOTIFY_MS}ms / notification")
+    for mtu in (23, 185, 517):
+        for name, run_notify in (("cũ: 1 dòng / notify", notify_old), ("NotifyPipeline", notify_pipeline)):
+            link, producer, total = run_notify(lines, mtu)
+            ok = "✅" if bytes(link.received) == expected else f"❌ mất {link.truncated}B (vượt MTU)"
+            print(f"MTU {mtu:3d} {name:20s} | {link.notifications:4d} notify | producer {producer * 1000:6.1f}ms "
+                  f"| xong {total * 1000:6.0f}ms | {ok}")
+
+
+# ============ MAIN ============
+small = [make_message(i, 6) for i in range(COUNT)]           # ~150B: kết quả 1 câu
+large = [make_message(i, 300) for i in range(COUNT // 10)]   # ~4KB: đoạn văn dài
+print("=" * 100)
+print(f"VslReceiver: {COUNT} message nhỏ ({len(small[0])}B), {len(large)} message lớn ({len(large[0])}B), MTU {MTU}")
+print("=" * 100)
+for label, messages in (("nhỏ", small), ("lớn", large)):
+    text = [(w, 0) for m in messages for w in legacy_writes(m, MTU)]
+    run(f"[{label}] text cũ, dbus.Array từng byte", messages, text, as_list=True)
+    run(f"[{label}] text cũ, byte_arrays", messages, text)
+    run(f"[{label}] nhị phân, đúng thứ tự", messages, binary_writes(messages, MTU))
+    run(f"[{label}] nhị phân, {INTERLEAVE} message xen kẽ + đảo", messages,
+        binary_writes(messages, MTU, INTERLEAVE, shuffle=True))
+    run(f"[{label}] nhị phân, long write MTU 23", messages,
+        [w for f, _ in binary_writes(messages, 512) for w in long_writes(f)])
+check_errors()
+check_notify()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+TEST AUDIO CODEC - loopback encode → decode
+===========================================
+Đọc file WAV mẫu, đưa về 16kHz mono S16_LE (giống arecord trong real_time.py),
+chạy qua từng codec của audio_codec.py rồi decode lại.
+In ra: dung lượng, băng thông (KB/s), tỉ lệ nén và SNR so với bản gốc.
+Kiểm tra thêm: encode memoryview (như segment trong ring của VADAudioStreamer), độ dài lẻ
+(frame cuối phải pad) → kết quả giống hệt encode bytes.
+
+Không cần phần cứng (không dùng GPIO / SPI / mic).
+
+Chạy: python3 test_codec.py [file.wav]
+"""
+
+import os
+import sys
+import time
+import wave
+
+import numpy as np
+
+from audio_codec import CODECS, OPUS_AVAILABLE, create_codec
+
+# ============ CẤU HÌNH ============
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_WAV = os.path.join(SCRIPT_DIR, "recording_20260121_163605.wav")
+SAMPLE_RATE = 16000
+MIN_SNR_DB = {'pcm': 90.0, 'mulaw': 30.0, 'alaw': 30.0, 'opus': 5.0}
+
+
+def load_wav_16k(path: str) -> bytes:
+    """Đọc WAV, lấy kênh đầu, resample tuyến tính về 16kHz."""
+    with wave.open(path, 'rb') as w:
+        channels = w.getnchannels()
+        rate = w.getframerate()
+        raw = w.readframes(w.getnframes())
+    samples = np.frombuffer(raw, dtype='<i2')[::channels].astype(np.float32)
+    if rate != SAMPLE_RATE:
+        n = int(len(samples) * SAMPLE_RATE / rate)
+        samples = np.interp(np.linspace(0, len(samples) - 1, n), np.arange(len(samples)), samples)
+    return samples.astype('<i2').tobytes()
+
+
+def snr_db(original: bytes, decoded: bytes) -> float:
+    a = np.frombuffer(original, dtype='<i2').astype(np.float64)
+    b = np.frombuffer(decoded, dtype='<i2').astype(np.float64)[:len(a)]
+    noise = np.sum((a - b) ** 2)
+    if noise == 0:
+        return float('inf')
+    return 10 * np.log10(np.sum(a ** 2) / noise)
+
+
+def same_for_memoryview(name: str, pcm: bytes) -> bool:
+    """2 codec mới cùng trạng thái: bytes vs memoryview, chunk 310ms (không chia hết frame 20ms của opus)."""
+    chunk = SAMPLE_RATE * 2 * 31 // 100
+    ring = memoryview(bytearray(pcm))
+    from_bytes, from_view = create_codec(name, SAMPLE_RATE), create_codec(name, SAMPLE_RATE)
+    return all(bytes(from_bytes.encode(pcm[i:i + chunk])) == bytes(from_view.encode(ring[i:i + chunk]))
+               for i in range(0, len(pcm), chunk))
+
+
+# ============ MAIN ============
+wav_path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_WAV
+pcm = load_wav_16k(wav_path)
+duration = len(pcm) / 2 / SAMPLE_RATE
+
+print("=" * 60)
+print(f"🎧 {os.path.basename(wav_path)} | {duration:.2f}s | {len(pcm)} bytes PCM")
+print("=" * 60)
+
+failed = False
+for name in CODECS:
+    if name == 'opus' and not OPUS_AVAILABLE:
+        print(f"⏭️  {name:6s} bỏ qua (chưa cài opuslib)")
+        continue
+
+    codec = create_codec(name, SAMPLE_RATE)
+    # Encode theo chunk 200ms giống streaming mode
+    chunk = SAMPLE_RATE * 2 // 5
+    t0 = time.perf_counter()
+    encoded = [codec.encode(pcm[i:i + chunk]) for i in range(0, len(pcm), chunk)]
+    t_encode = time.perf_counter() - t0
+    decoded = b''.join(codec.decode(e) for e in encoded)
+
+    size = sum(len(e) for e in encoded)
+    snr = snr_db(pcm, decoded)
+    try:
+        view_ok = same_for_memoryview(name, pcm)
+    except Exception as e:
+        print(f"❌ {name:6s} encode memoryview lỗi: {e}")
+        view_ok = False
+    ok = snr >= MIN_SNR_DB[name] and view_ok
+    failed |= not ok
+    print(f"{'✅' if ok else '❌'} {name:6s} {size:7d} bytes | {size / duration / 1024:5.1f} KB/s | "
+          f"x{len(pcm) / size:4.1f} | SNR {snr:5.1f} dB | encode {t_encode * 1000:.1f} ms | "
+          f"memoryview {'=' if view_ok else '≠'} bytes")
+
+print("=" * 60)
+sys.exit(1 if failed else 0)
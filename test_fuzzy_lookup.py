@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+TEST FUZZY LOOKUP - VideoMapper.find_video_fuzzy trên toàn bộ thư viện clip
+===========================================================================
+Lấy ngẫu nhiên tên clip 1 từ (plan_words chỉ tra fuzzy từng từ đơn) rồi làm hỏng giống lỗi gõ / ASR:
+- dấu:    đổi dấu 1 nguyên âm ('trước' → 'trươc', 'trược')
+- bỏ dấu: bỏ hết dấu ('trước' → 'truoc')
+- thiếu:  bớt 1 chữ (không phải chữ đầu)
+- thừa:   lặp 1 chữ (gõ Telex dư)
+- đổi:    thay 1 chữ cái → từ khác, KHÔNG được khớp sang clip khác ('tieng' → 'mieng')
+In ra theo từng loại: miss rate (đánh vần) khi chỉ có find_video / có thêm fuzzy, số khớp về đúng từ gốc,
+số khớp sang clip khác (từ hỏng tình cờ gần từ khác: 'tử' → 'tủ'), số khớp đổi chữ cái (phải = 0),
+số clip trung bình mỗi từ (plan_words) và thời gian 1 lần tra fuzzy (p99 < MAX_LOOKUP_MS).
+
+Chạy: python3 test_fuzzy_lookup.py [số từ mỗi loại] [--no-hardware]   (mặc định 500)
+"""
+
+import contextlib
+import io
+import random
+import sys
+import time
+from typing import Optional
+
+# ============ CẤU HÌNH ============
+ARGS = [a for a in sys.argv[1:] if not a.startswith('--')]
+COUNT = int(ARGS[0]) if ARGS else 500
+MAX_LOOKUP_MS = 1.0
+random.seed(1)
+
+if '--no-hardware' in sys.argv:
+    from test_load import install_no_hardware
+    install_no_hardware()
+
+import real_time  # noqa: E402  (sau install_no_hardware)
+from real_time import VideoMapper, _base_form  # noqa: E402
+
+mapper = real_time.video_mapper
+TONES = {}
+for toned, plain in VideoMapper.TONE_MAP.items():
+    TONES.setdefault(plain, {plain}).add(toned)
+LETTERS = "abcdeghiklmnopqrstuvxyđ"
+
+
+# ============ LÀM HỎNG TỪ ============
+def retone(word: str) -> Optional[str]:
+    spots = [i for i, c in enumerate(word) if VideoMapper.TONE_MAP.get(c, c) in TONES]
+    if not spots:
+        return None
+    i = random.choice(spots)
+    choices = TONES[VideoMapper.TONE_MAP.get(word[i], word[i])] - {word[i]}
+    return word[:i] + random.choice(sorted(choices)) + word[i + 1:]
+
+
+def strip_tones(word: str) -> Optional[str]:
+    plain = _base_form(word)
+    return plain if plain != word else None
+
+
+def drop(word: str) -> Optional[str]:
+    spots = [i for i in range(1, len(word)) if word[i] != '_']
+    if not spots:
+        return None
+    i = random.choice(spots)
+    return word[:i] + word[i + 1:]
+
+
+def double(word: str) -> Optional[str]:
+    i = random.randrange(1, len(word))
+    return word[:i] + word[i - 1] + word[i:] if word[i - 1] != '_' else None
+
+
+def substitute(word: str) -> Optional[str]:
+    i = random.randrange(len(word))
+    if word[i] == '_':
+        return None
+    return word[:i] + random.choice(LETTERS.replace(_base_form(word[i]), '')) + word[i + 1:]
+
+
+PERTURBATIONS = (("dấu", retone), ("bỏ dấu", strip_tones), ("thiếu", drop), ("thừa", double), ("đổi", substitute))
+
+
+def samples(perturb) -> list:
+    """[(từ gốc, từ hỏng)]: từ hỏng không trùng tên clip nào (để chắc chắn exact trượt)."""
+    names = sorted(stem.strip('_') for stem in mapper.video_cache if not stem.strip('_').isdigit())
+    names = [n for n in names if len(n) >= 2 and '_' not in n]
+    result = []
+    while len(result) < COUNT:
+        name = random.choice(names)
+        word = perturb(name)
+        if word and mapper.find_video(word) is None and not mapper.get_number_videos(word):
+            result.append((name, word))
+    return result
+
+
+# ============ ĐO ============
+def same_word(found, name: str) -> bool:
+    return found is not None and _base_form(found.stem.strip('_')) == _base_form(name)
+
+
+def letter_swap(found, word: str) -> bool:
+    """Clip khớp cùng độ dài nhưng khác chữ gốc = đổi chữ cái ('tieng' → 'mieng')."""
+    name = found.stem.strip('_')
+    return len(name) == len(word) and _base_form(name) != _base_form(word)
+
+
+def clips_per_word(words: list, fuzzy: bool) -> float:
+    """plan_words từng từ; fuzzy=False → giả lập trước đây (trượt exact là đánh vần)."""
+    saved = mapper.find_video_fuzzy
+    if not fuzzy:
+        mapper.find_video_fuzzy = lambda word: None
+    try:
+        return sum(len(mapper.plan_words([word])) for word in words) / len(words)
+    finally:
+        mapper.find_video_fuzzy = saved
+
+
+def lookup_times(words: list) -> list:
+    """ms / lần tra, xoá cache trước mỗi lần (đo đúng phần index + distance)."""
+    times = []
+    for word in words:
+        mapper._fuzzy_cache.clear()
+        t0 = time.perf_counter()
+        mapper.find_video_fuzzy(word)
+        times.append((time.perf_counter() - t0) * 1000)
+    return sorted(times)
+
+
+def check_examples() -> bool:
+    """Các cặp reviewer nêu: đổi chữ cái / thêm chữ đầu phải trượt, sai dấu / dính chữ phải khớp."""
+    ok = True
+    for word, expected in (("tieng", None), ("hương", None), ("trươc", "trước"), ("cammera", "camera"), ("giadinh", "gia_dinh")):
+        found = mapper.find_video_fuzzy(word)
+        got = found.stem if found else None
+        if got != expected:
+            print(f"❌ '{word}' → {got}, mong đợi {expected}")
+            ok = False
+    return ok
+
+
+# ============ MAIN ============
+print("=" * 110)
+keys = [s for s in mapper.video_cache if not s.strip('_').isdigit()]
+print(f"Fuzzy lookup: {len(mapper.video_cache)} clip ({len(keys)} key chữ, "
+      f"{len(mapper.fuzzy_index)} key index), {COUNT} từ hỏng mỗi loại")
+print("=" * 110)
+failed = False
+all_times = []
+with contextlib.redirect_stdout(io.StringIO()):   # bỏ log '🔎 Fuzzy' từng từ
+    rows = []
+    for label, perturb in PERTURBATIONS:
+        pairs = samples(perturb)
+        mapper._fuzzy_cache.clear()
+        found = [mapper.find_video_fuzzy(word) for _, word in pairs]
+        hits = sum(f is not None for f in found)
+        same = sum(same_word(f, name) for f, (name, _) in zip(found, pairs))
+        swaps = sum(f is not None and letter_swap(f, word) for f, (_, word) in zip(found, pairs))
+        words = [word for _, word in pairs]
+        times = lookup_times(words)
+        all_times += times
+        rows.append((label, hits, same, swaps, clips_per_word(words, False), clips_per_word(words, True), times))
+examples_ok = check_examples()
+
+for label, hits, same, swaps, before, after, times in rows:
+    print(f"{label:7s} | miss {100.0:5.1f}% → {100 * (COUNT - hits) / COUNT:5.1f}% | từ gốc {same:3d} "
+          f"| clip khác {hits - same:3d} | đổi chữ {swaps} | clip/từ {before:5.2f} → {after:5.2f} "
+          f"| tra mean {sum(times) / len(times):.3f}ms p99 {times[int(len(times) * 0.99)]:.3f}ms")
+    failed |= swaps > 0
+
+all_times.sort()
+p99 = all_times[int(len(all_times) * 0.99)]
+failed |= p99 > MAX_LOOKUP_MS or not examples_ok
+print(f"{'✅' if not failed else '❌'} Tra fuzzy: mean {sum(all_times) / len(all_times):.3f}ms "
+      f"p99 {p99:.3f}ms max {all_times[-1]:.3f}ms (giới hạn p99 {MAX_LOOKUP_MS}ms) "
+      f"| ví dụ {'✅' if examples_ok else '❌'} | _base_form {_base_form.cache_info()}")
+sys.exit(1 if failed else 0)
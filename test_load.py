@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+TEST LOAD - chạy client real_time.py thật với mock server, audio phát lại từ file
+==================================================================================
+Không cần backend thật: mock_server.py chạy trong cùng process (hoặc --url tới server khác).
+Client: connection thread + VAD + send queue + video worker như trên Pi; nút bấm được
+"bấm" bằng code, audio lấy từ AUDIO_SOURCE (file lặp lại, --speed > 1 = nhanh hơn real-time).
+
+Báo cáo khi hết --duration:
+- Throughput: segment gửi / result / filtered / error / mất (không có phản hồi) mỗi giây
+- Dropped jobs: result bị pending video queue bỏ (server trả nhanh hơn LCD phát)
+- Latency p50 / p90 / p99 (ms) từng giai đoạn theo latency tracer:
+    server (gửi xong → result), result → first frame, speech end → first frame
+
+Pi:  python3 test_load.py --duration 60 --speed 2 --result-delay 0.8 --filter-rate 0.1
+PC:  python3 test_load.py --no-hardware ...   (không có spidev / RPi.GPIO: LCD + nút là no-op)
+Tham số mock (--result-delay, --partial, --scenario, --drop-every, ...) giống mock_server.py.
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+import types
+
+import numpy as np
+
+import mock_server
+
+# ============ CẤU HÌNH ============
+DEFAULT_AUDIO = "file:recording_20260121_163605.wav"
+PERCENTILES = (50, 90, 99)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Load test real_time.py client với mock VSL server")
+    parser.add_argument('--audio', default=DEFAULT_AUDIO, help="AUDIO_SOURCE (file:..., synthetic:speech)")
+    parser.add_argument('--speed', type=float, default=1.0, help="Tốc độ phát lại audio (1 = real-time)")
+    parser.add_argument('--duration', type=float, default=30.0, help="Giây ghi âm")
+    parser.add_argument('--drain', type=float, default=30.0, help="Giây tối đa chờ phát hết video sau khi dừng")
+    parser.add_argument('--stream-mode', default='batch', choices=('batch', 'stream'))
+    parser.add_argument('--url', help="Server có sẵn (mặc định: mock trong process)")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--no-hardware', action='store_true', help="Chạy trên PC: thay spidev / RPi.GPIO bằng no-op")
+    mock_server.add_mock_arguments(parser)
+    args = parser.parse_args()
+    args.words_min, args.words_max = args.words
+    args.host = '127.0.0.1'
+    return args
+
+
+# ============ PHẦN CỨNG GIẢ (PC) ============
+class _NoHardware:
+    """Mọi thuộc tính / lệnh gọi đều là no-op (SPI ghi LCD, GPIO.output, ...)."""
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __getattr__(self, name):
+        return _NoHardware()
+
+    def __call__(self, *args, **kwargs):
+        return _NoHardware()
+
+
+def install_no_hardware():
+    spidev = types.ModuleType('spidev')
+    spidev.SpiDev = _NoHardware
+    gpio = _NoHardware()
+    rpi = types.ModuleType('RPi')
+    rpi.GPIO = gpio
+    sys.modules.update({'spidev': spidev, 'RPi': rpi, 'RPi.GPIO': gpio})
+
+
+# ============ MOCK SERVER ============
+def start_mock(args) -> mock_server.MockServer:
+    server = mock_server.MockServer(args)
+    ready = threading.Event()
+
+    async def run():
+        started = asyncio.Event()
+        task = asyncio.create_task(server.run(started))
+        await started.wait()
+        ready.set()
+        await task
+
+    threading.Thread(target=lambda: asyncio.run(run()), daemon=True, name='mock-server').start()
+    if not ready.wait(10):
+        raise RuntimeError("Mock server did not start")
+    return server
+
+
+# ============ ĐO ============
+def percentiles(values: list) -> str:
+    if not values:
+        return "—"
+    p = np.percentile(values, PERCENTILES)
+    return " / ".join(f"{v:7.0f}" for v in p) + f"   (n={len(values)})"
+
+
+def collect(rt) -> dict:
+    """Mark của mọi segment trong tracer → đếm + latency (ms) từng giai đoạn."""
+    with rt.tracer.lock:
+        segments = [dict(marks) for marks in rt.tracer.segments.values()]
+    counts = {'sent': 0, 'result': 0, 'filtered': 0, 'first_frame': 0}
+    latency = {'server': [], 'result → first frame': [], 'speech end → first frame': []}
+    for marks in segments:
+        for name in counts:
+            counts[name] += name in marks
+        if 'sent' in marks and 'result' in marks:
+            latency['server'].append((marks['result'] - marks['sent']) * 1000)
+        if 'result' in marks and 'first_frame' in marks:
+            latency['result → first frame'].append((marks['first_frame'] - marks['result']) * 1000)
+        if 'speech_end' in marks and 'first_frame' in marks:
+            latency['speech end → first frame'].append((marks['first_frame'] - marks['speech_end']) * 1000)
+    return {'counts': counts, 'latency': latency}
+
+
+def wait_playback_drained(rt, timeout: float):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        state = rt.get_playback_state()
+        if not state['playing'] and not state['pending']:
+            return True
+        time.sleep(0.2)
+    return False
+
+
+# ============ MAIN ============
+def main():
+    args = parse_args()
+    if args.no_hardware:
+        install_no_hardware()
+
+    server = None
+    if args.url:
+        api_url = args.url
+    else:
+        server = start_mock(args)
+        api_url = f"{'wss://localhost' if args.tls_cert else 'ws://127.0.0.1'}:{args.port}"
+        if args.tls_cert:
+            os.environ['TLS_CA_FILE'] = args.tls_cert
+
+    # real_time đọc cấu hình từ env lúc import
+    os.environ.update({
+        'API_URL': api_url,
+        'AUDIO_SOURCE': args.audio,
+        'AUDIO_SOURCE_SPEED': str(args.speed),
+        'STREAM_MODE': args.stream_mode,
+        'TRACE_ENABLED': '1',
+    })
+    if args.json:
+        os.environ['WIRE_PROTOCOL'] = 'json'
+    import real_time as rt
+    rt.tracer.max_segments = 1_000_000   # Giữ mọi segment của lần chạy để tính percentile
+
+    threading.Thread(target=rt.start_websocket_thread, daemon=True, name='ws').start()
+    deadline = time.monotonic() + 10
+    while not rt.websocket_connected and time.monotonic() < deadline:
+        time.sleep(0.05)
+    if not rt.websocket_connected:
+        print(f"❌ Client could not connect to {api_url}")
+        return
+
+    print(f"\n🚀 Load: {args.audio} x{args.speed} for {args.duration:.0f}s → {api_url}\n")
+    started = time.monotonic()
+    rt.handle_button()                     # Bắt đầu ghi
+    time.sleep(args.duration)
+    recorded = time.monotonic() - started
+    # Dừng gửi audio nhưng không bấm nút (nút dừng xoá luôn queue video) → đo cả phần phát còn lại
+    rt.stop_streaming = True
+    rt.set_recording(False)
+    drained = wait_playback_drained(rt, args.drain)
+    rt.is_recording = False
+
+    rt.shutting_down = True
+    rt.stop_video = True
+    rt.set_recording(False)
+    rt.export_latency_trace()
+
+    # ---------- báo cáo ----------
+    stats = collect(rt)
+    counts = stats['counts']
+    lost = counts['sent'] - counts['result'] - counts['filtered']
+    print("\n" + "=" * 64)
+    print(f"📊 LOAD REPORT ({recorded:.1f}s recording, audio x{args.speed}, {args.stream_mode})")
+    print("=" * 64)
+    print(f"Segments sent      {counts['sent']:6d}  ({counts['sent'] / recorded:.2f}/s)")
+    print(f"Results            {counts['result']:6d}  ({counts['result'] / recorded:.2f}/s)")
+    print(f"Filtered           {counts['filtered']:6d}")
+    print(f"No result / error  {lost:6d}")
+    print(f"Clips shown        {counts['first_frame']:6d}")
+    print(f"Dropped video jobs {rt.dropped_video_jobs:6d}" + ("" if drained else "  (playback not drained)"))
+    if server:
+        s = server.stats
+        print(f"Server             {s['segments']} segments, {s['result']} result, {s['filtered']} filtered, "
+              f"{s['error']} error, {s['lost']} lost, {s['partial']} partial, "
+              f"max backlog {s['max_backlog']}, {s['connections']} connection(s)")
+    print(f"\nLatency ms {'p' + ' / p'.join(map(str, PERCENTILES)):>40s}")
+    for stage, values in stats['latency'].items():
+        print(f"  {stage:26s} {percentiles(values)}")
+
+
+if __name__ == "__main__":
+    main()
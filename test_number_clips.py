@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+TEST NUMBER CLIPS - VideoMapper.get_number_videos đọc lại ra đúng số
+=====================================================================
+Mỗi clip số được đọc thành chữ (clip '21' = "hai mươi mốt", '1001' = "một ngàn không trăm lẻ một"),
+nối lại rồi đọc ngược thành số theo cách nói tiếng Việt:
+- "lẻ" / "linh": hàng chục = 0  ("hai trăm lẻ năm" = 205)
+- "mốt" / "tư": 1 / 4 sau hàng chục ≥ 20, "lăm": 5 sau hàng chục ≥ 10
+- Nói tắt: "hai trăm năm" = 250, "hai ngàn năm" = 2500 (chữ số cuối đứng sau trăm / đơn vị = hàng kế tiếp)
+Chuỗi clip phải đọc ra đúng n; không có clip ghép được thì phải đánh vần đúng từng chữ số.
+
+Chạy 0..99.999, các tổ hợp nhóm 3 chữ số khó (0, 1, 5, 10, 15, 21, 24, 25, 105, 205, 250, ...)
+trên cả 4 nhóm, và số ngẫu nhiên tới 12 chữ số.
+
+Chạy: python3 test_number_clips.py [--no-hardware]   (PC: không có spidev / RPi.GPIO)
+"""
+
+import itertools
+import random
+import sys
+import time
+
+# ============ CẤU HÌNH ============
+EXHAUSTIVE_MAX = 100_000
+GROUP_VALUES = (0, 1, 4, 5, 10, 11, 14, 15, 21, 24, 25, 100, 101, 105, 110, 114, 205, 250, 999)
+RANDOM_COUNT = 20_000
+random.seed(1)
+
+DIGIT_WORDS = ('không', 'một', 'hai', 'ba', 'bốn', 'năm', 'sáu', 'bảy', 'tám', 'chín')
+DIGITS = {w: d for d, w in enumerate(DIGIT_WORDS)}
+DIGITS.update({'mốt': 1, 'tư': 4, 'lăm': 5})
+SCALES = {'tỷ': 10 ** 9, 'triệu': 10 ** 6, 'ngàn': 10 ** 3, 'nghìn': 10 ** 3}
+ZERO_TENS = ('lẻ', 'linh')
+
+
+# ============ SỐ → CHỮ ============
+def read_group(n: int, padded: bool) -> list:
+    """0 < n < 1000. padded: nhóm sau đơn vị → "không trăm" khi thiếu hàng trăm."""
+    hundreds, rest = divmod(n, 100)
+    tens, ones = divmod(rest, 10)
+    words = []
+    if hundreds or padded:
+        words += [DIGIT_WORDS[hundreds], 'trăm']
+    if tens >= 2:
+        words += [DIGIT_WORDS[tens], 'mươi']
+    elif tens == 1:
+        words.append('mười')
+    elif ones and words:
+        words.append('lẻ')
+    if ones:
+        if ones == 1 and tens >= 2:
+            words.append('mốt')
+        elif ones == 4 and tens >= 2:
+            words.append('tư')
+        elif ones == 5 and tens >= 1:
+            words.append('lăm')
+        else:
+            words.append(DIGIT_WORDS[ones])
+    return words
+
+
+def read_number(n: int) -> list:
+    """Cách đọc đầy đủ, dùng cho nội dung của 1 clip số."""
+    if n == 0:
+        return ['không']
+    words = []
+    for scale in (10 ** 9, 10 ** 6, 10 ** 3, 1):
+        group = n // scale % 1000 if scale < 10 ** 9 else n // scale
+        if group:
+            words += read_number(group) if group >= 1000 else read_group(group, padded=bool(words))
+            if scale > 1:
+                words.append(next(w for w, v in SCALES.items() if v == scale))
+    return words
+
+
+# ============ CHỮ → SỐ ============
+def parse_words(words: list) -> int:
+    """Đọc ngược chuỗi chữ thành số; sai cú pháp → ValueError."""
+    total, group, pending, state, last_scale = 0, 0, None, 'start', None
+
+    def close_group(final: bool):
+        nonlocal group, pending, total
+        if pending is not None:
+            if state == 'hundreds':             # "hai trăm năm" = 250
+                group += pending * 10
+            elif state == 'start' and final and last_scale:   # "hai ngàn năm" = 2500
+                total += pending * last_scale // 10
+            else:
+                group += pending
+        value, group, pending = group, 0, None
+        return value
+
+    for word in words:
+        if word in DIGITS:
+            if pending is not None:
+                raise ValueError(f"2 chữ số liền nhau: {words}")
+            pending = DIGITS[word]
+        elif word == 'trăm':
+            if pending is None or state != 'start':
+                raise ValueError(f"'trăm' sai chỗ: {words}")
+            group, pending, state = group + pending * 100, None, 'hundreds'
+        elif word in ('mươi', 'mười'):
+            if word == 'mươi' and (pending is None or pending < 2):
+                raise ValueError(f"'mươi' sai chỗ: {words}")
+            if state not in ('start', 'hundreds') or (word == 'mười' and pending is not None):
+                raise ValueError(f"'{word}' sai chỗ: {words}")
+            group, pending, state = group + (pending * 10 if word == 'mươi' else 10), None, 'tens'
+        elif word in ZERO_TENS:
+            if pending is not None or state == 'tens' or (state == 'start' and not last_scale and not group):
+                raise ValueError(f"'{word}' sai chỗ: {words}")
+            state = 'zero_tens'
+        elif word in SCALES:
+            if last_scale and SCALES[word] >= last_scale:
+                raise ValueError(f"đơn vị sai thứ tự: {words}")
+            value = close_group(final=False)
+            if not value:
+                raise ValueError(f"'{word}' thiếu số đứng trước: {words}")
+            total += value * SCALES[word]
+            state, last_scale = 'start', SCALES[word]
+        else:
+            raise ValueError(f"không phải chữ số: {word!r}")
+    value = close_group(final=True)
+    return total + value
+
+
+def decode_clips(clips: list) -> int:
+    words = []
+    for clip in clips:
+        words += read_number(int(clip)) if clip.isdigit() else [clip]
+    return parse_words(words)
+
+
+def check_parser() -> bool:
+    """Bộ đọc ngược phải đúng trước đã: các cách nói lẻ / linh / mốt / tư / lăm / nói tắt."""
+    phrases = {
+        "hai trăm lẻ năm": 205, "hai trăm linh năm": 205, "hai trăm năm": 250, "hai trăm năm mươi": 250,
+        "hai mươi mốt": 21, "hai mươi tư": 24, "hai mươi bốn": 24, "mười lăm": 15, "hai mươi lăm": 25,
+        "mười": 10, "một trăm mười bốn": 114, "hai ngàn năm": 2500, "hai ngàn lẻ năm": 2005,
+        "hai nghìn không trăm linh năm": 2005, "một tỷ năm ngàn": 1_000_005_000, "một trăm tỷ năm": 100_500_000_000,
+        "một triệu một trăm ngàn": 1_100_000,
+    }
+    ok = True
+    for phrase, n in phrases.items():
+        got = parse_words(phrase.split())
+        if got != n:
+            print(f"❌ '{phrase}' → {got}, đúng là {n}")
+            ok = False
+    for n in itertools.chain(range(2000), (random.randrange(10 ** 12) for _ in range(2000))):
+        if parse_words(read_number(n)) != n:
+            print(f"❌ đọc {n} = {' '.join(read_number(n))} → {parse_words(read_number(n))}")
+            ok = False
+            break
+    for bad in ("lẻ năm", "năm năm", "trăm", "một mươi", "hai mươi lẻ một"):
+        try:
+            parse_words(bad.split())
+            print(f"❌ '{bad}' không bị bắt lỗi")
+            ok = False
+        except ValueError:
+            pass
+    print(f"{'✅' if ok else '❌'} Bộ đọc: {len(phrases)} câu mẫu, 4000 số đọc đầy đủ, 5 câu sai cú pháp")
+    return ok
+
+
+# ============ MAIN ============
+if '--no-hardware' in sys.argv:
+    from test_load import install_no_hardware
+    install_no_hardware()
+
+import real_time  # noqa: E402  (sau install_no_hardware)
+
+mapper = real_time.video_mapper
+
+
+def numbers():
+    yield from range(EXHAUSTIVE_MAX)
+    for groups in itertools.product(GROUP_VALUES, repeat=4):
+        yield int("".join(f"{g:03d}" for g in groups))
+    for _ in range(RANDOM_COUNT):
+        yield random.randrange(10 ** random.randint(1, real_time.NUMBER_MAX_DIGITS))
+
+
+ok = check_parser()
+planned = spelled = clip_total = digit_total = 0
+failures = []
+t0 = time.perf_counter()
+for n in numbers():
+    word = str(n)
+    clips = [clip for clip, _ in mapper.get_number_videos(word)]
+    if clips:
+        try:
+            got = decode_clips(clips)
+        except ValueError as e:
+            got = e
+        planned += 1
+        clip_total += len(clips)
+        digit_total += len(word)
+    else:
+        got = "".join(label for label, _ in mapper.get_fingerspell_videos(word))
+        got = int(got) if got == word else got
+        spelled += 1
+    if got != n:
+        failures.append((n, clips, got))
+elapsed = time.perf_counter() - t0
+
+print(f"{'✅' if not failures else '❌'} {planned + spelled} số trong {elapsed:.1f}s | ghép clip {planned} "
+      f"({clip_total / max(planned, 1):.2f} clip / số, đánh vần sẽ là {digit_total / max(planned, 1):.2f}) "
+      f"| đánh vần {spelled} | sai {len(failures)}")
+for n, clips, got in failures[:10]:
+    print(f"   ❌ {n}: {clips} → {got}")
+sys.exit(0 if ok and not failures else 1)
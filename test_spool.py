@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+TEST SPOOL - AudioSpool đầy (bỏ segment cũ) khi offline và khi đang drain
+========================================================================
+Không cần phần cứng / server: ghi segment giả vào spool trong thư mục tạm, giả lập drain_spool
+(peek → gửi → pop) và ghi thêm vào spool giữa chừng cho tới khi vượt max_bytes.
+Kiểm tra chuỗi message "server nhận":
+- mỗi segment_start có đúng 1 segment_end, audio của segment gửi đủ, không có lỗ
+- segment đang gửi (cursor ở segment_start / giữa segment / audio batch) không bị bỏ
+- segment bị bỏ là segment hoàn chỉnh kế tiếp; index.jsonl ghi lại đúng (mở lại spool → như cũ)
+
+Chạy: python3 test_spool.py
+"""
+
+import os
+import sys
+import tempfile
+
+from audio_spool import AudioSpool
+
+# ============ CẤU HÌNH ============
+CHUNK_BYTES = 1000
+CHUNKS_PER_SEGMENT = 4
+MAX_BYTES = 16_500            # 4 segment stream (~4.1 KB / segment)
+FILE_MAX_BYTES = 3000
+
+
+def stream_segment(spool: AudioSpool, seg: int):
+    spool.append({'type': 'segment_start', 'segment_id': seg})
+    for i in range(CHUNKS_PER_SEGMENT):
+        spool.append(bytes([seg % 256, i]) * (CHUNK_BYTES // 2))
+    spool.append({'type': 'segment_end', 'segment_id': seg})
+
+
+def send(spool: AudioSpool, received: list):
+    """1 bước drain_spool: peek → (server nhận) → pop."""
+    message, _, record = spool.peek()
+    received.append(message)
+    return spool.pop(record)
+
+
+def segments(received: list) -> dict:
+    """{segment_id: [chunk index]} từ chuỗi server nhận; lỗi cú pháp start/end → ValueError."""
+    result, current = {}, None
+    for message in received:
+        if isinstance(message, dict):
+            if message['type'] == 'segment_start':
+                if current is not None:
+                    raise ValueError(f"segment {current} thiếu segment_end")
+                current = message['segment_id']
+                result[current] = []
+            elif message['type'] == 'segment_end':
+                if message['segment_id'] != current:
+                    raise ValueError(f"segment_end {message['segment_id']} không khớp {current}")
+                current = None
+        elif current is None:
+            result.setdefault('batch', []).append(message[0])
+        else:
+            result[current].append(message[1])
+    if current is not None:
+        raise ValueError(f"segment {current} thiếu segment_end")
+    return result
+
+
+def check(name: str, received: list, expected: list, spool: AudioSpool) -> bool:
+    try:
+        got = segments(received)
+    except ValueError as e:
+        print(f"❌ {name}: {e}")
+        return False
+    full = list(range(CHUNKS_PER_SEGMENT))
+    holes = [seg for seg, chunks in got.items() if seg != 'batch' and chunks != full]
+    ok = not holes and sorted(k for k in got if k != 'batch') == expected
+    print(f"{'✅' if ok else '❌'} {name}: nhận segment {sorted(k for k in got if k != 'batch')} "
+          f"(đúng: {expected}) | thiếu audio {holes} | dropped {spool.dropped_segments}")
+    return ok
+
+
+def drain(spool: AudioSpool, received: list):
+    spool.draining = True
+    while spool.pending:
+        send(spool, received)
+    spool.draining = False
+
+
+def full_during_drain(directory: str, sent_before: int) -> bool:
+    """Drain đã gửi sent_before record của segment 0 (0: mới peek segment_start) rồi spool đầy."""
+    spool = AudioSpool(directory, MAX_BYTES, FILE_MAX_BYTES)
+    for seg in range(3):
+        stream_segment(spool, seg)
+    received = []
+    spool.draining = True
+    for _ in range(sent_before):
+        send(spool, received)
+    message, _, record = spool.peek()   # Record đang gửi
+    received.append(message)
+    for seg in range(3, 6):             # Vẫn đang ghi (offline / server chậm) → spool đầy
+        stream_segment(spool, seg)
+    spool.pop(record)
+    drain(spool, received)
+    where = "segment_start" if sent_before == 0 else f"audio #{sent_before}"
+    return check(f"Đầy khi đang gửi {where} của segment 0", received, [0, 3, 4, 5], spool)
+
+
+def full_during_batch_drain(directory: str) -> bool:
+    spool = AudioSpool(directory, 3 * CHUNK_BYTES, FILE_MAX_BYTES)
+    for seg in range(3):
+        spool.append(bytes([seg, 0]) * (CHUNK_BYTES // 2))
+    received = []
+    spool.draining = True
+    message, _, record = spool.peek()
+    received.append(message)
+    spool.append(bytes([3, 0]) * (CHUNK_BYTES // 2))
+    ok_pop = spool.pop(record)
+    drain(spool, received)
+    got = [m[0] for m in received]
+    ok = ok_pop and got == [0, 2, 3]
+    print(f"{'✅' if ok else '❌'} Batch: đầy khi đang gửi audio 0 → nhận {got} (bỏ 1)")
+    return ok
+
+
+def full_offline_and_reload(directory: str) -> bool:
+    spool = AudioSpool(directory, MAX_BYTES, FILE_MAX_BYTES)
+    for seg in range(6):
+        stream_segment(spool, seg)
+    before = spool.get_stats()
+    # Offline đã bỏ segment 0, 1. Đang drain segment 2 → bỏ segment 3 ở giữa index → index.jsonl phải ghi lại đúng
+    received = []
+    spool.draining = True
+    send(spool, received)
+    stream_segment(spool, 6)
+    spool.draining = False
+    reopened = AudioSpool(directory, MAX_BYTES, FILE_MAX_BYTES)
+    same = ([(r['file'], r['offset']) for r in reopened.index[reopened.cursor:]]
+            == [(r['file'], r['offset']) for r in spool.index[spool.cursor:]])
+    drain(reopened, received)
+    files = sorted(f for f in os.listdir(directory) if f.endswith('.bin'))
+    ok = check("Offline đầy + đầy khi drain, mở lại spool", received, [2, 4, 5, 6], reopened)
+    ok = ok and same and not files
+    print(f"{'✅' if same else '❌'} index.jsonl sau khi bỏ segment giữa: mở lại khớp | trước drain {before} "
+          f"| file .bin còn lại {files}")
+    return ok
+
+
+# ============ MAIN ============
+results = []
+for case in (lambda d: full_during_drain(d, 0), lambda d: full_during_drain(d, 1),
+             lambda d: full_during_drain(d, 3), full_during_batch_drain, full_offline_and_reload):
+    with tempfile.TemporaryDirectory() as directory:
+        results.append(case(directory))
+sys.exit(0 if all(results) else 1)
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+TEST TLS RESUME - đo thời gian connect wss:// : handshake đầy đủ vs TLS session resumption
+==========================================================================================
+Chạy mock_server.py (process riêng) với chứng chỉ self-signed RSA 2048 trên localhost, rồi connect
+lại nhiều lần theo 3 cách:
+- context mới mỗi lần:   như trước (websockets tạo ssl.create_default_context() mỗi lần connect)
+- context dùng chung:    tls_session.create_tls_context(resume=False)
+- dùng chung + resume:   tls_session.create_tls_context() (như real_time.py)
+
+In median / p90 thời gian connect (TCP + TLS + WebSocket upgrade) và CPU time phía client mỗi lần.
+Kiểm tra thêm: server ký bởi CA client không tin (CA hệ thống / CA khác) → handshake phải lỗi.
+Mạng thật (4G) còn cộng thêm 1 RTT cho handshake đầy đủ TLS 1.2; ở đây chỉ đo phần CPU + localhost.
+
+Chạy: python3 test_tls_resume.py [số lần connect]     (mặc định 30, cần lệnh openssl)
+"""
+
+import asyncio
+import os
+import socket
+import ssl
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import websockets
+
+import mock_server
+from tls_session import create_tls_context
+
+# ============ CẤU HÌNH ============
+PORT = 8766
+URL = f"wss://localhost:{PORT}{mock_server.WS_ENDPOINT}"
+ROUNDS = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+
+
+def make_certificate(directory: str, name: str = 'mock.pem') -> str:
+    path = os.path.join(directory, name)
+    subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                    '-subj', '/CN=localhost', '-addext', 'subjectAltName=DNS:localhost',
+                    '-keyout', path, '-out', path], check=True, capture_output=True)
+    return path
+
+
+def start_mock(cert: str) -> subprocess.Popen:
+    server = subprocess.Popen([sys.executable, 'mock_server.py', '--host', '127.0.0.1', '--port', str(PORT),
+                               '--tls-cert', cert], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', PORT), timeout=0.2).close()
+            return server
+        except OSError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError("Mock server did not start")
+
+
+async def connect_once(context) -> tuple:
+    """(ms, cpu ms, resumed) của 1 lần connect tới lúc nhận 'connected'."""
+    t0, cpu0 = time.perf_counter(), time.process_time()
+    async with websockets.connect(URL, ssl=context, compression=None) as ws:
+        await ws.recv()
+        elapsed = (time.perf_counter() - t0) * 1000
+        cpu = (time.process_time() - cpu0) * 1000
+        ssl_object = ws.transport.get_extra_info('ssl_object')
+        if hasattr(context, 'remember'):
+            context.remember(ws.transport)
+        return elapsed, cpu, ssl_object.session_reused
+
+
+async def measure(name: str, make_context):
+    shared = make_context() if name != "context mới mỗi lần" else None
+    results = []
+    for _ in range(ROUNDS):
+        results.append(await connect_once(shared or make_context()))
+    results = results[1:]  # Lần đầu luôn là handshake đầy đủ
+    times = sorted(r[0] for r in results)
+    cpu = statistics.median(r[1] for r in results)
+    resumed = sum(r[2] for r in results)
+    print(f"{name:22s} | median {statistics.median(times):6.1f}ms | p90 {times[int(len(times) * 0.9)]:6.1f}ms "
+          f"| CPU {cpu:5.1f}ms | resumed {resumed}/{len(results)}")
+
+
+async def check_untrusted(other_cert: str):
+    """create_tls_context không có CA của server → phải từ chối, không được connect."""
+    for name, context in (("CA hệ thống", create_tls_context()),
+                          ("CA khác", create_tls_context(other_cert)),
+                          ("CA khác, không resume", create_tls_context(other_cert, resume=False))):
+        try:
+            await connect_once(context)
+            print(f"❌ {name}: connect được tới server không tin cậy")
+        except ssl.SSLCertVerificationError as e:
+            print(f"✅ {name}: handshake bị từ chối ({e.verify_message})")
+
+
+def per_connect_context(cert: str):
+    context = ssl.create_default_context()
+    context.load_verify_locations(cert)
+    return context
+
+
+# ============ MAIN ============
+with tempfile.TemporaryDirectory() as tmp:
+    cert = make_certificate(tmp)
+    other_cert = make_certificate(tmp, 'other.pem')
+    server = start_mock(cert)
+    print("=" * 80)
+    print(f"TLS connect x{ROUNDS} → {URL} ({ssl.OPENSSL_VERSION})")
+    print("=" * 80)
+
+    async def main():
+        await measure("context mới mỗi lần", lambda: per_connect_context(cert))
+        await measure("context dùng chung", lambda: create_tls_context(cert, resume=False))
+        await measure("dùng chung + resume", lambda: create_tls_context(cert))
+        await check_untrusted(other_cert)
+
+    try:
+        asyncio.run(main())
+    finally:
+        server.terminate()
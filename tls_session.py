@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+TLS cho wss://: 1 SSLContext dùng chung cho mọi lần (re)connect + nhớ TLS session theo host.
+
+- Không truyền ssl → websockets / asyncio tạo context mới mỗi lần connect (load lại CA bundle)
+- Session (TLS 1.3 ticket / TLS 1.2 session id) của lần trước → lần sau resume:
+  bỏ verify chứng chỉ + trao đổi khoá đầy đủ, đỡ CPU trên Pi Zero và bớt RTT trên 4G
+
+asyncio không có tham số session khi connect → ResumingSSLContext.wrap_bio tự gắn session đã lưu.
+"""
+
+import ssl
+
+
+class ResumingSSLContext(ssl.SSLContext):
+    """SSLContext client nhớ session mới nhất của từng server_hostname."""
+
+    def __new__(cls, *args, **kwargs):
+        # Protocol do SSLContext.__new__ quyết định: luôn là PROTOCOL_TLS_CLIENT (verify chứng chỉ + hostname)
+        return super().__new__(cls, ssl.PROTOCOL_TLS_CLIENT)
+
+    def __init__(self):
+        super().__init__()
+        self.sessions = {}   # server_hostname → ssl.SSLSession
+
+    def wrap_bio(self, incoming, outgoing, server_side=False, server_hostname=None, session=None):
+        if session is None and not server_side:
+            session = self.sessions.get(server_hostname)
+        return super().wrap_bio(incoming, outgoing, server_side=server_side,
+                                server_hostname=server_hostname, session=session)
+
+    def remember(self, transport):
+        """
+        Gọi sau khi đã nhận message đầu tiên (TLS 1.3 gửi ticket sau handshake).
+        Trả True = kết nối này đã resume, False = handshake đầy đủ, None = không phải TLS.
+        """
+        ssl_object = transport.get_extra_info('ssl_object') if transport else None
+        if ssl_object is None:
+            return None
+        session = ssl_object.session
+        if session is not None and (session.has_ticket or ssl_object.version() != 'TLSv1.3'):
+            self.sessions[ssl_object.server_hostname] = session
+        return ssl_object.session_reused
+
+
+def create_tls_context(cafile: str = None, resume: bool = True) -> ssl.SSLContext:
+    """
+    Verify chứng chỉ + hostname như ssl.create_default_context().
+    cafile: chỉ tin CA này (server self-signed), không có → CA hệ thống.
+    """
+    context = ResumingSSLContext() if resume else ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.verify_mode = ssl.CERT_REQUIRED
+    context.check_hostname = True
+    if cafile:
+        context.load_verify_locations(cafile)
+    else:
+        context.load_default_certs()
+    return context
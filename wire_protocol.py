@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Wire protocol cho WebSocket VSL: binary framing có version, thay cho JSON text + raw PCM lẫn lộn.
+
+Mỗi frame = header 16 bytes (little-endian) + body:
+    version u8 | type u8 | body_format u8 | reserved u8 | seq u32 | ts_ms u64
+- type:        mã message (MESSAGE_TYPES), không phải chuỗi 'type' trong JSON
+- body_format: 0 = raw bytes (audio), 1 = msgpack, 2 = CBOR
+- seq:         số thứ tự segment (audio + segment_start/end + result/ack cùng seq → ghép result với audio)
+- ts_ms:       thời điểm gửi (epoch ms) của bên gửi
+
+Thương lượng lúc connect bằng WebSocket subprotocol (không tốn thêm round-trip):
+    client offer:  vsl.v1.msgpack, vsl.v1.cbor   (chỉ những encoding đã cài)
+    server chọn 1 → binary; không chọn gì (server cũ) → JSON như trước.
+
+msgpack / cbor2 là tùy chọn: pip install msgpack (hoặc cbor2).
+"""
+
+import json
+import struct
+import time
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+try:
+    import cbor2
+    CBOR_AVAILABLE = True
+except ImportError:
+    CBOR_AVAILABLE = False
+
+PROTOCOL_VERSION = 1
+HEADER = struct.Struct('<BBBxIQ')
+
+BODY_RAW = 0
+BODY_MSGPACK = 1
+BODY_CBOR = 2
+
+MESSAGE_TYPES = {
+    # Client → server
+    'audio': 0x01,
+    'audio_config': 0x02,
+    'segment_start': 0x03,
+    'segment_end': 0x04,
+    'flush': 0x05,
+    'ping': 0x06,
+    'session': 0x07,
+    'playback': 0x08,
+    # Server → client
+    'connected': 0x40,
+    'buffering': 0x41,
+    'result': 0x42,
+    'filtered': 0x43,
+    'error': 0x44,
+    'pong': 0x45,
+    'ack': 0x46,
+    'resumed': 0x47,
+    'partial': 0x48,
+}
+TYPE_NAMES = {code: name for name, code in MESSAGE_TYPES.items()}
+TYPE_EXTENSION = 0xFF  # Type chưa có mã: giữ chuỗi 'type' trong body
+
+
+class ProtocolError(ValueError):
+    pass
+
+
+# ============ JSON (LEGACY) ============
+class JsonProtocol:
+    """Giao thức cũ: control = JSON text frame, audio = binary frame thô. seq/ts nằm trong JSON nếu có."""
+    name = 'json'
+    subprotocol = None
+
+    def encode(self, message: dict, seq: int = 0):
+        return json.dumps(message)
+
+    def encode_audio(self, payload, seq: int = 0):
+        return payload
+
+    def decode(self, data) -> dict:
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            return {'type': 'audio', 'data': bytes(data)}
+        return json.loads(data)
+
+
+# ============ BINARY ============
+class BinaryProtocol(JsonProtocol):
+    """Header 16 bytes + body msgpack/CBOR. Nhận được cả JSON text (server gửi lỗi trước khi chuyển)."""
+    name = 'binary'
+
+    def __init__(self, body_format: int = BODY_MSGPACK):
+        if body_format == BODY_MSGPACK and not MSGPACK_AVAILABLE:
+            raise ProtocolError("msgpack not installed")
+        if body_format == BODY_CBOR and not CBOR_AVAILABLE:
+            raise ProtocolError("cbor2 not installed")
+        self.body_format = body_format
+        self.subprotocol = SUBPROTOCOLS_BY_FORMAT[body_format]
+        self.name = self.subprotocol
+
+    @staticmethod
+    def _header(type_code: int, body_format: int, seq: int) -> bytes:
+        return HEADER.pack(PROTOCOL_VERSION, type_code, body_format, seq & 0xFFFFFFFF, int(time.time() * 1000))
+
+    def _pack(self, body: dict) -> bytes:
+        if self.body_format == BODY_MSGPACK:
+            return msgpack.packb(body, use_bin_type=True)
+        return cbor2.dumps(body)
+
+    @staticmethod
+    def _unpack(body_format: int, body):
+        if body_format == BODY_MSGPACK:
+            return msgpack.unpackb(body, raw=False)
+        if body_format == BODY_CBOR:
+            return cbor2.loads(body)
+        raise ProtocolError(f"Unknown body format {body_format}")
+
+    def encode(self, message: dict, seq: int = 0) -> bytes:
+        type_code = MESSAGE_TYPES.get(message.get('type'), TYPE_EXTENSION)
+        body = message if type_code == TYPE_EXTENSION else {k: v for k, v in message.items() if k != 'type'}
+        return self._header(type_code, self.body_format, seq) + self._pack(body)
+
+    def encode_audio(self, payload, seq: int = 0) -> bytes:
+        return self._header(MESSAGE_TYPES['audio'], BODY_RAW, seq) + payload
+
+    def decode(self, data) -> dict:
+        """
+        Frame → dict có 'type' như JSON cũ, thêm 'seq' / 'ts_ms' từ header
+        (không ghi đè nếu body đã có). Audio → {'type': 'audio', 'data': bytes}.
+        """
+        if isinstance(data, str):
+            return json.loads(data)
+        if len(data) < HEADER.size:
+            raise ProtocolError(f"Frame too short ({len(data)} bytes)")
+        version, type_code, body_format, seq, ts_ms = HEADER.unpack_from(data)
+        if version != PROTOCOL_VERSION:
+            raise ProtocolError(f"Unsupported protocol version {version}")
+        body = memoryview(data)[HEADER.size:]
+
+        if body_format == BODY_RAW:
+            message = {'type': TYPE_NAMES.get(type_code, 'audio'), 'data': bytes(body)}
+        else:
+            message = self._unpack(body_format, body)
+            if not isinstance(message, dict):
+                raise ProtocolError("Control body is not a map")
+            if type_code != TYPE_EXTENSION:
+                message['type'] = TYPE_NAMES.get(type_code, f'unknown_{type_code}')
+        message.setdefault('seq', seq)
+        message.setdefault('ts_ms', ts_ms)
+        return message
+
+
+# ============ NEGOTIATION ============
+SUBPROTOCOLS_BY_FORMAT = {
+    BODY_MSGPACK: 'vsl.v1.msgpack',
+    BODY_CBOR: 'vsl.v1.cbor',
+}
+FORMATS_BY_SUBPROTOCOL = {name: fmt for fmt, name in SUBPROTOCOLS_BY_FORMAT.items()}
+
+
+def available_subprotocols() -> list:
+    """Subprotocol đề nghị cho server, ưu tiên msgpack (encode/decode nhanh hơn)."""
+    offer = []
+    if MSGPACK_AVAILABLE:
+        offer.append(SUBPROTOCOLS_BY_FORMAT[BODY_MSGPACK])
+    if CBOR_AVAILABLE:
+        offer.append(SUBPROTOCOLS_BY_FORMAT[BODY_CBOR])
+    return offer
+
+
+def create_protocol(subprotocol: str = None) -> JsonProtocol:
+    """Subprotocol server đã chọn (ws.subprotocol) → protocol. None / lạ → JSON."""
+    body_format = FORMATS_BY_SUBPROTOCOL.get(subprotocol)
+    if body_format is None:
+        return JsonProtocol()
+    return BinaryProtocol(body_format)